@@ -28,4 +28,4 @@ fi
 date +"%Y-%m-%d %H:%M:%S" >> $LOG_FILE
 
 cd $PROJECT_ROOT
-$VENV_ROOT/bin/python -m much load -i $DATASET_ROOT/index.tsv -r $DATASET_ROOT/media -p $DATASET_ROOT/threads 1>> $LOG_FILE 2>&1
+$VENV_ROOT/bin/python -m much load -i $DATASET_ROOT/index.tsv -r $DATASET_ROOT/media -p $DATASET_ROOT/threads -s $DATASET_ROOT/posts 1>> $LOG_FILE 2>&1
@@ -0,0 +1,272 @@
+import os
+from enum import Enum
+from json import dumps
+from hashlib import blake2b
+from math import ceil, isnan
+from multiprocessing import Pool
+
+try:
+    from pyarrow import Table, schema, field, int64, string, list_, struct
+    from pyarrow.parquet import ParquetWriter
+except ImportError:
+    ParquetWriter = None
+
+from pandas import DataFrame
+
+from .Fetcher import Topic
+from .Exporter import BUFFER_SIZE, COMPACT_SEPARATORS, TEMPORARY_SUFFIX
+from .ThreadStore import open_thread_store
+
+
+SHARD_SIZE = 256 * 1024 * 1024  # bytes of thread text, a new shard is started when the current one grows larger
+SHARD_NAME = '{run:04d}-{worker:03d}-{shard:05d}.{format}'
+STATE_NAME = 'exported.tsv'  # sizes, versions and index fields of exported threads, which are compared with the current ones to find changed threads
+INDEX_COLUMNS = ('date', 'board', 'title')  # index fields which are exported together with the thread
+ROW_GROUP_SIZE = 1000  # threads
+PARQUET_COMPRESSION = 'zstd'
+
+SCHEMA = None if ParquetWriter is None else schema([
+    field('thread', int64(), nullable = False),
+    field('date', string()),
+    field('board', string()),
+    field('title', string()),
+    field('topics', list_(struct([field('title', string()), field('comments', list_(string()))]))),
+    field('size', int64()),
+    field('n_topics', int64()),
+    field('n_comments', int64())
+])
+
+
+class CorpusFormat(Enum):
+    JSONL = 'jsonl'
+    PARQUET = 'parquet'
+
+
+def parse_topics(text: str):
+    """
+    Splits text of a thread file into topics, which are separated by empty lines and start with their titles.
+    """
+    topics = []
+    lines = []
+
+    for line in text.splitlines():
+        if line:
+            lines.append(line)
+        elif lines:
+            topics.append(Topic(lines[0], tuple(lines[1:])))
+            lines = []
+
+    if lines:
+        topics.append(Topic(lines[0], tuple(lines[1:])))
+
+    return topics
+
+
+def _get_value(row: dict, key: str):
+    if (value := row.get(key)) is None or (isinstance(value, float) and isnan(value)):
+        return None
+
+    return str(value)
+
+
+def get_state(row: dict, size: int, version: int):
+    """
+    Returns the line which describes the exported thread in the state, index fields are hashed since titles may hold tabs and line breaks.
+    """
+    fields = blake2b(dumps([_get_value(row, column) for column in INDEX_COLUMNS], ensure_ascii = False).encode('utf-8'), digest_size = 8)
+
+    return f'{size}\t{version}\t{fields.hexdigest()}'
+
+
+def make_record(row: dict, text: str, size: int):
+    topics = parse_topics(text)
+
+    return {
+        'thread': int(row['thread']),
+        'date': _get_value(row, 'date'),
+        'board': _get_value(row, 'board'),
+        'title': _get_value(row, 'title'),
+        'topics': [{'title': topic.title, 'comments': list(topic.comments)} for topic in topics],
+        'size': size,
+        'n_topics': len(topics),
+        'n_comments': sum(len(topic.comments) for topic in topics)
+    }
+
+
+class ShardWriter:
+    """
+    Writes records of threads to shards in the folder, a new shard is started when the text of threads in the current one exceeds
+    the shard size. Shards are written to temporary files which are renamed when complete, so that readers never see partial shards.
+    """
+
+    def __init__(self, path: str, format: CorpusFormat, run: int, worker: int, shard_size: int = SHARD_SIZE):
+        if format == CorpusFormat.PARQUET and ParquetWriter is None:
+            raise ImportError('pyarrow is required for exporting corpus to parquet')
+
+        self.path = path
+        self.format = format
+        self.run = run
+        self.worker = worker
+        self.shard_size = shard_size
+
+        self.paths = []
+
+        self._file = None
+        self._temporary_path = None
+        self._size = 0
+        self._batch = []
+
+    def _open(self):
+        name = SHARD_NAME.format(run = self.run, worker = self.worker, shard = len(self.paths), format = self.format.value)
+        self._temporary_path = os.path.join(self.path, f'{name}.{os.getpid()}{TEMPORARY_SUFFIX}')
+
+        if self.format == CorpusFormat.JSONL:
+            self._file = open(self._temporary_path, 'w', encoding = 'utf-8', buffering = BUFFER_SIZE)
+        else:
+            self._file = ParquetWriter(self._temporary_path, SCHEMA, compression = PARQUET_COMPRESSION)
+
+    def _flush_batch(self):
+        if self._batch:
+            self._file.write_table(Table.from_pylist(self._batch, schema = SCHEMA))
+            self._batch.clear()
+
+    def _close_shard(self):
+        self._flush_batch()
+        self._file.close()
+
+        path = os.path.join(self.path, SHARD_NAME.format(run = self.run, worker = self.worker, shard = len(self.paths), format = self.format.value))
+        os.replace(self._temporary_path, path)
+
+        self.paths.append(path)
+
+        self._file = self._temporary_path = None
+        self._size = 0
+
+    def write(self, record: dict):
+        if self._file is None:
+            self._open()
+
+        if self.format == CorpusFormat.JSONL:
+            self._file.write(dumps(record, ensure_ascii = False, separators = COMPACT_SEPARATORS))
+            self._file.write('\n')
+        else:
+            self._batch.append(record)
+
+            if len(self._batch) >= ROW_GROUP_SIZE:
+                self._flush_batch()
+
+        if (size := self._size + record['size']) >= self.shard_size:
+            self._close_shard()
+        else:
+            self._size = size
+
+    def close(self):
+        if self._file is not None:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:  # the shard is incomplete, so it is dropped, and its threads are exported again on the next run
+            self._file.close()
+            os.remove(self._temporary_path)
+
+
+def _export_part(rows: list[tuple[dict, str, int, str]], threads: str, path: str, format: CorpusFormat, run: int, worker: int, shard_size: int):
+    exported = []
+
+    with open_thread_store(threads) as store, ShardWriter(path, format, run, worker, shard_size) as writer:
+        for row, folder, size, state in rows:
+            if (text := store.read(thread := int(row['thread']), folder)) is None:
+                continue
+
+            writer.write(make_record(row, text, size))
+            exported.append((thread, state))
+
+    return writer.paths, exported
+
+
+def read_state(path: str):
+    """
+    Returns states of threads which have been exported to the folder, the last state of a thread overrides the previous ones.
+    """
+    states = {}
+
+    if not os.path.isfile(state_path := os.path.join(path, STATE_NAME)):
+        return states
+
+    with open(state_path, 'rb') as file:
+        data = file.read()
+
+    if (end := data.rfind(b'\n') + 1) < len(data):  # the last line has been written partially, so it is dropped
+        data = data[:end]
+
+        with open(state_path, 'r+b') as file:
+            file.truncate(end)
+
+    for line in data.decode('utf-8').splitlines():
+        thread, state = line.split('\t', 1)  # states written by older versions hold sizes only, so such threads are exported again
+        states[int(thread)] = state
+
+    return states
+
+
+def _get_next_run(path: str):
+    runs = [int(name.split('-')[0]) for name in os.listdir(path) if name.endswith(tuple(f'.{format.value}' for format in CorpusFormat))]
+
+    return max(runs, default = -1) + 1
+
+
+def export_corpus(
+    index: DataFrame, threads: str, path: str, format: CorpusFormat = CorpusFormat.JSONL, shard_size: int = SHARD_SIZE, n_workers: int = 1
+):
+    """
+    Exports threads from the index to shards in the folder, each worker writes its own shards. Threads which have been exported before
+    are skipped unless their size, version (see ThreadEntry) or index fields have changed, so later runs append new shards with new
+    and updated threads only. When a thread occurs in several shards, the one with the largest run number, which is the prefix
+    of the shard name, holds the latest version.
+    Returns paths to the written shards and the number of exported threads.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok = True)
+
+    exported = read_state(path)
+    run = _get_next_run(path)
+
+    entries = {}  # thread -> folder -> entry, sizes and versions are known without reading the threads
+
+    with open_thread_store(threads) as store:
+        for entry in store.entries():
+            entries.setdefault(entry.thread, {})[entry.folder] = entry
+
+    rows = {}
+
+    for row in index.to_dict('records'):
+        folders = entries.get(thread := int(row['thread']), {})
+
+        if isinstance(folder := row.get('folder'), str):  # a thread may be kept in several folders, the index tells which copy is current
+            entry = folders.get(folder)
+        else:
+            entry = next(iter(folders.values())) if len(folders) == 1 else None
+
+        if entry is not None and exported.get(thread) != (state := get_state(row, entry.size, entry.version)):
+            rows[thread] = (row, entry.folder, entry.size, state)
+
+    rows = list(rows.values())
+    part_size = max(1, ceil(len(rows) / n_workers))
+    jobs = [(rows[i:i + part_size], threads, path, format, run, worker, shard_size) for worker, i in enumerate(range(0, len(rows), part_size))]
+
+    if n_workers > 1:
+        with Pool(processes = n_workers) as pool:
+            parts = pool.starmap(_export_part, jobs)
+    else:
+        parts = [_export_part(*job) for job in jobs]
+
+    with open(os.path.join(path, STATE_NAME), 'a', encoding = 'utf-8') as file:  # threads are marked as exported after their shards are complete
+        for _, exported in parts:
+            file.writelines(f'{thread}\t{state}\n' for thread, state in exported)
+
+    return [path for paths, _ in parts for path in paths], sum(len(exported) for _, exported in parts)
@@ -0,0 +1,29 @@
+import os
+from contextlib import nullcontext
+
+
+SEPARATOR = '\t'
+
+
+class DeadLetterList:
+    """
+    Text file with items which could not be fetched, one item per line followed by the reason of failure.
+    """
+
+    def __init__(self, path: str, lock = None):
+        self.path = path
+        self.lock = nullcontext() if lock is None else lock
+
+    def append(self, key: str | int, reason: Exception | str):
+        reason = ' '.join(str(reason).split())
+
+        with self.lock:
+            with open(self.path, mode = 'a', encoding = 'utf-8') as file:
+                file.write(f'{key}{SEPARATOR}{reason}\n')
+
+    def read(self):
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, 'r', encoding = 'utf-8') as file:
+            return dict(line[:-1].split(SEPARATOR, maxsplit = 1) for line in file if len(line) > 1)
@@ -1,49 +1,185 @@
 import os
 
 from enum import Enum
-from json import dump
+from json import dumps
 from typing import Iterable
+from dataclasses import dataclass, asdict, fields
 
 from .Fetcher import Topic
 
 
+BUFFER_SIZE = 1024 * 1024  # bytes
+INDENT = 4
+COMPACT_SEPARATORS = (',', ':')
+TEMPORARY_SUFFIX = '.tmp'
+
+
 class Format(Enum):
     JSON = 'json'
     TXT = 'txt'
 
 
+@dataclass(frozen = True)
+class ThreadStats:
+    size: int  # bytes
+    n_topics: int
+    n_comments: int
+    min_post_length: int = None  # shorter comments were dropped when topics were made, None if unknown
+
+    def as_record(self):
+        return asdict(self)
+
+
+STATS_COLUMNS = tuple(field.name for field in fields(ThreadStats))  # columns of the index which are filled when threads are exported
+
+
+def _sync_files(paths: Iterable[str]):
+    """
+    Flushes only the given files, so that files of other processes and other file systems are not flushed with them.
+    """
+    flush = getattr(os, 'fdatasync', os.fsync)  # metadata such as modification time is not needed to recover the file contents
+
+    for path in paths:
+        with open(path, 'rb') as file:
+            flush(file.fileno())
+
+
+def _sync_folder(folder: str):
+    if hasattr(os, 'O_DIRECTORY'):  # renames are flushed with the folder, which can't be opened on windows
+        descriptor = os.open(folder or '.', os.O_RDONLY | os.O_DIRECTORY)
+
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
 class Exporter:
-    def __init__(self):
-        pass
+    def __init__(self, sync: bool = False, group_size: int = 1):
+        """
+        If sync is set, exported files are flushed to disk before they replace the targets, so a crash leaves either the old file or the new one.
+        With group_size > 1 targets are replaced in groups after all files of the group are flushed, and the files of an unfinished group are written
+        when commit is called, or when the exporter is used as a context manager, on exit. Groups are used only with sync.
+        """
+        if group_size > 1 and not sync:
+            raise ValueError('Files are written in groups only when they are flushed to disk, group size requires sync')
+
+        self.sync = sync
+        self.group_size = group_size
 
-    def export(self, topics: Iterable[Topic], format: Format = Format.JSON, path = 'assets/topics.json', force_overwrite: bool = False):
-        if not force_overwrite and len(topics) < 1 and os.path.isfile(path) and os.stat(path).st_size > 0:  # don't overwrite non-empty files
-            print(f'Won\'t overwrite file {path} because it already contains some data, and the topic list is empty')
+        self._pending = {}  # target path -> temporary path
+
+    def commit(self):
+        if not self._pending:
             return
 
-        if format == Format.JSON:
-            data = {
-                'topics': [
-                    {
-                        'title': topic.title,
-                        'comments': topic.comments
-                    }
-                    for topic in topics
-                ]
-            }
-
-            with open(path, 'w', encoding = 'utf-8') as file:
-                dump(data, file, ensure_ascii = False, indent = 4)
-        elif format == Format.TXT:
-            lines = []
-
-            for topic in topics:
-                lines.append(topic.title)
-                for comment in topic.comments:
-                    lines.append(comment)
-                lines.append('')
-
-            with open(path, 'w', encoding = 'utf-8') as file:
-                file.write('\n'.join(lines))
+        _sync_files(self._pending.values())
+
+        for path, temporary_path in self._pending.items():
+            os.replace(temporary_path, path)
+
+        for folder in {os.path.dirname(path) for path in self._pending}:
+            _sync_folder(folder)
+
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+
+    def _write_json(self, topics: Iterable[Topic], file, compact: bool = False):
+        """
+        Writes topics one by one, the output is the same as the one of json.dump applied to the whole list of topics.
+        """
+        n_topics = 0
+        n_comments = 0
+
+        file.write('{"topics":[' if compact else '{\n    "topics": [')
+
+        for topic in topics:
+            item = {'title': topic.title, 'comments': topic.comments}
+
+            if compact:
+                file.write(',' if n_topics > 0 else '')
+                file.write(dumps(item, ensure_ascii = False, separators = COMPACT_SEPARATORS))
+            else:
+                file.write(',\n' if n_topics > 0 else '\n')
+                file.write('\n'.join(' ' * INDENT * 2 + line for line in dumps(item, ensure_ascii = False, indent = INDENT).split('\n')))
+
+            n_topics += 1
+            n_comments += len(topic.comments)
+
+        if compact:
+            file.write(']}')
         else:
+            file.write('\n    ]\n}' if n_topics > 0 else ']\n}')
+
+        return n_topics, n_comments
+
+    def _write_txt(self, topics: Iterable[Topic], file):
+        n_topics = 0
+        n_comments = 0
+
+        for topic in topics:
+            if n_topics > 0:
+                file.write('\n')
+
+            file.write(f'{topic.title}\n')
+
+            for comment in topic.comments:
+                file.write(f'{comment}\n')
+
+            n_topics += 1
+            n_comments += len(topic.comments)
+
+        return n_topics, n_comments
+
+    def export(
+        self, topics: Iterable[Topic], format: Format = Format.JSON, path = 'assets/topics.json', force_overwrite: bool = False, compact: bool = False
+    ):
+        """
+        Writes topics as they are produced, so they can be generated lazily. The output goes to a temporary file next to the target,
+        which replaces the target when all topics are written, unless no topics were produced and the target already contains some data.
+        If compact is set, json is written without indentation. Returns size of the written file in bytes with numbers of topics and comments
+        and the minimum post length of the topics if they carry it, or None if the target is kept.
+        """
+        if format not in (Format.JSON, Format.TXT):
             raise ValueError(f'Unknown format: {format}')
+
+        temporary_path = f'{path}.{os.getpid()}{TEMPORARY_SUFFIX}'  # same folder as the target, so that it can be replaced atomically
+        group = self.sync and self.group_size > 1
+
+        try:
+            with open(temporary_path, 'w', encoding = 'utf-8', buffering = BUFFER_SIZE) as file:
+                if format == Format.JSON:
+                    n_topics, n_comments = self._write_json(topics, file, compact)
+                else:
+                    n_topics, n_comments = self._write_txt(topics, file)
+
+                file.flush()
+                size = file.buffer.tell()
+
+                if self.sync and not group:
+                    os.fsync(file.fileno())
+
+            if n_topics < 1 and not force_overwrite and os.path.isfile(path) and os.stat(path).st_size > 0:  # don't overwrite non-empty files
+                print(f'Won\'t overwrite file {path} because it already contains some data, and the topic list is empty')
+                return None
+
+            if group:
+                self._pending[path] = temporary_path
+
+                if len(self._pending) >= self.group_size:
+                    self.commit()
+            else:
+                os.replace(temporary_path, path)
+
+                if self.sync:
+                    _sync_folder(os.path.dirname(path))
+        finally:
+            if temporary_path not in self._pending.values() and os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+
+        return ThreadStats(size, n_topics, n_comments, getattr(topics, 'min_post_length', None))  # known for topics made by Fetcher.group
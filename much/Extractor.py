@@ -0,0 +1,132 @@
+from dataclasses import dataclass, field
+
+from bs4 import BeautifulSoup, Tag
+
+from .Post import PostRecord, parse_mention, parse_post_id
+from .util import SPACE
+
+
+OPPOST_CLASSES = frozenset(('post', 'oppost'))
+REPLY_CLASSES = frozenset(('post', 'reply'))
+POST_CLASSES = OPPOST_CLASSES | REPLY_CLASSES
+
+
+@dataclass(frozen = True)
+class SiteProfile:
+    name: str
+    bodies: tuple[tuple[str, str]]  # (tag, class) pairs in the order of priority, class is None if any tag with such name is accepted
+    key_attribute: str = None
+
+    def match_bodies(self, name: str, classes: list[str]):
+        for i, (body_name, class_) in enumerate(self.bodies):
+            if body_name == name and (class_ is None or class_ in classes):
+                yield i
+
+
+TWOCH = SiteProfile('2ch', (('blockquote', None), ('article', None)))
+ARHIVACH = SiteProfile('arhivach', (('div', 'post_comment_body'), ), key_attribute = 'postid')
+GENERIC = SiteProfile('generic', (('blockquote', None), ('article', None), ('div', 'post_comment_body')), key_attribute = 'postid')
+
+
+def detect_profile(post: Tag | dict):
+    if post.get(ARHIVACH.key_attribute) is not None:
+        return ARHIVACH
+    if post.get('data-num') is not None or post.get('id', '').startswith('post-'):
+        return TWOCH
+    return GENERIC
+
+
+@dataclass
+class _OpenPost:
+    html: Tag | dict  # tag or its attributes
+    index: int
+    classes: frozenset
+    bodies: dict = field(default_factory = dict)  # priority -> body tag
+    texts: dict = field(default_factory = dict)  # priority -> list of strings
+    collecting: dict = field(default_factory = dict)  # body tag id -> priority
+    mentions: list = field(default_factory = list)
+
+    def make_record(self, profile: SiteProfile):
+        priority = min(self.bodies, default = None)
+
+        return PostRecord(
+            key = None if profile.key_attribute is None else parse_post_id(self.html.get(profile.key_attribute)),
+            body = None if priority is None else self.bodies[priority],
+            text = None if priority is None else SPACE.join(self.texts[priority]),
+            mentions = self.mentions,
+            is_oppost = not self.classes.isdisjoint(OPPOST_CLASSES),
+            is_reply = not self.classes.isdisjoint(REPLY_CLASSES)
+        )
+
+
+class Extractor:
+    """
+    Walks the document once and collects for each post its body text and ids of mentioned posts.
+    Selectors are taken from the site profile, which is detected by the first post on the page.
+    """
+
+    def __init__(self, profile: SiteProfile = None):
+        self.profile = profile
+
+    def extract(self, soup: BeautifulSoup):
+        profile = self.profile
+
+        open_posts = []
+        finished = {}
+        n_posts = 0
+        n_yielded = 0
+
+        stack = [(soup, iter(soup.contents))]
+
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+
+            if child is None:  # leaving the node
+                stack.pop()
+
+                if open_posts:
+                    for post in open_posts:
+                        post.collecting.pop(id(node), None)
+
+                    if open_posts[-1].html is node:
+                        post = open_posts.pop()
+                        finished[post.index] = post.make_record(profile)
+
+                        if not open_posts:  # posts are emitted in the document order even if they are nested
+                            while n_yielded in finished:
+                                yield finished.pop(n_yielded)
+                                n_yielded += 1
+
+                continue
+
+            if not isinstance(child, Tag):
+                for post in open_posts:
+                    for priority in post.collecting.values():
+                        if type(child) in post.bodies[priority].interesting_string_types:
+                            post.texts[priority].append(child)
+                continue
+
+            stack.append((child, iter(child.contents)))
+
+            if open_posts:
+                if child.name == 'a':
+                    mention = parse_mention(child)
+
+                    if mention is not None:
+                        for post in open_posts:
+                            post.mentions.append(mention)
+
+                for priority in profile.match_bodies(child.name, child.get_attribute_list('class')):
+                    for post in open_posts:
+                        if priority not in post.bodies:
+                            post.bodies[priority] = child
+                            post.texts[priority] = []
+                            post.collecting[id(child)] = priority
+
+            if child.name == 'div' and not (classes := frozenset(child.get_attribute_list('class'))).isdisjoint(POST_CLASSES):
+                if profile is None:
+                    profile = detect_profile(child)
+
+                open_posts.append(_OpenPost(child, n_posts, classes))
+                n_posts += 1
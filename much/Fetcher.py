@@ -1,19 +1,42 @@
+import re
 from traceback import print_exc
 
-from requests import get
-from requests.exceptions import SSLError, ConnectionError, ChunkedEncodingError, ReadTimeout
+from requests import Session
 from dataclasses import dataclass
-from time import sleep
-
-from bs4 import BeautifulSoup
-from numpy import percentile
-
-from .Post import Post, MissingPostIdException
+from time import monotonic
+from json import load, loads
+from codecs import getincrementaldecoder
+from functools import partial, lru_cache
+from itertools import chain
+from typing import Iterable
+from asyncio import Queue, get_running_loop, create_task, gather, sleep as sleep_async, TimeoutError as AsyncTimeoutError
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from aiohttp import ClientSession, ClientError, ClientTimeout, TCPConnector
+except ImportError:
+    ClientSession = None
+
+from .Post import Post, PostRecord, MissingPostIdException, parse_body_id
+from .ParserBackend import ParserBackend
+from .Extractor import Extractor, POST_CLASSES
+from .StreamingExtractor import StreamingExtractor
+from .SpillBuffer import SpillBuffer, MEMORY_BUDGET
+from .session import get_session, get_encoding, DEFAULT_ENCODING
+from .RetryPolicy import RetryPolicy, TransientError, RetriesExhaustedError
+from .DeadLetterList import DeadLetterList
+from .PageCache import PageCache
+from .ReplyGraph import ReplyGraph
 from .util import pure_spaces, normalize, make_ordinal
 
 
 POST_SIZE_PERCENTILE = 15
 SSL_ERROR_DELAY = 1  # seconds
+TIMEOUT = 60  # seconds
+N_REQUESTS = 256
+N_REQUESTS_PER_HOST = 32
+CHUNK_SIZE = 64 * 1024  # characters or bytes read at once in the streaming mode
+MIN_SPLIT_SIZE = 256 * 1024  # bytes or characters of the page per worker, smaller pages are parsed in one process
 
 # BLOCKED_KEYWORD = (
 #     '<h3>Заблокировано по требованию Роскомнадзора.<br><p style="font-size:50%">'
@@ -24,6 +47,94 @@ BLOCKED_KEYWORD_2 = '<h3>Заблокировано по жалобам трет
 BLOCKED_KEYWORD_3 = '<h3>Заблокировано по жалобам третьих лиц.</h3>'
 TOO_LARGE = '<h3>Тред слишком большой для отображения на одной странице.<br>Мы работает над решением.'
 
+SKIP_KEYWORDS = {  # keyword -> reason why the thread is permanently unavailable
+    '<h3>Здесь ничего нет.</h3>': 'not found',
+    '<span class="nf__nf">404</span>': 'not found',
+    BLOCKED_KEYWORD: 'blocked',
+    '<h3>Тред скрыт. Скорее всего, он содержит нежелательный контент.</h3>': 'hidden',
+    '<i class="icon-refresh icon-white"></i>': 'not archived',
+    BLOCKED_KEYWORD_2: 'blocked',
+    BLOCKED_KEYWORD_3: 'blocked',
+    TOO_LARGE: 'too large'
+}
+SKIP_REASONS = tuple(SKIP_KEYWORDS.values())
+SKIP_TEMPLATE = re.compile('|'.join(f'(?P<k{i}>{re.escape(keyword)})' for i, keyword in enumerate(SKIP_KEYWORDS)))
+MAX_KEYWORD_LENGTH = max(len(keyword) for keyword in SKIP_KEYWORDS)
+PREVIEW_LENGTH = 100
+PREVIEW_SOURCE_LENGTH = 4096  # bytes or characters of the page from which the preview is made
+
+
+POST_START_TEMPLATE = re.compile(
+    r'<div\s[^>]*?\bclass\s*=\s*["\']?(?:[^"\'>]*?\s)?(?:' + '|'.join(sorted(POST_CLASSES)) + r')[\s"\'>]', re.IGNORECASE
+)
+POST_START_BYTES_TEMPLATE = re.compile(POST_START_TEMPLATE.pattern.encode('ascii'), re.IGNORECASE)
+
+
+def split_page(page: str | bytes, n_parts: int):
+    """
+    Splits the page into at most n_parts parts at the starts of posts, so that each part contains about the same number of posts.
+    The first part includes everything before the posts and the last one everything after them.
+    """
+    template = POST_START_TEMPLATE if isinstance(page, str) else POST_START_BYTES_TEMPLATE
+    starts = [match.start() for match in template.finditer(page)]
+
+    if len(starts) < 2 or n_parts < 2:
+        return [page]
+
+    bounds = sorted({starts[len(starts) * i // n_parts] for i in range(1, n_parts)} - {starts[0]})
+
+    return [page[start:end] for start, end in zip([0, *bounds], [*bounds, len(page)])]
+
+
+def _extract_part(parser: ParserBackend, part: str | bytes, encoding: str = DEFAULT_ENCODING):
+    """
+    Makes post records from a part of the page in a worker process. Document trees are not sent back, so post keys are taken from
+    post bodies here, and posts without parsable keys lose their text, which makes them skipped the same way as in the main process.
+    """
+    records = list(Extractor().extract(parser.parse(part, encoding)))
+
+    for record in records:
+        if record.key is None:
+            try:
+                record.key = parse_body_id(record.body)
+            except MissingPostIdException:
+                record.text = None
+
+        record.body = None
+
+    return records
+
+
+@lru_cache
+def _make_skip_template(encoding: str):
+    return re.compile(SKIP_TEMPLATE.pattern.encode(encoding))
+
+
+def classify(page: str | bytes, encoding: str = DEFAULT_ENCODING):
+    """
+    Returns the reason why the page is permanently unavailable or None if it doesn't look like one, scanning the page only once.
+    Raw pages are scanned without decoding.
+    """
+    if isinstance(page, str):
+        template = SKIP_TEMPLATE
+    else:
+        try:
+            template = _make_skip_template(encoding)
+        except UnicodeEncodeError:  # keywords can't appear in a page with such encoding
+            return None
+
+    if (match := template.search(page)) is None:
+        return None
+
+    return SKIP_REASONS[int(match.lastgroup[1:])]
+
+
+def _preview(page: str | bytes, encoding: str = DEFAULT_ENCODING):
+    if not isinstance(page, str):
+        page = page[:PREVIEW_SOURCE_LENGTH].decode(encoding, errors = 'ignore')
+
+    return normalize(page[:PREVIEW_SOURCE_LENGTH])[:PREVIEW_LENGTH]
+
 
 @dataclass
 class Topic:
@@ -41,181 +152,381 @@ class Topic:
         return None
 
 
+class Topics(list):
+    """
+    Topics of a thread with the length of posts below which comments were dropped, which is None if the thread has no posts.
+    """
+
+    def __init__(self, topics: Iterable[Topic] = (), min_post_length: int = None):
+        super().__init__(topics)
+        self.min_post_length = min_post_length
+
+
 class Fetcher:
-    def __init__(self):
-        pass
+    def __init__(
+        self, parser: ParserBackend = None, session: Session = None, retry_policy: RetryPolicy = None, cache: PageCache = None, n_workers: int = None
+    ):
+        """
+        If n_workers is set, large html pages are split at post boundaries, and the parts are parsed in a pool of n_workers processes.
+        """
+        self.parser = ParserBackend.make() if parser is None else parser
+        self.extractor = Extractor()
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.cache = cache
+        self.n_workers = n_workers
+        self._session = session
+        self._executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None  # the pool stays in the process which created it
+
+        return state
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        return get_session() if self._session is None else self._session
 
     def fetch(self, url: str, verbose: bool = False):
+        """
+        Pulls the page and makes topics from it. Pulled pages are written to the cache, but never read from it, since threads change
+        while they are open, and cached pages are parsed again by the reparse command only.
+        """
         if verbose:
             print(f'Pulling data from {url}...')
 
-        id_to_post = {}
-        ids = set()
+        if url.endswith('json'):
+            records = self._pull_json(url)
+        else:
+            records = self._pull_html(url)
+
+        return self.group(records, url)
+
+    def _add(self, graph: ReplyGraph, record: PostRecord, url: str = None):
+        try:
+            mentions, post = Post.from_record(record)
+        except MissingPostIdException:
+            return
+        except Exception:
+            print(f'Can\'t handle post {url}')
+            raise
+
+        if post is None or pure_spaces(post.text):
+            return
+
+        graph.add(post.id, post.text, mentions)
+
+    def _get_min_post_length(self, graph: ReplyGraph):
+        if len(graph) < 1:
+            return None
+
+        return int(graph.percentile(POST_SIZE_PERCENTILE))
+
+    def _make_topics(self, graph: ReplyGraph, min_post_length: int):
+        if min_post_length is None:
+            return
+
+        texts = graph.texts
+        sizes = graph.sizes
+
+        for post, comments in graph.group(min_post_length):
+            yield Topic(
+                title = texts[post],
+                comments = tuple(texts[comment] for comment in comments if sizes[comment] >= min_post_length)
+            )
+
+    def group(self, records: Iterable[PostRecord], url: str = None):
+        graph = ReplyGraph()
+
+        for record in records:
+            self._add(graph, record, url)
+
+        min_post_length = self._get_min_post_length(graph)
+
+        return Topics(self._make_topics(graph, min_post_length), min_post_length)
+
+    def stream(self, url: str, memory_budget: int = MEMORY_BUDGET, chunk_size: int = CHUNK_SIZE):
+        """
+        Pulls the page in chunks and makes post records as soon as the posts end, without keeping the page or its document tree in memory.
+        Post texts are kept in memory until their size exceeds memory_budget bytes, after which they are written to a temporary file.
+        Returns iterator over the same topics as the ones returned by fetch with the html.parser backend, and the topics are read from the
+        temporary file lazily.
+        """
+        if not url.startswith('http'):
+            with open(url, 'r', encoding = 'utf-8') as file:
+                graph = self._stream_graph(iter(partial(file.read, chunk_size), ''), url, memory_budget)
+        else:
+            def pull():
+                with self.session.get(url, timeout = TIMEOUT, stream = True) as response:
+                    decoder = getincrementaldecoder(get_encoding(response.headers.get('content-type')))(errors = 'replace')
+                    chunks = chain((decoder.decode(chunk) for chunk in response.iter_content(chunk_size)), (decoder.decode(b'', final = True), ))
+
+                    return self._stream_graph(chunks, url, memory_budget)
+
+            graph = self.retry_policy.run(pull, url)
+
+        def iterate():
+            with graph.texts:
+                yield from self._make_topics(graph, self._get_min_post_length(graph))
+
+        return iterate()
+
+    def _stream_graph(self, chunks: Iterable[str], url: str, memory_budget: int):
+        extractor = StreamingExtractor()
+        graph = ReplyGraph(SpillBuffer(memory_budget))
+
+        oppost = None
+        replies = []  # replies which precede the original post
+        has_keyword = False
+        tail = ''
 
-        post_sizes = []
-        min_post_length = 0  # later this value is inferred using percentile defined above
+        def append(records: Iterable[PostRecord]):
+            nonlocal oppost
 
-        def append_post(post):
-            if post is None:
-                # print(f'Post is none for url {url}')
+            for record in records:
+                if oppost is None:
+                    if record.is_oppost:
+                        self._add(graph, oppost := record, url)
+
+                        for reply in replies:
+                            self._add(graph, reply, url)
+
+                        replies.clear()
+                    elif record.is_reply:
+                        replies.append(record)
+                        continue
+
+                if record.is_reply:
+                    self._add(graph, record, url)
+
+            records.clear()
+
+        try:
+            for chunk in chunks:
+                if not has_keyword:
+                    text = tail + chunk  # keywords may be split between chunks
+                    has_keyword = SKIP_TEMPLATE.search(text) is not None
+                    tail = text[-MAX_KEYWORD_LENGTH:]
+
+                extractor.feed(chunk)
+                append(extractor.records)
+
+            extractor.close()
+            append(extractor.records)
+
+            if oppost is None:
+                if not has_keyword:
+                    raise TransientError(f"Can't find oppost in {url}")
+
+                print(f"🔵 Can't find oppost in {url}. Skipping...")
+
+                for reply in replies:
+                    self._add(graph, reply, url)
+        except BaseException:
+            graph.texts.close()
+            raise
+
+        return graph
+
+    def _pull_html(self, url: str):
+        if not url.startswith('http'):
+            with open(url, 'rb') as file:
+                return self._parse_html(file.read())
+
+        def pull():
+            response = self.session.get(url, timeout = TIMEOUT)
+            records = self._parse_html(page := response.content, encoding := get_encoding(response.headers.get('content-type')))
+
+            self._cache(url, page, encoding)
+
+            return records
+
+        return self.retry_policy.run(pull, url)
+
+    def _cache(self, url: str, page: bytes, encoding: str = DEFAULT_ENCODING):
+        if self.cache is not None:
+            self.cache.put(url, page if encoding == DEFAULT_ENCODING else page.decode(encoding, errors = 'replace'))
+
+    def _parse_html(self, page: str | bytes, encoding: str = DEFAULT_ENCODING):
+        """
+        Returns post records with the original post at the first position. If the original post is missing, the page is either classified as
+        permanently unavailable (deleted, blocked or too large), in which case the remaining records are returned, or TransientError is raised.
+        Raw pages are parsed without decoding them separately.
+        """
+        records = self._extract(page, encoding)
+        replies = [record for record in records if record.is_reply]
+
+        if (oppost := next((record for record in records if record.is_oppost), None)) is None:
+            if (reason := classify(page, encoding)) is not None:
+                print(f"🔵 Can't find oppost in '{_preview(page, encoding)}' ({reason}). Skipping...")
+                return replies
+
+            raise TransientError(f"Can't find oppost in '{_preview(page, encoding)}'")
+
+        return [oppost, *replies]
+
+    def _extract(self, page: str | bytes, encoding: str = DEFAULT_ENCODING):
+        if self.n_workers is None or len(parts := split_page(page, min(self.n_workers, len(page) // MIN_SPLIT_SIZE))) < 2:
+            return tuple(self.extractor.extract(self.parser.parse(page, encoding)))
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.n_workers)
+
+        return tuple(chain.from_iterable(self._executor.map(partial(_extract_part, self.parser, encoding = encoding), parts)))
+
+    def _pull_json_document(self, url: str, cache: bool = True):
+        def pull():
+            response = self.session.get(url, timeout = TIMEOUT)
+
+            if response.status_code == 404:
                 return None
 
-            try:
-                mentions, post = Post.from_html(post)
-            except MissingPostIdException:
-                return False
-            except Exception:
-                print(f'Can\'t handle post {url}')
-                raise
+            if response.status_code != 200:
+                raise TransientError(f'Unexpected status code {response.status_code}')
 
-            if post is None or pure_spaces(post.text):
-                return False
+            document = loads(page := response.content)  # json is always utf, so the encoding is detected by the json module
 
-            post_sizes.append(post.size)
+            if cache:
+                self._cache(url, page)
 
-            ids.add(post.id)
+            return document
 
-            id_to_post[post.id] = post
+        return self.retry_policy.run(pull, url)
 
-            if mentions is not None:
-                for mention in mentions:
-                    if mention in id_to_post:
-                        id_to_post[mention].append(post)
-                    # else:
-                    #     print(f'No mention {mention}')
+    def pull_posts(self, url: str):
+        """
+        Returns raw posts of the thread in json format or None if the thread does not exist.
+        """
+        if url.startswith('http'):
+            if (thread := self._pull_json_document(url)) is None:
+                return None
+        else:
+            with open(url, 'r', encoding = 'utf-8') as file:
+                thread = load(file)
 
-            return True
+        return [post for item in thread['threads'] for post in item['posts']]
 
-        def append_mentions(post: Post, comments: list, depth: int = 1):
-            for mention in post.mentions:
-                if mention.id in ids:
-                    ids.remove(mention.id)
-                    # comments.append('>' * depth + ' ' + mention.text)
-                    comments.append(mention)
-                    append_mentions(mention, comments = comments, depth = depth + 1)
+    def pull_posts_after(self, url: str):
+        """
+        Returns raw posts from an endpoint which lists posts of the thread starting from the given number, or None if the endpoint
+        can't list them. Such responses are not cached, since they contain a part of the thread only.
+        """
+        if (response := self._pull_json_document(url, cache = False)) is None:
+            return None
 
-        if url.endswith('json'):
-            raise ValueError('JSON links are not supported')
+        return response.get('posts')
 
-        response = None
+    def _pull_json(self, url: str):
+        if (posts := self.pull_posts(url)) is None:
+            print(f"🔵 Thread {url} does not exist. Skipping...")
+            return []
 
-        i = 0
+        return [PostRecord.from_json(post) for post in posts]
 
-        while response is None or (response is not True and (response.status_code != 200 or (len(response.text) < 1))):
-            i += 1
+    def parse(self, url: str, page: str | bytes, encoding: str = DEFAULT_ENCODING):
+        """
+        Makes topics from the page content without pulling it, the url is only used to infer the page format.
+        """
+        if url.endswith('json'):
+            records = [PostRecord.from_json(post) for item in loads(page)['threads'] for post in item['posts']]
+        else:
+            records = self._parse_html(page, encoding)
+
+        return self.group(records, url)
+
+    async def fetch_many(
+        self, urls: Iterable[str], n_requests: int = N_REQUESTS, n_requests_per_host: int = N_REQUESTS_PER_HOST, n_workers: int = None, timeout: int = TIMEOUT,
+        dead_letters: DeadLetterList = None
+    ):
+        """
+        Downloads pages concurrently over pooled connections, keeping at most n_requests requests in flight and at most n_requests_per_host
+        requests to the same host. Downloaded pages are parsed in a process pool as soon as they arrive, and (url, topics) pairs are yielded
+        in the order in which parsing completes. Urls which can't be fetched within the retry policy limits or can't be parsed are skipped
+        and added to dead_letters.
+        """
+        if ClientSession is None:
+            raise ImportError('aiohttp is required for pulling multiple threads concurrently')
+
+        loop = get_running_loop()
+        urls = iter(urls)
+        results = Queue()
+
+        async def pull(session: ClientSession, executor: ProcessPoolExecutor, url: str):
+            policy = self.retry_policy
+            start = monotonic()
+            attempt = 0
+
+            while True:
+                attempt += 1
 
-            if url.startswith('http'):
                 try:
-                    response = get(url, timeout = 60)
-                except SSLError:
-                    print(f'Encountered SSLError when fetching {url}. Waiting for {SSL_ERROR_DELAY} seconds before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print(f'Retrying to fetch {url}...')
-                    continue
-                except ConnectionError:
-                    print(f'Encountered ConnectionError when fetching url {url}. Waiting for {SSL_ERROR_DELAY} seconds before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print(f'Retrying to fetch url {url}')
-                    continue
-                except ChunkedEncodingError:
-                    print(f'Encountered ChunkedEncodingError when fetching url {url}. Waiting for {SSL_ERROR_DELAY} seconds before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print(f'Retrying to fetch url {url}')
-                    continue
-                except ReadTimeout:
-                    print(f'Encountered ReadTimeout when fetching url {url}. Waiting for {SSL_ERROR_DELAY} seconds before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print(f'Retrying to fetch url {url}')
-                    continue
-
-                if response is None:
-                    print(f'Got none response when fetching url {url}. Waiting for {SSL_ERROR_DELAY} seconds before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print(f'Retrying to fetch url {url}')
-                    continue
-
-                page = response.text
-            else:
-                with open(url, 'r', encoding = 'utf-8') as file:
-                    page = file.read()
-                    response = True
-
-            soup = BeautifulSoup(page, features = 'html.parser')
-
-            if append_post(soup.find('div', {'class': ('post', 'oppost')})) is None:
-                response = None
-
-                found_keyword = False
-                for keyword in (
-                    '<h3>Здесь ничего нет.</h3>',
-                    '<span class="nf__nf">404</span>',
-                    BLOCKED_KEYWORD,
-                    '<h3>Тред скрыт. Скорее всего, он содержит нежелательный контент.</h3>', '<i class="icon-refresh icon-white"></i>',
-                    BLOCKED_KEYWORD_2,
-                    BLOCKED_KEYWORD_3,
-                    TOO_LARGE
-                ):
-                    # if keyword == BLOCKED_KEYWORD:
-                    #     print(BLOCKED_KEYWORD)
-                    #     print(page)
-                    if keyword in page:
-                        # print(f'Skipping because the page contains {keyword}')
-                        found_keyword = True
-                        break
-
-                if found_keyword:
-                    print(f"🔵 Can't find oppost in '{normalize(page)[:100]}'. Skipping...")
-                    break
-
-                print(f"🔴 Can't find oppost in '{normalize(page)[:100]}'. Waiting for {SSL_ERROR_DELAY} seconds before retrying...")
-                sleep(SSL_ERROR_DELAY)
-                print(f'🟡 Retrying ({make_ordinal(i + 1)} attempt to fetch {url})...')
-
-        for post in soup.find_all('div', {'class': ('post', 'reply')}):
-            append_post(post)
-
-        min_post_length = 0 if len(post_sizes) < 1 else int(percentile(post_sizes, POST_SIZE_PERCENTILE))
-
-        topics = []
-
-        for post in sorted(id_to_post.values(), key = lambda post: (post.length, -post.n_parents, len(post.text)), reverse = True):
-
-            if post.id in ids and post.size >= min_post_length:
-
-                # print(post.length, post.text, post.n_parents)
-
-                # if post.id == 52234659:
-                #     print(post.short_description)
-
-                #     for mention in post.mentions:
-                #         print(mention.short_description)
-
-                comments = []
-
-                append_mentions(post, comments = comments)
-
-                # for mention in post.mentions:
-                #     if mention.id in ids:
-                #         ids.remove(mention.id)
-                #         comments.append(mention.text)
-
-                #         for mention in mention.mentions:
-                #             if mention.id in ids:
-                #                 ids.remove(mention.id)
-                #                 comments.append(mention.text)
-
-                topics.append(
-                    Topic(
-                        title = post.text,
-                        comments = tuple(comment.text for comment in comments if comment.size >= min_post_length)
-                    )
-                )
-
-                if post.id in ids:  # might have been removed in append_mentions?
-                    ids.remove(post.id)
-
-            if len(ids) < 1:
-                break
-
-        return topics
-        # print(len(ids))
+                    async with session.get(url) as response:
+                        if response.status == 404 and url.endswith('json'):
+                            print(f"🔵 Thread {url} does not exist. Skipping...")
+                            return []
+
+                        page = await response.read()
+                        encoding = get_encoding(response.headers.get('Content-Type'))
+
+                    topics = await loop.run_in_executor(executor, self.parse, url, page, encoding)
+
+                    self._cache(url, page, encoding)  # the page is cached for reparse only, the next pull downloads it again
+
+                    return topics
+                except (ClientError, AsyncTimeoutError, TransientError) as e:
+                    error = e
+
+                delay = policy.delay(attempt)
+
+                if policy.is_exhausted(attempt, start, delay):
+                    raise RetriesExhaustedError(url, attempt, error) from error
+
+                print(f'🔴 Encountered {type(error).__name__} when fetching {url}: {error}. Waiting for {delay:.1f} seconds before retrying...')
+                await sleep_async(delay)
+                print(f'🟡 Retrying ({make_ordinal(attempt + 1)} attempt to fetch {url})...')
+
+        async def work(session: ClientSession, executor: ProcessPoolExecutor):
+            try:
+                for url in urls:
+                    try:
+                        topics = await pull(session, executor, url)
+                    except RetriesExhaustedError as e:
+                        print(f'⚫ {e}')
+                        error = e.error
+                    except Exception as e:  # the page was pulled but can't be parsed, which won't change on retry
+                        error = f'{type(e).__name__}: {e}'
+                        print(f'⚫ Failed to parse {url}: {error}')
+                    else:
+                        await results.put((url, topics))
+                        continue
+
+                    if dead_letters is not None:
+                        dead_letters.append(url, error)
+            finally:
+                await results.put(None)
+
+        with ProcessPoolExecutor(n_workers) as executor:
+            connector = TCPConnector(limit = n_requests, limit_per_host = n_requests_per_host)
+
+            async with ClientSession(connector = connector, timeout = ClientTimeout(total = timeout)) as session:
+                workers = [create_task(work(session, executor)) for _ in range(n_requests)]
+                n_running = len(workers)
+
+                while n_running > 0:
+                    if (result := await results.get()) is None:
+                        n_running -= 1
+                    else:
+                        yield result
+
+                await gather(*workers)
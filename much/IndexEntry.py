@@ -1,17 +1,27 @@
+from array import array
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from numpy import frombuffer, unique, int64, iinfo
+from pandas import DataFrame, Series, to_datetime
 
 
 TIMESTAMP_FORMAT = '%d-%m-%Y'
+COLUMNS = ('thread', 'date', 'title', 'folder', 'open', 'board')
+RECORD_COLUMNS = ('thread', 'date', 'title', 'folder', 'open')  # columns written by IndexEntry.as_record
+MISSING_TIMESTAMP = iinfo(int64).min  # same as NaT
+EPOCH = datetime(1970, 1, 1)
 
 
-@dataclass
+@dataclass(slots = True)
 class IndexEntry:
     thread_id: int
     timestamp: datetime
     title: str
     folder: str = None
     is_open: str = False
+    board: str = None
+    extra: dict = None  # other columns of the index row
 
     @classmethod
     def from_json(cls, json: dict):
@@ -19,10 +29,12 @@ class IndexEntry:
 
         return cls(
             thread_id = json.get('thread'),
-            timestamp = None if date_as_string is None else datetime.strptime(date_as_string, TIMESTAMP_FORMAT),
+            timestamp = datetime.strptime(date_as_string, TIMESTAMP_FORMAT) if isinstance(date_as_string, str) else None,
             title = json.get('title'),
             folder = json.get('folder'),
-            is_open = json.get('open', False)
+            is_open = json.get('open', False),
+            board = json.get('board'),
+            extra = {key: value for key, value in json.items() if key not in COLUMNS} or None
         )
 
     def as_record(self):
@@ -33,3 +45,136 @@ class IndexEntry:
             'folder': self.folder,
             'open': self.is_open
         }
+
+    def as_row(self):
+        """
+        Same as as_record, but keeps all columns of the index row, and allows entries without date.
+        """
+        return {
+            'thread': self.thread_id,
+            'date': None if self.timestamp is None else self.timestamp.strftime(TIMESTAMP_FORMAT),
+            'title': self.title,
+            'folder': self.folder,
+            'open': self.is_open,
+            'board': self.board,
+            **(self.extra or {})
+        }
+
+
+class IndexEntries:
+    """
+    Sequence of index entries kept column by column: thread ids and timestamps (seconds) in arrays, other fields in lists. Entries are
+    converted from and to data frames with vectorized operations, and IndexEntry objects are made only for the items which are accessed.
+    Columns other than the ones written by IndexEntry.as_record, such as board and thread statistics, are kept in lists by name.
+    """
+
+    def __init__(self):
+        self.thread_ids = array('q')
+        self.timestamps = array('q')
+        self.titles = []
+        self.folders = []
+        self.is_open = []
+        self.columns = {}  # name -> values of the other columns
+
+    @classmethod
+    def from_frame(cls, df: DataFrame):
+        entries = cls()
+
+        timestamps = to_datetime(df['date'], format = TIMESTAMP_FORMAT, errors = 'coerce').to_numpy().astype('datetime64[s]')
+
+        entries.thread_ids = array('q', df['thread'].to_numpy(dtype = int64).tobytes())
+        entries.timestamps = array('q', timestamps.view(int64).tobytes())
+        entries.titles = df['title'].tolist()
+        entries.folders = df['folder'].tolist() if 'folder' in df.columns else [None] * df.shape[0]
+        entries.is_open = df['open'].tolist() if 'open' in df.columns else [False] * df.shape[0]
+        entries.columns = {column: df[column].tolist() for column in df.columns if column not in RECORD_COLUMNS}
+
+        return entries
+
+    def __len__(self):
+        return len(self.thread_ids)
+
+    def __getitem__(self, i: int):
+        timestamp = self.timestamps[i]
+        extra = {column: values[i] for column, values in self.columns.items()}
+
+        return IndexEntry(
+            thread_id = self.thread_ids[i],
+            timestamp = None if timestamp == MISSING_TIMESTAMP else EPOCH + timedelta(seconds = timestamp),
+            title = self.titles[i],
+            folder = self.folders[i],
+            is_open = self.is_open[i],
+            board = extra.pop('board', None),
+            extra = extra or None
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __setitem__(self, i: int, entry: IndexEntry):
+        self.thread_ids[i] = entry.thread_id
+        self.timestamps[i] = MISSING_TIMESTAMP if entry.timestamp is None else int(to_datetime(entry.timestamp).timestamp())
+        self.titles[i] = entry.title
+        self.folders[i] = entry.folder
+        self.is_open[i] = entry.is_open
+
+        extra = {**(entry.extra or {}), 'board': entry.board}
+
+        for column in extra.keys() - self.columns.keys():
+            if extra[column] is not None:
+                self.columns[column] = [None] * len(self)
+
+        for column, values in self.columns.items():  # columns which the entry lacks are cleared
+            values[i] = extra.get(column)
+
+    def append(self, entry: IndexEntry):
+        self.thread_ids.append(0)
+        self.timestamps.append(MISSING_TIMESTAMP)
+        self.titles.append(None)
+        self.folders.append(None)
+        self.is_open.append(False)
+
+        for values in self.columns.values():
+            values.append(None)
+
+        self[len(self) - 1] = entry
+
+    def positions(self):
+        """
+        Maps thread ids to positions of their last entries.
+        """
+        return dict(zip(self.thread_ids, range(len(self))))
+
+    def argsort(self):
+        """
+        Returns positions of entries sorted by timestamp, entries with the same timestamp keep their order, and entries without it come last.
+        """
+        timestamps = frombuffer(self.timestamps, dtype = int64).copy()
+        timestamps[timestamps == MISSING_TIMESTAMP] = iinfo(int64).max
+
+        return timestamps.argsort(kind = 'stable')
+
+    def to_frame(self, order = None):
+        """
+        Returns a data frame with the columns of records made by IndexEntry.as_record followed by the other columns, rows are optionally reordered.
+        """
+        timestamps = frombuffer(self.timestamps, dtype = int64).view('datetime64[s]')
+        titles, folders, is_open = Series(self.titles, dtype = object), Series(self.folders, dtype = object), Series(self.is_open)
+        columns = {column: Series(values) for column, values in self.columns.items()}
+
+        if order is not None:
+            timestamps = timestamps[order]
+            titles, folders, is_open = titles.iloc[order], folders.iloc[order], is_open.iloc[order]
+            columns = {column: values.iloc[order] for column, values in columns.items()}
+
+        dates, inverse = unique(timestamps.astype('datetime64[D]'), return_inverse = True)  # each date is formatted once
+
+        return DataFrame({
+            'thread': frombuffer(self.thread_ids, dtype = int64) if order is None else frombuffer(self.thread_ids, dtype = int64)[order],
+            'date': Series(dates).dt.strftime(TIMESTAMP_FORMAT).to_numpy(dtype = object)[inverse],
+            'title': titles.to_numpy(),
+            'folder': folders.to_numpy(),
+            'open': is_open.to_numpy(),
+            **{column: values.to_numpy() for column, values in columns.items()}
+        })
@@ -0,0 +1,96 @@
+import os
+from json import dumps, loads
+from typing import Iterable
+
+from pandas import DataFrame, read_csv, concat
+
+
+JOURNAL_SUFFIX = '.journal'
+TEMPORARY_SUFFIX = '.tmp'
+
+
+class IndexJournal:
+    """
+    Rows added to a tsv index after the file was written. Rows are appended as json lines to a file next to the index, and each batch
+    is flushed to disk, so an interrupted run loses at most the batch which was being written. Readers see the index followed by the journal,
+    and compaction folds the journal into the index file.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.path = index_path + JOURNAL_SUFFIX
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def append(self, rows: Iterable[dict]):
+        data = ''.join(f'{dumps(row, ensure_ascii = False)}\n' for row in rows).encode('utf-8')
+
+        if len(data) < 1:
+            return
+
+        with open(self.path, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def read(self):
+        if not self.exists():
+            return []
+
+        with open(self.path, 'rb') as file:
+            data = file.read()
+
+        if (end := data.rfind(b'\n') + 1) < len(data):  # the last row has been written partially, so it is dropped
+            data = data[:end]
+
+            with open(self.path, 'r+b') as file:
+                file.truncate(end)
+
+        return [loads(line) for line in data.splitlines()]
+
+    def clear(self):
+        if self.exists():
+            os.remove(self.path)
+
+    def merge(self, base: DataFrame = None):
+        """
+        Returns the index with rows from the journal appended. Rows of threads which are already in the index are skipped, since they are
+        left in the journal when compaction is interrupted after the index has been written.
+        """
+        rows = self.read()
+
+        if base is not None:
+            threads = set(base.thread)
+            rows = [row for row in rows if row['thread'] not in threads]
+
+        if len(rows) < 1:
+            return base
+
+        if base is None:
+            return DataFrame.from_records(rows)
+
+        return concat([base, DataFrame.from_records(rows)], ignore_index = True)
+
+    def compact(self, replace_base: bool = False):
+        """
+        Writes the index followed by the journal rows to the index file and removes the journal. If replace_base is set, the index is
+        replaced by the journal rows. Returns the number of rows in the index.
+        """
+        base = None if replace_base or not os.path.isfile(self.index_path) else read_csv(self.index_path, sep = '\t')
+
+        if (df := self.merge(base)) is None:
+            df = DataFrame()
+
+        write_tsv(df, self.index_path)
+        self.clear()
+
+        return df.shape[0]
+
+
+def write_tsv(df: DataFrame, path: str):
+    """
+    Writes the index to a temporary file which replaces the target, so that readers never see a partially written index.
+    """
+    df.to_csv(temporary_path := f'{path}.{os.getpid()}{TEMPORARY_SUFFIX}', sep = '\t', index = False)
+    os.replace(temporary_path, path)
@@ -0,0 +1,285 @@
+import os
+from json import dumps, loads
+from shutil import rmtree
+
+import numpy as np
+from pandas import DataFrame, Series, read_csv, to_datetime, factorize
+
+from .IndexJournal import IndexJournal
+
+
+SNAPSHOT_SUFFIX = '.columns'
+META_NAME = 'meta.json'
+TEMPORARY_SUFFIX = '.tmp'
+DATE_COLUMNS = ('date', )
+DATE_FORMAT = '%d-%m-%Y'
+DICTIONARY_RATIO = 4  # string columns with at most this fraction of unique values are dictionary-encoded
+VERSION = 3  # snapshots of other versions are rebuilt
+IGNORE_NAME = '.gitignore'  # the snapshot is ignored by git in repositories which keep the index
+KEY_COLUMN = 'thread'  # sorted copy of the column is kept to find rows by binary search
+
+ARRAY = 'array'  # integer, float and boolean columns are kept as they are
+BOOLEAN = 'boolean'  # booleans with missing values, which are kept as 1, 0 and -1
+DATE = 'date'  # dates are kept as numbers of days
+DICTIONARY = 'dictionary'  # codes of values, which refer to the list of unique values
+STRING = 'string'  # utf-8 encoded values one after another, and offsets of their ends
+JSON_TYPES = (str, bool, int, float, np.bool_, np.integer, np.floating)  # values of other columns, which are kept in json if they are not strings
+
+
+def _get_stamp(index_path: str):
+    """
+    Sizes and modification times of the index and its journal, the snapshot is rebuilt when they change.
+    """
+    stamp = []
+
+    for path in (index_path, IndexJournal(index_path).path):
+        stamp.append(None if not os.path.isfile(path) else [(stat := os.stat(path)).st_size, stat.st_mtime_ns])
+
+    return stamp
+
+
+def _to_json(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _write_column(values: Series, name: str, folder: str, prefix: str):
+    if values.dtype.kind in 'biuf':
+        np.save(os.path.join(folder, f'{prefix}.npy'), array := values.to_numpy())
+
+        if name == KEY_COLUMN:
+            order = np.argsort(array, kind = 'stable')
+
+            np.save(os.path.join(folder, f'{prefix}.order.npy'), order)
+            np.save(os.path.join(folder, f'{prefix}.sorted.npy'), array[order])
+
+            return {'name': name, 'kind': ARRAY, 'sorted': True}
+
+        return {'name': name, 'kind': ARRAY}
+
+    valid = values.notna().to_numpy()
+    types = {type(value) for value in values[valid]}
+
+    if not all(issubclass(type_, JSON_TYPES) for type_ in types):
+        raise ValueError(f'Column {name} has values of types {", ".join(sorted(type_.__name__ for type_ in types))}, which the snapshot can\'t store')
+
+    if types and all(issubclass(type_, (bool, np.bool_)) for type_ in types):
+        np.save(os.path.join(folder, f'{prefix}.npy'), np.array([int(value) if is_valid else -1 for value, is_valid in zip(values, valid)], dtype = np.int8))
+        return {'name': name, 'kind': BOOLEAN}
+
+    if name in DATE_COLUMNS and types == {str}:
+        dates = to_datetime(values, format = DATE_FORMAT, errors = 'coerce')
+
+        if (dates.dt.strftime(DATE_FORMAT) == values)[valid].all():  # otherwise some values are not dates or are written differently
+            np.save(os.path.join(folder, f'{prefix}.npy'), dates.to_numpy().astype('datetime64[D]'))
+            return {'name': name, 'kind': DATE}
+
+    if len(types) < 2 and values.nunique() * DICTIONARY_RATIO <= len(values):  # values of different types, such as True and 1, may be equal
+        codes, uniques = factorize(values)  # missing values get code -1
+
+        np.save(os.path.join(folder, f'{prefix}.npy'), codes.astype(np.int32))
+
+        return {'name': name, 'kind': DICTIONARY, 'values': [_to_json(value) for value in uniques]}
+
+    encode = (lambda value: value) if types <= {str} else (lambda value: dumps(_to_json(value)))
+    data = [encode(value).encode('utf-8') if is_valid else b'' for value, is_valid in zip(values, valid)]
+
+    with open(os.path.join(folder, f'{prefix}.bin'), 'wb') as file:
+        file.write(b''.join(data))
+
+    np.save(os.path.join(folder, f'{prefix}.npy'), np.cumsum([len(item) for item in data], dtype = np.int64))
+
+    if not valid.all():
+        np.save(os.path.join(folder, f'{prefix}.valid.npy'), valid)
+
+    return {'name': name, 'kind': STRING, 'nullable': not valid.all(), 'json': not types <= {str}}
+
+
+class IndexSnapshot:
+    """
+    Columns of a tsv index kept in binary files next to it. Numbers and dates are memory-mapped, low-cardinality strings such as
+    board, folder and repo are dictionary-encoded, and other strings are decoded on access, so that a command reads only
+    the columns and rows it needs. The snapshot includes the journal of the index and is rebuilt when either of them changes.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+        with open(os.path.join(folder, META_NAME), 'r', encoding = 'utf-8') as file:
+            self._meta = loads(file.read())
+
+        self._columns = {column['name']: (i, column) for i, column in enumerate(self._meta['columns'])}
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, index_path: str):
+        folder = index_path + SNAPSHOT_SUFFIX
+        stamp = _get_stamp(index_path)
+
+        if os.path.isfile(meta_path := os.path.join(folder, META_NAME)):
+            with open(meta_path, 'r', encoding = 'utf-8') as file:
+                if (meta := loads(file.read())).get('version') == VERSION and meta['stamp'] == stamp:
+                    return cls(folder)
+
+        return cls.build(index_path, stamp)
+
+    @classmethod
+    def build(cls, index_path: str, stamp: list = None):
+        if stamp is None:
+            stamp = _get_stamp(index_path)
+
+        journal = IndexJournal(index_path)
+        df = journal.merge(read_csv(index_path, sep = '\t') if os.path.isfile(index_path) else None)
+
+        if df is None:
+            raise FileNotFoundError(f'Index {index_path} does not exist')
+
+        folder = index_path + SNAPSHOT_SUFFIX
+        os.makedirs(temporary_folder := f'{folder}.{os.getpid()}{TEMPORARY_SUFFIX}')
+
+        columns = [_write_column(df[name], name, temporary_folder, f'{i:03d}') for i, name in enumerate(df.columns)]
+
+        with open(os.path.join(temporary_folder, META_NAME), 'w', encoding = 'utf-8') as file:
+            file.write(dumps({'version': VERSION, 'stamp': stamp, 'n_rows': df.shape[0], 'columns': columns}, ensure_ascii = False))
+
+        with open(os.path.join(temporary_folder, IGNORE_NAME), 'w', encoding = 'utf-8') as file:
+            file.write('*\n')
+
+        if os.path.isdir(folder):
+            rmtree(folder)
+
+        try:
+            os.replace(temporary_folder, folder)
+        except OSError:  # another process has written the snapshot first
+            rmtree(temporary_folder)
+
+        return cls(folder)
+
+    @property
+    def columns(self):
+        return tuple(self._columns)
+
+    def __len__(self):
+        return self._meta['n_rows']
+
+    def _load(self, name: str, suffix: str = '.npy'):
+        if (array := self._arrays.get(key := (name, suffix))) is None:
+            path = os.path.join(self.folder, f'{self._columns[name][0]:03d}{suffix}')
+
+            if suffix.endswith('.npy'):
+                array = np.load(path, mmap_mode = 'r')
+            else:
+                array = np.memmap(path, dtype = np.uint8, mode = 'r') if os.path.getsize(path) > 0 else np.zeros(0, dtype = np.uint8)  # empty files can't be mapped
+
+            self._arrays[key] = array
+
+        return array
+
+    def _kind(self, name: str):
+        return self._columns[name][1]['kind']
+
+    def array(self, name: str):
+        """
+        Returns the memory-mapped column, which holds codes for dictionary-encoded columns and offsets for string columns.
+        """
+        return self._load(name)
+
+    def notna(self, columns: tuple[str] = None):
+        """
+        Returns mask of rows without missing values in the given columns, by default in all of them.
+        """
+        mask = np.ones(len(self), dtype = bool)
+
+        for name in self._columns if columns is None else columns:
+            if (kind := self._kind(name)) == ARRAY:
+                if (array := self._load(name)).dtype.kind == 'f':
+                    mask &= ~np.isnan(array)
+            elif kind == DATE:
+                mask &= ~np.isnat(self._load(name))
+            elif kind in (BOOLEAN, DICTIONARY):
+                mask &= self._load(name) >= 0
+            elif self._columns[name][1]['nullable']:
+                mask &= self._load(name, '.valid.npy')
+
+        return mask
+
+    def value(self, name: str, i: int):
+        if (kind := self._kind(name)) == ARRAY:
+            return self._load(name)[i].item()
+
+        if kind == DATE:
+            return None if np.isnat(date := self._load(name)[i]) else date.item().strftime(DATE_FORMAT)
+
+        if kind == BOOLEAN:
+            return None if (code := self._load(name)[i]) < 0 else bool(code)
+
+        if kind == DICTIONARY:
+            return None if (code := self._load(name)[i]) < 0 else self._columns[name][1]['values'][code]
+
+        if self._columns[name][1]['nullable'] and not self._load(name, '.valid.npy')[i]:
+            return None
+
+        offsets = self._load(name)
+        value = self._load(name, '.bin')[0 if i < 1 else offsets[i - 1]:offsets[i]].tobytes().decode('utf-8')
+
+        return loads(value) if self._columns[name][1]['json'] else value
+
+    def row(self, i: int):
+        return {name: self.value(name, i) for name in self._columns}
+
+    def find(self, thread: int):
+        """
+        Returns positions of rows with the given thread in ascending order. Positions are found by binary search over the sorted copy
+        of the column, so only a few pages of it are read.
+        """
+        if not self._columns[KEY_COLUMN][1].get('sorted'):  # thread ids are not integers
+            return np.flatnonzero(self.column(KEY_COLUMN).to_numpy() == thread)
+
+        threads = self._load(KEY_COLUMN, '.sorted.npy')
+
+        return np.sort(self._load(KEY_COLUMN, '.order.npy')[np.searchsorted(threads, thread, 'left'):np.searchsorted(threads, thread, 'right')])
+
+    def largest(self, name: str, n: int):
+        """
+        Returns positions of n rows with the largest values in the numeric column, from the largest one. Rows without values are skipped,
+        and values are partitioned instead of sorting the whole column.
+        """
+        if self._kind(name) != ARRAY:
+            raise ValueError(f'Column {name} is not numeric')
+
+        values = self._load(name)
+        positions = np.flatnonzero(~np.isnan(values)) if values.dtype.kind == 'f' else np.arange(len(values))
+
+        if n < len(positions):
+            positions = positions[np.argpartition(values[positions], len(positions) - n)[len(positions) - n:]]
+
+        return positions[np.argsort(-values[positions], kind = 'stable')]  # rows with equal values keep their order
+
+    def column(self, name: str):
+        if (kind := self._kind(name)) == ARRAY:
+            return Series(np.array(self._load(name)), name = name)
+
+        if kind == DATE:  # there are much fewer distinct dates than rows, so each of them is formatted once
+            dates, inverse = np.unique(self._load(name), return_inverse = True)
+            values = Series(dates).dt.strftime(DATE_FORMAT).to_numpy(dtype = object)
+            return Series(values[inverse], name = name)
+
+        if kind in (BOOLEAN, DICTIONARY):
+            values = (False, True) if kind == BOOLEAN else self._columns[name][1]['values']
+            values = np.array([*values, None], dtype = object)  # the last value is taken for missing ones
+            return Series(values[self._load(name)], name = name)
+
+        offsets = self._load(name)
+        data = self._load(name, '.bin').tobytes()
+        valid = self._load(name, '.valid.npy') if self._columns[name][1]['nullable'] else None
+        decode = loads if self._columns[name][1]['json'] else (lambda value: value)
+
+        return Series(
+            [
+                None if valid is not None and not valid[i] else decode(data[start:end].decode('utf-8'))
+                for i, (start, end) in enumerate(zip([0, *offsets[:-1].tolist()], offsets.tolist()))
+            ],
+            name = name, dtype = object
+        )
+
+    def frame(self, columns: tuple[str] = None):
+        return DataFrame({name: self.column(name) for name in (self._columns if columns is None else columns)})
@@ -0,0 +1,351 @@
+import os
+import sqlite3
+from json import dumps, loads
+from typing import Iterable
+
+from pandas import DataFrame, read_csv
+
+from .IndexEntry import IndexEntry
+from .IndexJournal import IndexJournal, write_tsv
+from .IndexSnapshot import IndexSnapshot
+
+
+COLUMNS = ('thread', 'date', 'title', 'folder', 'board')  # columns of the table, other columns of index rows are kept as json
+SUFFIXES = ('.db', '.sqlite')
+SQLITE_HEADER = b'SQLite format 3\x00'
+DATE_KEY = 'substr(date, 7, 4) || substr(date, 4, 2) || substr(date, 1, 2)'  # dates are formatted as dd-mm-yyyy, the key is yyyymmdd
+MAX_N_PARAMETERS = 900  # sqlite limits the number of parameters in a query
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS entries (
+    thread INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    date TEXT,
+    title TEXT,
+    folder TEXT,
+    board TEXT,
+    extra TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entries_position ON entries (position);
+CREATE INDEX IF NOT EXISTS entries_folder ON entries (folder);
+CREATE INDEX IF NOT EXISTS entries_date ON entries ({DATE_KEY});
+CREATE INDEX IF NOT EXISTS entries_board ON entries (board);
+CREATE TABLE IF NOT EXISTS columns (
+    position INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+'''
+
+UPSERT = '''
+INSERT INTO entries (thread, position, date, title, folder, board, extra)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (thread) DO UPDATE SET
+    date = excluded.date, title = excluded.title, folder = excluded.folder, board = excluded.board, extra = excluded.extra
+'''
+SELECT = 'SELECT thread, date, title, folder, board, extra FROM entries'
+
+
+def _get_expression(column: str):
+    return column if column in COLUMNS else f"json_extract(extra, '$.\"{column}\"')"
+
+
+def _normalize(value):
+    if isinstance(value, float) and value != value:  # pandas reads empty cells as nan
+        return None
+
+    return value
+
+
+class IndexStore:
+    """
+    Index of threads kept in sqlite with thread as the primary key and secondary indices on folder, date and board, so that a thread
+    is found and updated without reading the whole index. Order of rows and columns is kept, so the index can be converted to tsv
+    and back. The database is used in wal mode, which lets readers work while rows are written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')  # in wal mode a crash may lose the last transactions, but doesn't corrupt the database
+        self._connection.executescript(SCHEMA)
+
+        self._columns = [name for name, in self._connection.execute('SELECT name FROM columns ORDER BY position')]
+
+    @classmethod
+    def accepts(cls, path: str):
+        """
+        Checks whether the index at the given path is a database rather than a tsv file.
+        """
+        if not os.path.isfile(path):
+            return path.endswith(SUFFIXES)
+
+        with open(path, 'rb') as file:
+            return file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+    @property
+    def columns(self):
+        return tuple(self._columns)
+
+    def __len__(self):
+        return self._connection.execute('SELECT count(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, thread: int):
+        return self._connection.execute('SELECT 1 FROM entries WHERE thread = ?', (thread, )).fetchone() is not None
+
+    def threads(self):
+        return {thread for thread, in self._connection.execute('SELECT thread FROM entries')}
+
+    def _make_row(self, thread: int, date: str, title: str, folder: str, board: str, extra: str):
+        values = {'thread': thread, 'date': date, 'title': title, 'folder': folder, 'board': board}
+
+        if extra is not None:
+            values.update(loads(extra))
+
+        return {column: values.get(column) for column in self._columns}
+
+    def get_row(self, thread: int):
+        if (values := self._connection.execute(f'{SELECT} WHERE thread = ?', (thread, )).fetchone()) is None:
+            return None
+
+        return self._make_row(*values)
+
+    def get(self, thread: int):
+        return None if (row := self.get_row(thread)) is None else IndexEntry.from_json(row)
+
+    def get_rows(self, threads: Iterable[int]):
+        """
+        Yields rows of the given threads which are in the index, in arbitrary order.
+        """
+        threads = list(threads)
+
+        for i in range(0, len(threads), MAX_N_PARAMETERS):
+            batch = threads[i:i + MAX_N_PARAMETERS]
+
+            for values in self._connection.execute(f'{SELECT} WHERE thread IN ({", ".join("?" * len(batch))})', batch):
+                yield self._make_row(*values)
+
+    def rows(self, folder: str = None, board: str = None, first_date: str = None, last_date: str = None, is_open: bool = None):
+        """
+        Yields rows in the order in which they were added, optionally only the ones with the given folder, board, date range (dd-mm-yyyy)
+        or state of the thread.
+        """
+        conditions = []
+        parameters = []
+
+        if folder is not None:
+            conditions.append('folder = ?')
+            parameters.append(folder)
+
+        if board is not None:
+            conditions.append('board = ?')
+            parameters.append(board)
+
+        if first_date is not None:
+            conditions.append(f'{DATE_KEY} >= ?')
+            parameters.append(''.join(first_date.split('-')[::-1]))
+
+        if last_date is not None:
+            conditions.append(f'{DATE_KEY} <= ?')
+            parameters.append(''.join(last_date.split('-')[::-1]))
+
+        if is_open is not None:
+            conditions.append("json_extract(extra, '$.open') IS ?")
+            parameters.append(is_open)
+
+        query = SELECT if len(conditions) < 1 else f'{SELECT} WHERE {" AND ".join(conditions)}'
+
+        for values in self._connection.execute(f'{query} ORDER BY position', parameters):
+            yield self._make_row(*values)
+
+    def largest(self, column: str, n: int):
+        """
+        Yields n rows with the largest values in the column, rows without values are skipped.
+        """
+        expression = _get_expression(column)
+
+        for values in self._connection.execute(f'{SELECT} WHERE {expression} IS NOT NULL ORDER BY {expression} DESC LIMIT ?', (n, )):
+            yield self._make_row(*values)
+
+    def read_columns(self, columns: tuple[str]):
+        """
+        Reads only the given columns of all rows, columns which are kept as json are extracted by sqlite.
+        """
+        query = f'SELECT {", ".join(_get_expression(column) for column in columns)} FROM entries ORDER BY position'
+
+        return DataFrame(self._connection.execute(query).fetchall(), columns = list(columns))
+
+    def entries(self, **kwargs):
+        for row in self.rows(**kwargs):
+            yield IndexEntry.from_json(row)
+
+    def _add_columns(self, columns: Iterable[str]):
+        for column in columns:
+            if column not in self._columns:
+                self._connection.execute('INSERT INTO columns (position, name) VALUES (?, ?)', (len(self._columns), column))
+                self._columns.append(column)
+
+    def _upsert(self, rows: Iterable[dict | IndexEntry]):
+        position = self._connection.execute('SELECT coalesce(max(position), -1) + 1 FROM entries').fetchone()[0]
+        keys = None
+
+        def make_values():
+            nonlocal position, keys
+
+            for row in rows:
+                if isinstance(row, IndexEntry):
+                    row = row.as_row()
+
+                if row.keys() != keys:  # rows usually have the same columns
+                    self._add_columns(keys := row.keys())
+
+                extra = {key: _normalize(value) for key, value in row.items() if key not in COLUMNS}
+
+                yield (
+                    int(row['thread']), position, *(_normalize(row.get(column)) for column in COLUMNS[1:]),
+                    dumps(extra, ensure_ascii = False) if extra else None
+                )
+
+                position += 1  # positions of updated rows are not changed, so they are left unused
+
+        return self._connection.executemany(UPSERT, make_values()).rowcount
+
+    def upsert(self, rows: Iterable[dict | IndexEntry]):
+        """
+        Inserts rows of new threads after the existing ones and replaces rows of known threads in one transaction. Returns the number of rows.
+        """
+        with self._connection:
+            return self._upsert(rows)
+
+    def replace(self, rows: Iterable[dict | IndexEntry], columns: Iterable[str] = ()):
+        """
+        Replaces all rows of the index in one transaction, columns go in the given order followed by the ones which are found in rows.
+        """
+        with self._connection:
+            self._connection.execute('DELETE FROM entries')
+            self._connection.execute('DELETE FROM columns')
+            self._columns = []
+
+            self._add_columns(columns)
+
+            return self._upsert(rows)
+
+    def remove(self, thread: int):
+        with self._connection:
+            self._connection.execute('DELETE FROM entries WHERE thread = ?', (thread, ))
+
+    def read_frame(self):
+        return DataFrame(list(self.rows()), columns = self._columns)
+
+    def write_frame(self, df: DataFrame):
+        return self.replace(df.to_dict(orient = 'records'), df.columns)
+
+    def import_tsv(self, path: str):
+        return self.write_frame(read_csv(path, sep = '\t'))
+
+    def export_tsv(self, path: str):
+        self.read_frame().to_csv(path, sep = '\t', index = False)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_index(path: str):
+    """
+    Reads the whole index either from a tsv file followed by its journal or from a database.
+    """
+    if not IndexStore.accepts(path):
+        if not os.path.isfile(path) and (journal := IndexJournal(path)).exists():
+            return journal.merge()
+
+        return IndexJournal(path).merge(read_csv(path, sep = '\t'))
+
+    with IndexStore(path) as store:
+        return store.read_frame()
+
+
+def write_index(df: DataFrame, path: str):
+    """
+    Replaces the whole index either in a tsv file or in a database. The journal of the tsv file is removed, since the given index
+    is supposed to include its rows.
+    """
+    if not IndexStore.accepts(path):
+        write_tsv(df, path)
+        IndexJournal(path).clear()
+        return
+
+    with IndexStore(path) as store:
+        store.write_frame(df)
+
+
+def find_index_rows(path: str, thread: int):
+    """
+    Returns rows of the thread, which are found by the primary key in a database, or in the columnar snapshot of a tsv file.
+    """
+    if not IndexStore.accepts(path):
+        snapshot = IndexSnapshot.open(path)
+        return [snapshot.row(i) for i in snapshot.find(thread)]
+
+    with IndexStore(path) as store:
+        return [] if (row := store.get_row(thread)) is None else [row]
+
+
+def read_index_column_names(path: str):
+    if not IndexStore.accepts(path):
+        return IndexSnapshot.open(path).columns
+
+    with IndexStore(path) as store:
+        return store.columns
+
+
+def is_index_column_complete(path: str, column: str):
+    """
+    Tells whether the column has values in all rows with thread folders, rows without folders have no thread files. Columns which are filled
+    when threads are exported are incomplete until every thread has been exported since the column was introduced.
+    """
+    if column not in (columns := read_index_column_names(path)):
+        return False
+
+    if 'folder' not in columns:
+        return not read_index_columns(path, (column, ))[column].isna().any()
+
+    df = read_index_columns(path, (column, 'folder'))
+
+    return not (df[column].isna() & df['folder'].notna()).any()
+
+
+def find_largest_index_rows(path: str, column: str, n: int):
+    """
+    Returns n rows with the largest values in the column, which are selected by sqlite in a database, or in the snapshot of a tsv file.
+    """
+    if not IndexStore.accepts(path):
+        snapshot = IndexSnapshot.open(path)
+        return [snapshot.row(i) for i in snapshot.largest(column, n)]
+
+    with IndexStore(path) as store:
+        return list(store.largest(column, n))
+
+
+def read_index_columns(path: str, columns: tuple[str], dropna: bool = False):
+    """
+    Reads only the given columns of the index, a tsv file is read from its snapshot. If dropna is set, rows with missing values
+    in any column, not only in the given ones, are skipped.
+    """
+    if IndexStore.accepts(path):
+        if not dropna:
+            with IndexStore(path) as store:
+                return store.read_columns(columns)
+
+        return read_index(path).dropna()[list(columns)]
+
+    snapshot = IndexSnapshot.open(path)
+    df = snapshot.frame(columns)
+
+    return df[snapshot.notna()] if dropna else df
@@ -0,0 +1,223 @@
+import os
+import gzip
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from multiprocessing import Lock
+
+
+OBJECTS_FOLDER = 'objects'
+REFS_FOLDER = 'refs'
+OBJECT_SUFFIX = '.gz'
+BACKREFS_SUFFIX = '.refs'  # next to each object, hashes of urls which referred to it, so that their refs are removed with the object
+SIZE_NAME = 'size'
+EVICTION_RATIO = 0.9  # when the cache is full, objects are evicted until its size drops below this fraction of the max size
+
+cache_lock = Lock()  # inherited by worker processes, so that they share the size of the cache instead of counting it separately
+
+
+def _hash(data: bytes):
+    return sha256(data).hexdigest()
+
+
+class PageCache:
+    """
+    On-disk cache of raw pages. Pages are stored compressed under the hash of their content, so identical pages are kept once,
+    and each url refers to the hash of the last page pulled from it. When the total size of stored pages exceeds max_size bytes,
+    least recently used pages are evicted. The total size is kept in a file in the root, which is updated by all processes using the cache.
+    """
+
+    def __init__(self, root: str, max_size: int = None):
+        self.root = root
+        self.max_size = max_size
+
+        self.objects_root = os.path.join(root, OBJECTS_FOLDER)
+        self.refs_root = os.path.join(root, REFS_FOLDER)
+
+        for folder in (self.objects_root, self.refs_root):
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok = True)
+
+        self.size_path = os.path.join(root, SIZE_NAME)
+
+        self._candidates = []  # objects from the last walk over the cache, the least recently used one is the last
+
+    def _object_path(self, digest: str):
+        return os.path.join(self.objects_root, digest[:2], f'{digest}{OBJECT_SUFFIX}')
+
+    def _ref_path(self, url: str):
+        return self._ref_path_by_hash(_hash(url.encode('utf-8')))
+
+    def _ref_path_by_hash(self, digest: str):
+        return os.path.join(self.refs_root, digest[:2], digest)
+
+    def _write(self, path: str, data: bytes):
+        folder = os.path.dirname(path)
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok = True)
+
+        with NamedTemporaryFile(mode = 'wb', dir = folder, delete = False) as file:
+            file.write(data)
+
+        os.replace(file.name, path)
+
+    def _read_ref(self, path: str):
+        with open(path, 'r', encoding = 'utf-8') as file:
+            digest, url = file.read().split('\n', maxsplit = 1)
+
+        return digest, url
+
+    def get(self, url: str, decode: bool = True):
+        """
+        Returns the last page pulled from the url, or None if it is not cached. Pages are stored in utf-8, and if decode is False,
+        they are returned as raw bytes.
+        """
+        try:
+            digest, _ = self._read_ref(self._ref_path(url))
+
+            with gzip.open(object_path := self._object_path(digest), 'rb') as file:
+                page = file.read()
+
+            if decode:
+                page = page.decode('utf-8')
+        except FileNotFoundError:  # either the url has never been cached, or the page has been evicted
+            return None
+
+        try:
+            os.utime(object_path)  # mark as recently used
+        except FileNotFoundError:  # evicted by another process
+            pass
+
+        return page
+
+    def put(self, url: str, page: str | bytes):
+        data = page.encode('utf-8') if isinstance(page, str) else page  # raw pages must be in utf-8
+        digest = _hash(data)
+        object_path = self._object_path(digest)
+        compressed = None if os.path.isfile(object_path) else gzip.compress(data)  # compressed outside of the lock
+        url_digest = _hash(url.encode('utf-8'))
+        ref_path = self._ref_path_by_hash(url_digest)
+
+        with cache_lock:  # the object may be evicted by another process between the check and the write of the ref
+            size = None
+
+            if not os.path.isfile(object_path):
+                self._write(object_path, compressed := compressed or gzip.compress(data))
+                size = self._add_size(len(compressed))
+
+            try:
+                referred = self._read_ref(ref_path)[0] == digest
+            except FileNotFoundError:
+                referred = False
+
+            if not referred:  # pages of open threads are pulled again and again, and most of the time they are unchanged
+                with open(f'{object_path.removesuffix(OBJECT_SUFFIX)}{BACKREFS_SUFFIX}', 'a', encoding = 'utf-8') as file:
+                    file.write(f'{url_digest}\n')
+
+                self._write(ref_path, f'{digest}\n{url}'.encode('utf-8'))
+
+            if self.max_size is not None and size is not None and size > self.max_size:
+                self._evict(size)
+
+    def urls(self):
+        """
+        Yields urls of the cached pages. Refs to pages which are missing, for example evicted before refs were removed together with pages,
+        are removed.
+        """
+        for folder, _, files in os.walk(self.refs_root):
+            for file in files:
+                try:
+                    digest, url = self._read_ref(ref_path := os.path.join(folder, file))
+                except FileNotFoundError:  # removed by another process
+                    continue
+
+                if os.path.isfile(self._object_path(digest)):
+                    yield url
+                else:
+                    self._remove_ref(ref_path, digest)
+
+    def _objects(self):
+        for folder, _, files in os.walk(self.objects_root):
+            for file in files:
+                if file.endswith(OBJECT_SUFFIX):
+                    yield os.path.join(folder, file), os.stat(os.path.join(folder, file))
+
+    def _read_size(self):
+        try:
+            with open(self.size_path, 'r', encoding = 'utf-8') as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):  # the cache was made before its size was kept in the file
+            return sum(stat.st_size for _, stat in self._objects())
+
+    def _add_size(self, delta: int):
+        size = max(self._read_size() + delta, 0)
+        self._write(self.size_path, str(size).encode('utf-8'))
+
+        return size
+
+    @property
+    def size(self):
+        with cache_lock:
+            return self._read_size()
+
+    def _remove_ref(self, ref_path: str, digest: str):
+        try:
+            if self._read_ref(ref_path)[0] == digest:  # the url could be pulled again and refer to another page since then
+                os.remove(ref_path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_object(self, path: str):
+        os.remove(path)
+
+        digest = os.path.basename(path).removesuffix(OBJECT_SUFFIX)
+
+        try:
+            with open(backrefs_path := f'{path.removesuffix(OBJECT_SUFFIX)}{BACKREFS_SUFFIX}', 'r', encoding = 'utf-8') as file:
+                url_digests = {line.strip() for line in file if len(line.strip()) > 0}
+        except FileNotFoundError:
+            return
+
+        for url_digest in url_digests:
+            self._remove_ref(self._ref_path_by_hash(url_digest), digest)
+
+        os.remove(backrefs_path)
+
+    def _evict(self, size: int):
+        """
+        Removes least recently used objects until the size drops below the target. The objects are listed once and the list is reused
+        by the next evictions, objects which have been used since then are skipped and get to the next list.
+        """
+        target_size = self.max_size * EVICTION_RATIO
+        listed = False
+
+        while size > target_size:
+            if len(self._candidates) < 1:
+                if listed:  # the objects are listed at most once per eviction, in case all of them are being used
+                    break
+
+                self._candidates = sorted(self._objects(), key = lambda path_and_stat: path_and_stat[1].st_mtime, reverse = True)
+                size = sum(stat.st_size for _, stat in self._candidates)  # objects are written under the lock, so the listed ones are all there are
+                listed = True
+
+                continue
+
+            path, stat = self._candidates.pop()
+
+            try:
+                if os.stat(path).st_mtime != stat.st_mtime:  # used after the objects were listed
+                    continue
+
+                self._remove_object(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+
+            size -= stat.st_size
+
+        self._write(self.size_path, str(size).encode('utf-8'))
+
+        return size
+
+    def evict(self):
+        with cache_lock:
+            return self._evict(self._read_size())
@@ -0,0 +1,53 @@
+from enum import Enum
+from importlib.util import find_spec
+from os import environ as env
+
+from bs4 import BeautifulSoup
+
+from .session import DEFAULT_ENCODING
+
+
+PARSER_ENV_VARIABLE = 'MUCH_PARSER'
+
+
+class ParserBackend(Enum):
+    LXML = 'lxml'
+    HTML_PARSER = 'html.parser'
+
+    @property
+    def is_available(self):
+        match self:
+            case ParserBackend.LXML:
+                return find_spec('lxml') is not None
+            case ParserBackend.HTML_PARSER:
+                return True
+
+    @classmethod
+    def available(cls):
+        return tuple(backend for backend in cls if backend.is_available)
+
+    @classmethod
+    def make(cls, name: str = None):
+        """
+        Returns backend with the given name, or the fastest available backend if the name is not specified.
+        If the requested backend is not installed, the pure-python parser is used instead.
+        """
+        if name is None:
+            name = env.get(PARSER_ENV_VARIABLE)
+
+        if name is None:
+            return cls.available()[0]
+
+        backend = cls(name)
+
+        if not backend.is_available:
+            print(f'Parser backend {backend.value} is not available, falling back to {cls.HTML_PARSER.value}')
+            return cls.HTML_PARSER
+
+        return backend
+
+    def parse(self, page: str | bytes, encoding: str = DEFAULT_ENCODING):
+        if isinstance(page, str):
+            return BeautifulSoup(page, features = self.value)
+
+        return BeautifulSoup(page, features = self.value, from_encoding = encoding)  # known encoding spares the charset detection
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import re
+from html import unescape
+from dataclasses import dataclass
 
 from bs4 import BeautifulSoup
 
@@ -13,20 +15,55 @@ EMPTY = ''
 MIN_POST_LENGTH = 0
 
 MENTION_TEMPLATE = re.compile(r'>>([0-9]+)(\s+\(OP\)\s*)?')
+MENTION_PREFIX = '>>'
 POST_ID_TEMPLATE = re.compile('m[0-9]{4,}')
 POST_ID_HEAD_TEMPLATE = re.compile('([0-9]+).*', re.DOTALL)
 
+TAG_TEMPLATE = re.compile('<!--.*?-->|<[^>]*>', re.DOTALL)
+REPLY_LINK_TEMPLATE = re.compile('<a [^>]*?data-num="([0-9]+)"')
+
 
 class MissingPostIdException(Exception):
     pass
 
 
+@dataclass
+class PostRecord:
+    key: int
+    body: BeautifulSoup
+    text: str
+    mentions: list[int]
+    is_oppost: bool = False
+    is_reply: bool = True
+
+    @classmethod
+    def from_json(cls, json: dict):
+        comment = json.get('comment', EMPTY)
+
+        return cls(
+            key = json['num'],
+            body = None,
+            text = unescape(TAG_TEMPLATE.sub(SPACE, comment)),
+            mentions = [int(mention) for mention in REPLY_LINK_TEMPLATE.findall(comment)],
+            is_oppost = str(json.get('parent', 0)) == '0'  # op marks posts of the thread author, which include the replies they write
+        )
+
+
 def post_id_to_int(post_id: str):
     return int(post_id[1:])
 
 
-def parse_mention(mention: BeautifulSoup):
-    match = MENTION_TEMPLATE.fullmatch(mention.text)
+def parse_mention_text(text: str, key: str = None):
+    """
+    Returns id of the post mentioned by a link with the given text and data-num attribute, or None if the link is not a mention.
+    """
+    if key is not None and key.isascii() and key.isdigit() and text == MENTION_PREFIX + key:  # reply links on 2ch and arhivach
+        return int(key)
+
+    if not text.startswith(MENTION_PREFIX):
+        return None
+
+    match = MENTION_TEMPLATE.fullmatch(text)
 
     if match is None:
         return None
@@ -34,6 +71,34 @@ def parse_mention(mention: BeautifulSoup):
     return int(match.group(1))
 
 
+def parse_mention(mention: BeautifulSoup):
+    text = mention.string  # unlike .text, doesn't join strings if the link contains only one of them
+
+    if text is None or type(text) not in mention.interesting_string_types:
+        text = mention.text
+
+    return parse_mention_text(text, mention.get('data-num'))
+
+
+def parse_body_id(body: BeautifulSoup | dict):
+    """
+    Returns id of the post with the given body, which is either a tag or its attributes. Markup of bodies which are given by their attributes
+    is not kept by the streaming extractor, so only their id is searched for the post id.
+    """
+    if body is None:
+        return None
+
+    try:
+        return post_id_to_int(body['id'])
+    except KeyError:
+        return None
+    except ValueError:
+        id_matches = POST_ID_TEMPLATE.findall(body['id'] if isinstance(body, dict) else str(body))
+        if len(id_matches) < 1:
+            raise MissingPostIdException(f'{id_matches}')
+        return post_id_to_int(id_matches[0])
+
+
 def parse_post_id(post_id: str):
     if post_id is None or len(post_id) < 1:
         return None
@@ -89,29 +154,22 @@ class Post:
         return len(self.text)
 
     @classmethod
-    def from_body(cls, body: BeautifulSoup, html: BeautifulSoup = None, key = None):
-        body_text = None if body is None else body.get_text(separator = SPACE)
+    def from_text(cls, body_text: str, body: BeautifulSoup = None, mentions: list[int] = None, key = None):
         text = normalize(MENTION_TEMPLATE.sub(SPACE, OP_TEMPLATE.sub(SPACE, EMPTY if body_text is None else body_text)))
         if len(text) < MIN_POST_LENGTH:
             return None, None
 
-        # if key == 52234659:
-        #     print(body)
-        #     print(html)
-
         if key is None:
-            try:
-                key = None if body is None else post_id_to_int(body['id'])
-            except KeyError:
-                key = None
-            except ValueError:
-                id_matches = POST_ID_TEMPLATE.findall(str(body))
-                if len(id_matches) < 1:
-                    raise MissingPostIdException(f'{id_matches}')
-                key = post_id_to_int(id_matches[0])
-
-        # print(html)
+            key = parse_body_id(body)
 
+        return mentions, cls(text = text, id = key, n_parents = 0 if mentions is None else len(mentions))
+
+    @classmethod
+    def from_record(cls, record: PostRecord):
+        return cls.from_text(record.text, record.body, record.mentions, key = record.key)
+
+    @classmethod
+    def from_body(cls, body: BeautifulSoup, html: BeautifulSoup = None, key = None):
         # mentions = None if html is None else html.find_all('a', {'class': 'post-reply-link'})
         # if mentions is not None:
         #     mentions = [int(mention['data-num']) for mention in mentions]
@@ -129,7 +187,7 @@ class Post:
         # for mention in html.find('div', id=f'refmap-{key}').find_all('a', {'class': 'post-reply-link'}):
         #     print(mention['data-num'])
 
-        return mentions, cls(text = text, id = key, n_parents = 0 if mentions is None else len(mentions))
+        return cls.from_text(None if body is None else body.get_text(separator = SPACE), body, mentions, key)  # text is normalized in one place
 
     @classmethod
     def from_html(cls, html: BeautifulSoup):
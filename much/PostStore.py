@@ -0,0 +1,50 @@
+import os
+from json import dump, load
+from tempfile import NamedTemporaryFile
+
+
+class PostStore:
+    """
+    Folder with raw posts of open threads in json format, one file per thread. Posts are kept in the order of their numbers,
+    so that only posts which come after the last stored one have to be pulled when the thread is updated.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+        if not os.path.isdir(root):
+            os.makedirs(root, exist_ok = True)
+
+    def _path(self, thread: int):
+        return os.path.join(self.root, f'{thread}.json')
+
+    def read(self, thread: int):
+        try:
+            with open(self._path(thread), 'r', encoding = 'utf-8') as file:
+                return load(file)
+        except FileNotFoundError:
+            return []
+
+    def write(self, thread: int, posts: list[dict]):
+        with NamedTemporaryFile(mode = 'w', encoding = 'utf-8', dir = self.root, delete = False) as file:
+            dump(posts, file, ensure_ascii = False, separators = (',', ':'))
+
+        os.replace(file.name, self._path(thread))
+
+    def extend(self, thread: int, posts: list[dict], new_posts: list[dict]):
+        """
+        Appends posts which are newer than the last stored one and saves the result.
+        """
+        last_post = posts[-1]['num'] if posts else 0
+
+        posts.extend(post for post in new_posts if post['num'] > last_post)
+
+        self.write(thread, posts)
+
+        return posts
+
+    def drop(self, thread: int):
+        try:
+            os.remove(self._path(thread))
+        except FileNotFoundError:
+            pass
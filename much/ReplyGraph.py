@@ -0,0 +1,161 @@
+from math import floor
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from numpy import array as to_numpy, argsort, bincount, cumsum, lexsort, zeros, int64
+
+
+class ReplyGraph:
+    """
+    Posts of a thread and replies between them. Replies are kept in CSR layout: after the graph is built, replies to the i-th post
+    are children[offsets[i]:offsets[i + 1]] in the order in which they were added. Posts may share a key, in which case mentions
+    of the key refer to the last post added with it. Post texts are appended to the given container, apart from which the graph
+    keeps a few integers per post.
+    """
+
+    def __init__(self, texts: list[str] = None):
+        self.texts = [] if texts is None else texts
+        self.sizes = array('q')
+        self.keys = array('q')  # index of the post key among unique keys
+        self.n_parents = array('q')  # number of mentions in the post including the ones which point to unknown posts
+
+        self._histogram = Counter()  # post size -> number of posts
+        self._sorted_keys = array('q')  # post numbers usually grow, so most keys are found by binary search without keeping a dict entry
+        self._sorted_key_indexes = array('q')
+        self._key_to_index = {}  # keys which come out of order
+        self._latest = array('q')  # index of the last post with the given key
+        self._parents = array('q')
+        self._children = array('q')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def _find(self, key: int):
+        if (index := self._key_to_index.get(key)) is not None or type(key) is not int:
+            return index
+
+        keys = self._sorted_keys
+
+        if (i := bisect_left(keys, key)) < len(keys) and keys[i] == key:
+            return self._sorted_key_indexes[i]
+
+        return None
+
+    def add(self, key: int, text: str, mentions: list[int] = None):
+        post = len(self.sizes)
+
+        if (index := self._find(key)) is None:
+            index = len(self._latest)
+            self._latest.append(post)
+
+            if type(key) is int and (len(self._sorted_keys) < 1 or key > self._sorted_keys[-1]):
+                self._sorted_keys.append(key)
+                self._sorted_key_indexes.append(index)
+            else:
+                self._key_to_index[key] = index
+        else:
+            self._latest[index] = post
+
+        self.texts.append(text)
+        self.sizes.append(size := len(text))
+        self.keys.append(index)
+        self._histogram[size] += 1
+
+        if mentions is None:
+            self.n_parents.append(0)
+            return
+
+        self.n_parents.append(len(mentions))
+
+        for mention in mentions:
+            if (index := self._find(mention)) is not None:
+                self._parents.append(self._latest[index])
+                self._children.append(post)
+
+    def percentile(self, q: float):
+        """
+        Same as numpy.percentile with linear interpolation over post sizes, but computed from their histogram.
+        """
+        n_posts = len(self.sizes)
+
+        if n_posts < 1:
+            raise ValueError('Percentile of an empty graph is undefined')
+
+        index = (n_posts - 1) * (q / 100)
+        lower = floor(index)
+        gamma = index - lower
+        upper = min(lower + 1, n_posts - 1)
+
+        lower_size = upper_size = None
+        n_seen = 0
+
+        for size in sorted(self._histogram):
+            n_seen += self._histogram[size]
+
+            if lower_size is None and lower < n_seen:
+                lower_size = size
+
+            if upper < n_seen:
+                upper_size = size
+                break
+
+        delta = upper_size - lower_size
+
+        return upper_size - delta * (1 - gamma) if gamma >= 0.5 else lower_size + delta * gamma
+
+    def _build(self):
+        n_posts = len(self.sizes)
+        parents = to_numpy(self._parents, dtype = int64)
+
+        offsets = zeros(n_posts + 1, dtype = int64)
+        cumsum(bincount(parents, minlength = n_posts), out = offsets[1:])
+
+        children = to_numpy(self._children, dtype = int64)[argsort(parents, kind = 'stable')]
+
+        return offsets, children
+
+    def group(self, min_size: int = 0):
+        """
+        Yields posts which start topics together with the replies which belong to them. Posts with more replies come first, and replies are
+        collected in depth-first order, each post being included at most once. Ties are broken by the number of mentions (ascending),
+        then by size (descending), then by the order of addition.
+        """
+        offsets, children = self._build()
+        sizes = to_numpy(self.sizes, dtype = int64)
+
+        candidates = to_numpy(self._latest, dtype = int64)
+        n_children = (offsets[1:] - offsets[:-1])[candidates]
+        order = candidates[lexsort((-sizes[candidates], to_numpy(self.n_parents, dtype = int64)[candidates], -n_children))]
+
+        offsets = array('q', offsets.tobytes())
+        children = array('q', children.tobytes())
+        sizes = self.sizes
+        keys = self.keys
+
+        remaining = bytearray(b'\x01') * len(self._latest)
+        n_remaining = len(remaining)
+
+        for post in array('q', order.tobytes()):
+            if remaining[keys[post]] and sizes[post] >= min_size:
+                comments = []
+                stack = children[offsets[post]:offsets[post + 1]].tolist()[::-1]
+
+                while stack:
+                    child = stack.pop()
+
+                    if remaining[key := keys[child]]:
+                        remaining[key] = False
+                        n_remaining -= 1
+
+                        comments.append(child)
+                        stack.extend(reversed(children[offsets[child]:offsets[child + 1]]))
+
+                yield post, comments
+
+                if remaining[key := keys[post]]:  # might have been removed if the post is reachable from its replies
+                    remaining[key] = False
+                    n_remaining -= 1
+
+            if n_remaining < 1:
+                break
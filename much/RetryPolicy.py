@@ -0,0 +1,72 @@
+from time import sleep, monotonic
+from random import uniform
+from dataclasses import dataclass
+from typing import Callable
+
+from requests.exceptions import SSLError, ConnectionError, ChunkedEncodingError, ReadTimeout
+
+from .util import make_ordinal
+
+
+BASE_DELAY = 1  # seconds
+MAX_DELAY = 60  # seconds
+N_ATTEMPTS = 10
+
+
+class TransientError(Exception):
+    pass
+
+
+class RetriesExhaustedError(Exception):
+    def __init__(self, description: str, n_attempts: int, error: Exception):
+        super().__init__(f'Failed to fetch {description} after {n_attempts} attempts: {error}')
+
+        self.description = description
+        self.n_attempts = n_attempts
+        self.error = error
+
+
+@dataclass
+class RetryPolicy:
+    n_attempts: int = N_ATTEMPTS  # None means no limit
+    deadline: float = None  # seconds since the first attempt, None means no limit
+    base_delay: float = BASE_DELAY
+    max_delay: float = MAX_DELAY
+    jitter: float = 0.5  # fraction of the delay which is randomized
+    exceptions: tuple[type] = (TransientError, SSLError, ConnectionError, ChunkedEncodingError, ReadTimeout)
+
+    def delay(self, attempt: int):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+        return uniform(delay * (1 - self.jitter), delay)
+
+    def is_exhausted(self, attempt: int, start: float, delay: float = 0):
+        if self.n_attempts is not None and attempt >= self.n_attempts:
+            return True
+
+        return self.deadline is not None and monotonic() - start + delay > self.deadline
+
+    def run(self, action: Callable, description: str):
+        """
+        Calls action until it succeeds, retrying on transient errors with exponential backoff.
+        Other exceptions, including the ones which signal permanent errors, are not handled.
+        """
+        start = monotonic()
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            try:
+                return action()
+            except self.exceptions as e:
+                error = e
+
+            delay = self.delay(attempt)
+
+            if self.is_exhausted(attempt, start, delay):
+                raise RetriesExhaustedError(description, attempt, error) from error
+
+            print(f'🔴 Encountered {type(error).__name__} when fetching {description}: {error}. Waiting for {delay:.1f} seconds before retrying...')
+            sleep(delay)
+            print(f'🟡 Retrying ({make_ordinal(attempt + 1)} attempt to fetch {description})...')
@@ -0,0 +1,62 @@
+from sys import getsizeof
+from array import array
+from tempfile import TemporaryFile
+
+
+MEMORY_BUDGET = 64 * 1024 * 1024  # bytes
+
+
+class SpillBuffer:
+    """
+    Append-only list of strings which keeps them in memory until their total size exceeds the budget. Strings appended after that
+    are written to a temporary file, and only their offsets are kept in memory.
+    """
+
+    def __init__(self, budget: int = MEMORY_BUDGET):
+        self.budget = budget
+
+        self._items = []
+        self._size = 0
+        self._file = None
+        self._offsets = array('q')  # start of each spilled string in the file, followed by the end of the last one
+
+    def __len__(self):
+        return len(self._items) + max(0, len(self._offsets) - 1)
+
+    def append(self, item: str):
+        if self._file is None:
+            if self._size + (size := getsizeof(item)) <= self.budget:
+                self._items.append(item)
+                self._size += size
+                return
+
+            self._file = TemporaryFile()
+            self._offsets.append(0)
+
+        self._file.seek(self._offsets[-1])
+        self._offsets.append(self._offsets[-1] + self._file.write(item.encode('utf-8')))
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+
+        if i < len(self._items):
+            return self._items[i]
+
+        if not 0 <= (i := i - len(self._items)) < len(self._offsets) - 1:
+            raise IndexError('Spill buffer index out of range')
+
+        self._file.seek(start := self._offsets[i])
+
+        return self._file.read(self._offsets[i + 1] - start).decode('utf-8')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,211 @@
+import re
+from collections import deque, Counter
+from html.parser import HTMLParser
+
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+from .Extractor import POST_CLASSES, SiteProfile, _OpenPost, detect_profile
+from .Post import parse_mention_text
+
+
+# elements which are never closed, same as in beautifulsoup
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'
+))
+RAW_TEXT_ELEMENTS = frozenset(('script', 'style', 'template', 'rt', 'rp'))  # strings inside these elements are not a part of the post text
+CDATA_PREFIX = 'CDATA['
+
+DECIMAL_REFERENCE_TEMPLATE = re.compile('([0-9]+)(.*)', re.DOTALL)
+HEX_REFERENCE_TEMPLATE = re.compile('([0-9a-f]+)(.*)', re.DOTALL)
+
+
+class _Element:
+    __slots__ = ('name', 'post', 'link', 'key')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.post = None  # post which starts at this element
+        self.link = None  # strings of the link if the element is a link inside a post
+        self.key = None  # data-num attribute of the link
+
+
+class StreamingExtractor(HTMLParser):
+    """
+    Incremental counterpart of the Extractor, which receives the page in chunks and makes post records as soon as the posts are closed,
+    without building the document tree. Elements are nested the same way as in the tree built by beautifulsoup with the html.parser
+    backend, so the records are the same. Finished records are accumulated in the records queue, which should be drained after each chunk.
+    """
+
+    def __init__(self, profile: SiteProfile = None):
+        super().__init__(convert_charrefs = False)  # character references are converted the same way as in beautifulsoup
+
+        self.profile = profile
+        self.records = deque()
+
+        self._stack = []
+        self._open_posts = []
+        self._open_links = []
+        self._finished = {}
+        self._n_posts = 0
+        self._n_yielded = 0
+        self._n_raw = 0
+        self._data = []
+        self._closed_void_elements = Counter()  # number of end tags of void elements which should be ignored
+
+    def _append_string(self, string: str):
+        for post in self._open_posts:
+            for priority in post.collecting.values():
+                post.texts[priority].append(string)
+
+        for link in self._open_links:
+            link.link.append(string)
+
+    def _flush(self):
+        if self._data:
+            string = ''.join(self._data)
+            self._data.clear()
+            self._append_string(string)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str]]):
+        self._start(tag, attrs)
+
+        if tag in VOID_ELEMENTS:
+            self._end(tag)
+            self._closed_void_elements[tag] += 1
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str]]):
+        self._start(tag, attrs)
+        self._end(tag)
+
+    def handle_endtag(self, tag: str):
+        if self._closed_void_elements[tag] > 0:
+            self._closed_void_elements[tag] -= 1
+        else:
+            self._end(tag)
+
+    def _start(self, tag: str, attrs: list[tuple[str, str]]):
+        self._flush()
+
+        self._stack.append(element := _Element(tag))
+
+        if tag in RAW_TEXT_ELEMENTS:
+            self._n_raw += 1
+
+        attributes = {name: '' if value is None else value for name, value in attrs}
+        classes = attributes.get('class', '').split()
+
+        if open_posts := self._open_posts:
+            if tag == 'a':
+                element.link = []
+                element.key = attributes.get('data-num')
+                self._open_links.append(element)
+
+            for priority in self.profile.match_bodies(tag, classes):
+                for post in open_posts:
+                    if priority not in post.bodies:
+                        post.bodies[priority] = attributes
+                        post.texts[priority] = []
+                        post.collecting[id(element)] = priority
+
+        if tag == 'div' and not (classes := frozenset(classes)).isdisjoint(POST_CLASSES):
+            if self.profile is None:
+                self.profile = detect_profile(attributes)
+
+            element.post = _OpenPost(attributes, self._n_posts, classes)
+            open_posts.append(element.post)
+            self._n_posts += 1
+
+    def _end(self, tag: str):
+        self._flush()
+
+        stack = self._stack
+
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i].name == tag:
+                break
+        else:  # end tags without matching start tags are ignored
+            return
+
+        while len(stack) > i:
+            self._close(stack.pop())
+
+    def _close(self, element: _Element):
+        if element.name in RAW_TEXT_ELEMENTS:
+            self._n_raw -= 1
+
+        open_posts = self._open_posts
+
+        for post in open_posts:
+            post.collecting.pop(id(element), None)
+
+        if element.link is not None:
+            self._open_links.remove(element)
+
+            if (mention := parse_mention_text(''.join(element.link), element.key)) is not None:
+                for post in open_posts:
+                    post.mentions.append(mention)
+
+        if element.post is not None:
+            post = open_posts.pop()
+            self._finished[post.index] = post.make_record(self.profile)
+
+            if not open_posts:  # posts are emitted in the document order even if they are nested
+                while self._n_yielded in self._finished:
+                    self.records.append(self._finished.pop(self._n_yielded))
+                    self._n_yielded += 1
+
+    def handle_data(self, data: str):
+        if self._n_raw < 1:
+            self._data.append(data)
+
+    def handle_charref(self, name: str):
+        if name[:1] in ('x', 'X'):
+            name = name[1:]
+            base = 16
+            template = HEX_REFERENCE_TEMPLATE
+        else:
+            base = 10
+            template = DECIMAL_REFERENCE_TEMPLATE
+
+        try:
+            code = int(name, base)
+            rest = ''
+        except ValueError:  # the reference is not terminated by a semicolon, so the characters after the number are a part of the text
+            if (match := template.match(name)) is None:
+                self.handle_data(name)
+                return
+
+            code = int(match.group(1), base)
+            rest = match.group(2)
+
+        self.handle_data(UnicodeDammit.numeric_character_reference(code)[0])
+        self.handle_data(rest)
+
+    def handle_entityref(self, name: str):
+        if (character := EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)) is None:
+            character = f'&{name}'
+
+        self.handle_data(character)
+
+    def handle_comment(self, data: str):
+        self._flush()
+
+    def handle_decl(self, decl: str):
+        self._flush()
+
+    def handle_pi(self, data: str):
+        self._flush()
+
+    def unknown_decl(self, data: str):
+        self._flush()
+
+        if data.upper().startswith(CDATA_PREFIX):
+            self._append_string(data[len(CDATA_PREFIX):])
+
+    def close(self):
+        super().close()
+        self._flush()
+
+        while self._stack:
+            self._close(self._stack.pop())
@@ -0,0 +1,516 @@
+import os
+from io import TextIOWrapper
+from struct import Struct
+from random import sample
+from functools import lru_cache
+from dataclasses import dataclass
+
+try:
+    from zstandard import ZstdCompressor, ZstdDecompressor, ZstdCompressionDict, ZstdError, train_dictionary, frame_content_size
+except ImportError:
+    ZstdCompressor = None
+
+
+THREAD_SUFFIX = '.txt'
+THREAD_FILE_NAME = '{thread:08d}' + THREAD_SUFFIX
+
+COMPRESSED_SUFFIX = '.zst'  # appended to names of thread files when they are compressed
+COMPRESSED_THREAD_SUFFIX = THREAD_SUFFIX + COMPRESSED_SUFFIX
+DICTIONARY_NAME = 'dictionary.zdict'  # each folder with compressed threads has its own dictionary
+DICTIONARY_SIZE = 112 * 1024  # bytes
+N_SAMPLES = 1000  # number of threads in a folder on which the dictionary is trained
+COMPRESSION_LEVEL = 19
+FRAME_HEADER_SIZE = 18  # bytes, max size of the zstd frame header which holds size of the decompressed thread
+TEMPORARY_SUFFIX = '.tmp'
+
+PACK_INDEX_NAME = 'index.bin'
+PACK_FOLDERS_NAME = 'folders.txt'
+SEGMENT_NAME = '{segment:06d}.pack'
+SEGMENT_SIZE = 1024 * 1024 * 1024  # bytes, a new segment is started when the current one grows larger
+ENTRY = Struct('<qiiqq')  # thread, folder, segment, offset, size
+REMOVED = -1  # size of entries which mark removed threads
+
+
+@dataclass(frozen = True)
+class ThreadEntry:
+    thread: int
+    folder: str
+    size: int  # bytes
+    version: int  # changes whenever the thread is written again: modification time of the file or position of the entry in the pack index
+
+
+def _require_zstandard():
+    if ZstdCompressor is None:
+        raise ImportError('zstandard is required for reading and writing compressed threads')
+
+
+def parse_thread_file_name(name: str):
+    for suffix in (THREAD_SUFFIX, COMPRESSED_THREAD_SUFFIX):
+        if name.endswith(suffix):
+            try:
+                return int(name[:-len(suffix)])
+            except ValueError:
+                return None
+
+    return None
+
+
+def find_thread_file(folder_path: str, thread: int):
+    """
+    Returns path to the file with the thread or None if it is missing. Plain files take precedence over compressed ones, since
+    they are written when a compressed thread is pulled again.
+    """
+    for suffix in (THREAD_SUFFIX, COMPRESSED_THREAD_SUFFIX):
+        for name in (f'{thread:08d}{suffix}', f'{thread}{suffix}'):  # threads pulled from 2ch are named without padding
+            if os.path.isfile(path := os.path.join(folder_path, name)):
+                return path
+
+    return None
+
+
+@lru_cache(maxsize = 64)
+def _get_decompressor(folder_path: str):
+    _require_zstandard()
+
+    if not os.path.isfile(path := os.path.join(folder_path, DICTIONARY_NAME)):  # the folder had too few threads for training
+        return ZstdDecompressor()
+
+    with open(path, 'rb') as file:
+        return ZstdDecompressor(dict_data = ZstdCompressionDict(file.read()))
+
+
+def open_thread_file(path: str, newline: str = ''):
+    """
+    Opens file with the thread for reading text, compressed files are decompressed on the fly.
+    """
+    if not path.endswith(COMPRESSED_SUFFIX):
+        return open(path, 'r', encoding = 'utf-8', newline = newline)
+
+    reader = _get_decompressor(os.path.dirname(path)).stream_reader(open(path, 'rb'))
+
+    return TextIOWrapper(reader, encoding = 'utf-8', newline = newline)
+
+
+def read_thread_file(path: str):
+    with open_thread_file(path) as file:
+        return file.read()
+
+
+def get_thread_file_size(path: str):
+    """
+    Returns size of the thread text in bytes. Compressed files keep it in the frame header, so they are not decompressed.
+    """
+    if not path.endswith(COMPRESSED_SUFFIX):
+        return os.stat(path).st_size
+
+    _require_zstandard()
+
+    with open(path, 'rb') as file:
+        return frame_content_size(file.read(FRAME_HEADER_SIZE))
+
+
+def _replace(path: str, data: bytes, mtime: int = None):
+    with open(temporary_path := f'{path}.{os.getpid()}{TEMPORARY_SUFFIX}', 'wb') as file:
+        file.write(data)
+
+    if mtime is not None:  # thread files are dated by their modification time, which must survive compression
+        os.utime(temporary_path, ns = (mtime, mtime))
+
+    os.replace(temporary_path, path)
+
+
+def write_thread_file(path: str, text: str | bytes, mtime: int = None):
+    """
+    Writes the thread as a plain file, the compressed copy of the thread left in the same folder is removed. If mtime is given (in nanoseconds),
+    the file gets this modification time.
+    """
+    _replace(path, text.encode('utf-8') if isinstance(text, str) else text, mtime)
+
+    if os.path.isfile(compressed_path := path + COMPRESSED_SUFFIX):
+        os.remove(compressed_path)
+
+
+def copy_thread_file(source: str, destination: str):
+    """
+    Copies the thread to a plain file, so that it can be moved between folders with different dictionaries.
+    """
+    write_thread_file(destination, read_thread_file(source))
+
+
+def compress_folder(folder_path: str, level: int = COMPRESSION_LEVEL, dictionary_size: int = DICTIONARY_SIZE, n_samples: int = N_SAMPLES):
+    """
+    Replaces plain thread files in the folder with compressed ones. The dictionary is trained on a sample of the threads when the folder is
+    compressed for the first time and reused later, since already compressed threads depend on it. Empty threads are left as they are.
+    Returns the number of compressed threads, their size before and after compression.
+    """
+    _require_zstandard()
+
+    names = sorted(name for name in os.listdir(folder_path) if name.endswith(THREAD_SUFFIX) and parse_thread_file_name(name) is not None)
+
+    if len(names) < 1:
+        return 0, 0, 0
+
+    dictionary = None
+
+    if os.path.isfile(dictionary_path := os.path.join(folder_path, DICTIONARY_NAME)):
+        with open(dictionary_path, 'rb') as file:
+            dictionary = ZstdCompressionDict(file.read())
+    elif not any(name.endswith(COMPRESSED_THREAD_SUFFIX) for name in os.listdir(folder_path)):
+        samples = []
+
+        for name in sample(names, min(n_samples, len(names))):
+            with open(os.path.join(folder_path, name), 'rb') as file:
+                if len(data := file.read()) > 0:
+                    samples.append(data)
+
+        try:
+            dictionary = train_dictionary(dictionary_size, samples)
+        except ZstdError:  # there are too few samples, so threads are compressed without a dictionary
+            pass
+        else:
+            _replace(dictionary_path, dictionary.as_bytes())
+            _get_decompressor.cache_clear()
+
+    compressor = ZstdCompressor(level = level) if dictionary is None else ZstdCompressor(level = level, dict_data = dictionary)
+
+    n_threads = n_bytes = n_compressed_bytes = 0
+
+    for name in names:
+        path = os.path.join(folder_path, name)
+
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        if len(data) < 1:  # compressed empty thread is larger than zero bytes, and empty threads are found by size
+            continue
+
+        _replace(path + COMPRESSED_SUFFIX, compressed := compressor.compress(data), os.stat(path).st_mtime_ns)
+        os.remove(path)
+
+        n_threads += 1
+        n_bytes += len(data)
+        n_compressed_bytes += len(compressed)
+
+    return n_threads, n_bytes, n_compressed_bytes
+
+
+def decompress_folder(folder_path: str):
+    """
+    Replaces compressed thread files in the folder with plain ones and removes the dictionary. Returns the number of decompressed threads.
+    """
+    n_threads = 0
+
+    for name in sorted(os.listdir(folder_path)):
+        if name.endswith(COMPRESSED_THREAD_SUFFIX) and parse_thread_file_name(name) is not None:
+            path = os.path.join(folder_path, name)
+
+            if not os.path.isfile(plain_path := path[:-len(COMPRESSED_SUFFIX)]):  # otherwise the compressed copy is outdated
+                with open_thread_file(path) as file:
+                    _replace(plain_path, file.read().encode('utf-8'), os.stat(path).st_mtime_ns)
+
+            os.remove(path)
+            n_threads += 1
+
+    if os.path.isfile(dictionary_path := os.path.join(folder_path, DICTIONARY_NAME)):
+        os.remove(dictionary_path)
+        _get_decompressor.cache_clear()
+
+    return n_threads
+
+
+class FolderThreadStore:
+    """
+    Threads kept as separate text files in batch folders, one file per thread. Files may be compressed, in which case they are
+    decompressed when read.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, thread: int, folder: str):
+        if (path := find_thread_file(os.path.join(self.root, folder), thread)) is not None:
+            return path
+
+        return os.path.join(self.root, folder, f'{thread}{THREAD_SUFFIX}')
+
+    def entries(self):
+        for folder in sorted(os.scandir(self.root), key = lambda folder: folder.name):
+            if not folder.is_dir():
+                continue
+
+            threads = set()
+            compressed = []
+
+            for file in os.scandir(folder.path):
+                if (thread := parse_thread_file_name(file.name)) is None:
+                    continue
+
+                if file.name.endswith(COMPRESSED_SUFFIX):
+                    compressed.append((thread, file.path))
+                else:
+                    threads.add(thread)
+                    yield ThreadEntry(thread, folder.name, (stat := file.stat()).st_size, stat.st_mtime_ns)
+
+            for thread, path in compressed:
+                if thread not in threads:  # plain file of the thread overrides the compressed one
+                    yield ThreadEntry(thread, folder.name, get_thread_file_size(path), os.stat(path).st_mtime_ns)  # compression keeps the time
+
+    def find(self, thread: int):
+        """
+        Returns name of the folder with the thread or None if it is missing. Folders are scanned one by one, since they are not indexed.
+        """
+        for folder in sorted(os.scandir(self.root), key = lambda folder: folder.name):
+            if folder.is_dir() and find_thread_file(folder.path, thread) is not None:
+                return folder.name
+
+        return None
+
+    def read(self, thread: int, folder: str = None):
+        if folder is None and (folder := self.find(thread)) is None:
+            return None
+
+        try:
+            return read_thread_file(self._path(thread, folder))  # line endings are kept as they are
+        except FileNotFoundError:
+            return None
+
+    def write(self, thread: int, folder: str, text: str | bytes):
+        if not os.path.isdir(folder_path := os.path.join(self.root, folder)):
+            os.makedirs(folder_path, exist_ok = True)
+
+        write_thread_file(os.path.join(folder_path, THREAD_FILE_NAME.format(thread = thread)), text)
+
+    def remove(self, thread: int, folder: str = None):
+        if folder is None and (folder := self.find(thread)) is None:
+            return
+
+        while (path := find_thread_file(os.path.join(self.root, folder), thread)) is not None:  # the thread may have plain and compressed files
+            os.remove(path)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PackThreadStore:
+    """
+    Threads appended to large segment files, with an index of fixed-size entries which maps each thread to its folder, segment,
+    offset and size. The index is loaded into memory once, so reading a thread takes one seek, and sizes of all threads are known
+    without touching the segments. Entries are never rewritten: a thread written again or removed gets a new entry, which overrides
+    the previous one. Only one process may write to the store at a time.
+    """
+
+    def __init__(self, root: str, segment_size: int = SEGMENT_SIZE):
+        self.root = root
+        self.segment_size = segment_size
+
+        if not os.path.isdir(root):
+            os.makedirs(root, exist_ok = True)
+
+        if not os.path.isfile(index_path := os.path.join(root, PACK_INDEX_NAME)):  # the index marks the folder as a pack
+            open(index_path, 'ab').close()
+
+        self._folders = []
+        self._folder_ids = {}
+        self._entries = {}  # thread -> (folder, segment, offset, size, position of the entry in the index)
+        self._n_entries = 0
+        self._readers = {}
+        self._writer = None
+        self._writer_segment = None
+        self._index = None
+
+        self._load()
+
+    @classmethod
+    def exists(cls, root: str):
+        return os.path.isfile(os.path.join(root, PACK_INDEX_NAME))
+
+    def _segment_path(self, segment: int):
+        return os.path.join(self.root, SEGMENT_NAME.format(segment = segment))
+
+    def _load(self):
+        if os.path.isfile(folders_path := os.path.join(self.root, PACK_FOLDERS_NAME)):
+            with open(folders_path, 'r', encoding = 'utf-8') as file:
+                self._folders = [line[:-1] for line in file if line.endswith('\n')]
+
+            self._folder_ids = {folder: i for i, folder in enumerate(self._folders)}
+
+        with open(index_path := os.path.join(self.root, PACK_INDEX_NAME), 'rb') as file:
+            data = file.read()
+
+        if (tail := len(data) % ENTRY.size) > 0:  # the last entry has been written partially, so the thread it refers to is dropped
+            data = data[:-tail]
+
+            with open(index_path, 'r+b') as file:
+                file.truncate(len(data))
+
+        entries = self._entries
+
+        for position, (thread, folder, segment, offset, size) in enumerate(ENTRY.iter_unpack(data)):
+            entries.pop(thread, None)  # threads are listed in the order of their last write
+
+            if size != REMOVED:
+                entries[thread] = (folder, segment, offset, size, position)
+
+        self._n_entries = len(data) // ENTRY.size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, thread: int):
+        return thread in self._entries
+
+    def entries(self):
+        folders = self._folders
+
+        for thread, (folder, _, _, size, position) in self._entries.items():
+            yield ThreadEntry(thread, folders[folder], size, position)
+
+    def find(self, thread: int):
+        if (entry := self._entries.get(thread)) is None:
+            return None
+
+        return self._folders[entry[0]]
+
+    def size(self, thread: int):
+        if (entry := self._entries.get(thread)) is None:
+            return None
+
+        return entry[3]
+
+    def get_modification_time(self, thread: int):
+        """
+        Returns modification time of the segment with the thread in nanoseconds, which is the closest known time when the thread was written,
+        since the pack doesn't keep modification times of threads.
+        """
+        if (entry := self._entries.get(thread)) is None:
+            return None
+
+        return os.stat(self._segment_path(entry[1])).st_mtime_ns
+
+    def read(self, thread: int, folder: str = None):
+        if (entry := self._entries.get(thread)) is None:
+            return None
+
+        _, segment, offset, size, _ = entry
+
+        if self._writer is not None:
+            self._writer.flush()
+
+        if (reader := self._readers.get(segment)) is None:
+            reader = self._readers[segment] = open(self._segment_path(segment), 'rb')
+
+        reader.seek(offset)
+
+        return reader.read(size).decode('utf-8')
+
+    def _open_writer(self, size: int):
+        if self._writer is None:
+            segment = max((segment for _, segment, _, _, _ in self._entries.values()), default = 0)
+
+            while os.path.isfile(self._segment_path(segment + 1)):  # segments may have been started after the last entry
+                segment += 1
+
+            self._writer = open(self._segment_path(segment), 'ab')
+            self._writer_segment = segment
+            self._index = open(os.path.join(self.root, PACK_INDEX_NAME), 'ab')
+
+        if self._writer.tell() > 0 and self._writer.tell() + size > self.segment_size:
+            self._writer.close()
+            self._writer_segment += 1
+            self._writer = open(self._segment_path(self._writer_segment), 'ab')
+
+        return self._writer
+
+    def _folder_id(self, folder: str):
+        if (folder_id := self._folder_ids.get(folder)) is None:
+            if '\n' in folder:
+                raise ValueError(f'Incorrect folder name: {folder!r}')
+
+            with open(os.path.join(self.root, PACK_FOLDERS_NAME), 'a', encoding = 'utf-8') as file:
+                file.write(f'{folder}\n')
+
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+
+        return folder_id
+
+    def write(self, thread: int, folder: str, text: str | bytes):
+        if (entry := self._entries.get(thread)) is not None and (current_folder := self._folders[entry[0]]) != folder:  # the other copy would be lost
+            raise ValueError(f'Thread {thread} is already packed in folder {current_folder}, remove it before writing it to folder {folder}')
+
+        data = text.encode('utf-8') if isinstance(text, str) else text
+
+        writer = self._open_writer(len(data))
+        offset = writer.tell()
+        writer.write(data)
+
+        entry = (self._folder_id(folder), self._writer_segment, offset, len(data))
+
+        self._index.write(ENTRY.pack(thread, *entry))  # the entry goes after the data, so an interrupted write loses the thread only
+        self._entries.pop(thread, None)
+        self._entries[thread] = (*entry, self._n_entries)
+        self._n_entries += 1
+
+    def remove(self, thread: int, folder: str = None):
+        if (entry := self._entries.pop(thread, None)) is None:
+            return
+
+        self._open_writer(0)
+        self._index.write(ENTRY.pack(thread, entry[0], entry[1], entry[2], REMOVED))
+        self._n_entries += 1
+
+    def close(self):
+        if self._writer is not None:
+            for file in (self._writer, self._index):
+                file.flush()
+                os.fsync(file.fileno())
+                file.close()
+
+            self._writer = self._index = None
+
+        for reader in self._readers.values():
+            reader.close()
+
+        self._readers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_thread_store(root: str):
+    """
+    Returns store of threads in the given folder, which holds either a pack or batch folders with thread files.
+    """
+    return PackThreadStore(root) if PackThreadStore.exists(root) else FolderThreadStore(root)
+
+
+def copy_threads(source, destination):
+    """
+    Copies all threads from one store to another preserving their folders, which converts between batch folders and packs. A pack keeps
+    one copy of each thread, so a thread which is found in several folders is reported before anything is copied to a pack.
+    """
+    n_threads = 0
+    entries = list(source.entries())
+
+    if isinstance(destination, PackThreadStore):
+        folders = {}
+
+        for entry in entries:
+            for folder in (folders.setdefault(entry.thread, entry.folder), destination.find(entry.thread)):
+                if folder is not None and folder != entry.folder:
+                    raise ValueError(f'Thread {entry.thread} is in folders {folder} and {entry.folder}, but a pack keeps one copy of each thread')
+
+    for entry in entries:
+        destination.write(entry.thread, entry.folder, source.read(entry.thread, entry.folder))
+        n_threads += 1
+
+    return n_threads
@@ -1,8 +1,11 @@
 from dataclasses import dataclass
 
+from .Exporter import ThreadStats
+
 
 @dataclass
 class ThreadUpdate:
     i: int
     board: str = None
     updated: bool = True
+    stats: ThreadStats = None  # set if the thread file has been written
@@ -1,8 +1,8 @@
-from requests import post
 from os import environ as env
 
 from rr.util import retry
 
+from .session import post
 from .VkUploader import VkUploader, URL_TEMPLATE, TIMEOUT, API_VERSION
 
 
@@ -2,10 +2,9 @@ from pathlib import Path
 from os import environ as env
 from io import BytesIO, BufferedReader
 
-from requests import post as postt, get
-
 from rr.util import is_image  # , is_video
 
+from .session import post as postt, get
 from .ImageSearchEngine import ImageSearchEngine
 
 from .VkAudioUploader import VkAudioUploader
@@ -1,9 +1,9 @@
-from requests import post
 from os import environ as env
 
 from rr.util import retry
 from .util import post as post_handling_captcha
 
+from .session import post
 from .VkUploader import VkUploader, URL_TEMPLATE, TIMEOUT, API_VERSION
 
 # CAPTCHA_ERROR_CODE = 14
@@ -2,10 +2,9 @@ from pathlib import Path
 from os import environ as env
 from io import BytesIO, BufferedReader
 
-from requests import post, get
-
 from rr.util import is_url, retry
 
+from .session import post, get
 from .VkUploader import VkUploader, URL_TEMPLATE, TIMEOUT, API_VERSION
 
 
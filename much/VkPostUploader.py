@@ -1,9 +1,8 @@
 from os import environ as env
 
-from requests import post
-
 from rr.util import retry
 
+from .session import post
 from .VkUploader import VkUploader, URL_TEMPLATE, TIMEOUT, API_VERSION
 from .PosterUploader import AttachmentType
 
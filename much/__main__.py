@@ -1,14 +1,14 @@
-import re
 import os
 # from io import BytesIO, BufferedReader
 from os import environ as env, listdir
 from pathlib import Path
-from shutil import copyfile, move
+from shutil import move
 from html import unescape
 from multiprocessing import Pool, Lock
-from datetime import datetime, timedelta
 from math import ceil  # , floor
 from time import sleep
+from asyncio import run, get_running_loop
+from functools import partial
 # from random import sample
 import warnings
 import pickle
@@ -16,11 +16,9 @@ import pickle
 warnings.filterwarnings('ignore', category = UserWarning)
 
 from click import group, argument, option, Choice
-from requests import get, post as postt
 from bs4 import BeautifulSoup
 from pandas import DataFrame, read_csv, concat, isna as isnan
 from tqdm import tqdm
-from requests.exceptions import ConnectionError, ChunkedEncodingError
 from flask import Flask
 from karma import CloudMail
 from torch.cuda import OutOfMemoryError
@@ -28,11 +26,12 @@ from torch.cuda import OutOfMemoryError
 from rr import HuggingFaceClient, Task, post_process_summary, truncate_translation
 from rr.alternator import _alternate
 
-from .Fetcher import Fetcher, Topic, SSL_ERROR_DELAY
-from .Exporter import Exporter, Format
-from .Post import Post
-from .util import normalize, SPACE, pull_original_poster, pull_original_posters, \
-    drop_original_poster, find_original_posters, get_file_modification_datetime, find_file, offset_batch_name, BATCH_FOLDER_NAME, make_grabbed_folder_path  # , post_process_summary, truncate_translation
+from .Fetcher import Fetcher, Topic, N_REQUESTS, N_REQUESTS_PER_HOST
+from .Exporter import Exporter, Format, ThreadStats, STATS_COLUMNS
+from .Post import Post, PostRecord
+from .util import pull_original_poster, pull_original_posters, \
+    drop_original_poster, find_original_posters, get_file_modification_datetime, find_file, offset_batch_name, offset_batch_names, BATCH_FOLDER_NAME, make_grabbed_folder_path, \
+    make_grabbed_folder_paths  # , post_process_summary, truncate_translation
 # from .vk import upload_audio
 from .ImageSearchEngine import ImageSearchEngine
 from .nlp import summarize
@@ -45,8 +44,24 @@ from .VkAudioUploader import VkAudioUploader
 from .ArtistSampler import ArtistSampler
 # from .folder import cached_folder
 from .CloudFile import CloudFile
-from .IndexEntry import IndexEntry
+from .IndexEntry import IndexEntry, IndexEntries
 from .ThreadUpdate import ThreadUpdate
+from .ParserBackend import ParserBackend
+from .benchmark import compare_parsers, benchmark_grouping, benchmark_memory, run_suite, record_pages, save_baseline, read_baseline, find_regressions, match_baseline, \
+    MEGABYTE, BASELINE_PATH, REGRESSION_THRESHOLD
+from .RetryPolicy import RetryPolicy, TransientError, RetriesExhaustedError, N_ATTEMPTS
+from .DeadLetterList import DeadLetterList
+from .PageCache import PageCache
+from .PostStore import PostStore
+from .ThreadStore import PackThreadStore, FolderThreadStore, THREAD_FILE_NAME, COMPRESSED_SUFFIX, COMPRESSED_THREAD_SUFFIX, COMPRESSION_LEVEL, DICTIONARY_SIZE, \
+    N_SAMPLES, open_thread_store, copy_threads, find_thread_file, open_thread_file, get_thread_file_size, write_thread_file, copy_thread_file, compress_folder, \
+    decompress_folder, read_thread_file, parse_thread_file_name
+from .arhivach import parse_thread_cards
+from .CorpusExporter import CorpusFormat, SHARD_SIZE, export_corpus
+from .IndexStore import IndexStore, read_index, write_index, find_index_rows, read_index_columns, is_index_column_complete, find_largest_index_rows
+from .IndexSnapshot import IndexSnapshot
+from .IndexJournal import IndexJournal
+from .session import get, post as postt, init_session, decode, get_encoding, POOL_SIZE
 
 
 @group()
@@ -56,16 +71,18 @@ def main():
 
 PATH = 'threads'
 INDEX = 'index.tsv'
+FRESH_INDEX_SUFFIX = '.fresh'  # a new index is collected next to the old one, which is replaced when the new one is complete
 
 THREAD_URL = 'https://2ch.su/b/res/{thread}.html'
+THREAD_JSON_URL = '{root}/res/{{thread}}.json'
+THREAD_AFTER_URL = '{host}/api/mobile/v2/after/{board}/{{thread}}/{{num}}'
+CATALOG_STATE_KEYS = ('posts_count', 'lasthit')  # if these fields of a catalog entry haven't changed, the thread is not pulled again
 # ARHIVACH_THREAD_URL = '{protocol}://arhivach.top/thread/{thread}'
 # ARHIVACH_INDEX_URL = '{protocol}://arhivach.top/index/{offset}'
 ARHIVACH_THREAD_URL = '{protocol}://arhivach.vc/thread/{thread}'
 ARHIVACH_INDEX_URL = '{protocol}://arhivach.vc/index/{offset}'
 ARHIVACH_CACHE_PATH = 'assets/cache.html'
 
-BOARD_NAME_TEMPLATE = re.compile('/[a-zA-Z0-9]+/')
-TIME_TEMPLATE = re.compile('[0-9]+:[0-9]+')
 NEWLINE = '\n'
 
 VK_API_VERSION = '5.199'
@@ -74,7 +91,15 @@ POSTERS_DEFAULT_ROOT = '/tmp/much-images'
 MIN_SUMMARY_LENGTH = 40
 MAX_N_THREADS_IN_BRANCH = 999994
 
+PARSER_CHOICE = Choice(tuple(backend.value for backend in ParserBackend), case_sensitive = True)
+
 empty_list_lock = Lock()
+dead_letter_lock = Lock()
+
+DEAD_LETTER_PATH = 'dead-letters.txt'
+CACHE_PATH = 'cache'
+PACK_PATH = 'threads-pack'
+CORPUS_PATH = 'corpus'
 
 
 def _get_board_name_from_thread_body(thread: BeautifulSoup):
@@ -91,71 +116,47 @@ def _get_board_name_from_thread_body(thread: BeautifulSoup):
     return None
 
 
-def _get_board_name_from_thread_card(thread: BeautifulSoup):
-    for link in (tags := thread.find('div', {'class': 'thread_tags'})).find_all('a'):
-        boards = BOARD_NAME_TEMPLATE.findall(link['title'])
+TIMEOUT = 3600
 
-        if len(boards) > 0:
-            return boards[0]
 
-    print("Can't infer board: ", tags)
+def _make_retry_policy(n_attempts: int, deadline: float):
+    return RetryPolicy(n_attempts = None if n_attempts < 1 else n_attempts, deadline = deadline)
 
-    return None
 
+def _make_cache(path: str, max_size: int):
+    return None if path is None else PageCache(path, None if max_size is None else max_size * 1024 * 1024)
 
-def _decode_date(date: str):
-    normalized = normalize(date).lower()
 
-    if normalized.startswith('сегодн'):
-        return datetime.today().strftime('%d-%m-%Y')
-    elif normalized.startswith('вчера'):
-        return (datetime.today() - timedelta(days = 1)).strftime('%d-%m-%Y')
+def _require_thread_folders(path: str):
+    if PackThreadStore.exists(path):
+        raise ValueError(f'{path} is a pack, threads are written to batch folders only, which can be packed with the pack command afterwards')
 
-    try:
-        day, month, year = normalized.split(SPACE)
-    except ValueError:
-        print(f'Can\'t decode date: {date}')
-        return date
-
-    match month:
-        case 'января':
-            decoded_month = 1
-        case 'февраля':
-            decoded_month = 2
-        case 'марта':
-            decoded_month = 3
-        case 'апреля':
-            decoded_month = 4
-        case 'мая':
-            decoded_month = 5
-        case 'июня':
-            decoded_month = 6
-        case 'июля':
-            decoded_month = 7
-        case 'августа':
-            decoded_month = 8
-        case 'сентября':
-            decoded_month = 9
-        case 'октября':
-            decoded_month = 10
-        case 'ноября':
-            decoded_month = 11
-        case 'декабря':
-            decoded_month = 12
-        case _:
-            raise ValueError(f"Can't infer month from date: {date}")
 
-    try:
-        return f'{int(day):02d}-{decoded_month:02d}-{int(year):04d}'
-    except ValueError:
-        if TIME_TEMPLATE.fullmatch(year):
-            return f'{int(day):02d}-{decoded_month:02d}-{datetime.now().year:04d}'
+def _write_thread_stats(df: DataFrame, index: str, stats: dict[int, ThreadStats], labels: list[int] = None):
+    """
+    Writes statistics of exported threads to the index, stats are keyed by labels of their rows. Only these rows and the rows with the other
+    given labels are written to a database, while a tsv file is written as a whole.
+    """
+    if len(stats) > 0:
+        frame = DataFrame([thread_stats.as_record() for thread_stats in stats.values()], index = list(stats))
 
-        print(f'Can\'t decode date: {date}')
-        return date
+        for column in STATS_COLUMNS:
+            df.loc[frame.index, column] = frame[column]
 
+    if IndexStore.accepts(index):
+        with IndexStore(index) as store:
+            store.upsert(df.loc[sorted({*stats, *(labels or ())})].to_dict(orient = 'records'))
+    else:
+        write_index(df, index)
 
-TIMEOUT = 3600
+
+def _get_page(url: str, timeout: int = TIMEOUT):
+    response = get(url, timeout = timeout)
+
+    if response.status_code != 200 or len(response.content) < 1:
+        raise TransientError(f'Unexpected status code {response.status_code}')
+
+    return decode(response)
 
 
 @main.command()
@@ -163,7 +164,7 @@ TIMEOUT = 3600
 @argument('repo', type = str, default = 'branch')
 @option('--index', '-i', 'index_path', type = str, default = INDEX)
 def split_index(joined_index_path: str, repo: str, index_path: str):
-    df = read_csv(joined_index_path, sep = '\t')
+    df = read_index(joined_index_path)
     df = df[df['repo'] == repo].drop('repo', axis = 1)
 
     df.to_csv(index_path, sep = '\t', index = False)
@@ -172,35 +173,20 @@ def split_index(joined_index_path: str, repo: str, index_path: str):
 @main.command()
 @argument('index_path', type = str, default = INDEX)
 def add_repo_column(index_path: str):
-    n_changed_rows = 0
-
-    def fix_last_branch_batch(folder: str):
-        nonlocal n_changed_rows
-
-        if folder == '00990001-01000000':
-            n_changed_rows += 1
-            return '00990001-00999994'
-        return folder
-
-    n_threads_in_branch = 0
-    n_threads_in_branch2 = 0
-
-    def get_repo_name(folder: str):
-        nonlocal n_threads_in_branch, n_threads_in_branch2
-
-        if int(folder.split('-')[1]) <= 999994:
-            n_threads_in_branch += 1
-            return 'branch'
+    df = read_csv(index_path, sep = '\t')
 
-        n_threads_in_branch2 += 1
-        return 'branch2'
+    last_branch_batch = df['folder'] == '00990001-01000000'
+    df.loc[last_branch_batch, 'folder'] = '00990001-00999994'
 
-    df = read_csv(index_path, sep = '\t')
-    df['folder'] = df['folder'].apply(fix_last_branch_batch)
-    df['repo'] = df['folder'].apply(get_repo_name)
+    in_branch = df['folder'].map({folder: int(folder.split('-')[1]) <= 999994 for folder in df['folder'].unique()})
+    df['repo'] = in_branch.map({True: 'branch', False: 'branch2'})
 
     df.to_csv(index_path, sep = '\t', index = False)
 
+    n_changed_rows = last_branch_batch.sum()
+    n_threads_in_branch = in_branch.sum()
+    n_threads_in_branch2 = df.shape[0] - n_threads_in_branch
+
     print(f'Changed {n_changed_rows} rows')
     print(f'Found {n_threads_in_branch} threads in branch and {n_threads_in_branch2} threads in branch2')
 
@@ -225,7 +211,7 @@ def create_symbolic_links_for_branch_index(batch_size: int, n_threads: int):
 @option('--threads', '-t', 'threads_path', type = str, default = PATH)
 def fix_thread_folder_names(index_path: str, threads_path: str):
     df = read_csv(index_path, sep = '\t')
-    df['folder'] = df['folder'].apply(offset_batch_name)
+    df['folder'] = offset_batch_names(df['folder'])
     df.to_csv(index_path, sep = '\t', index = False)
 
     # git_add_list = []
@@ -246,34 +232,24 @@ def fix_thread_folder_names(index_path: str, threads_path: str):
 @option('--slave-threads', 'slave_threads_path', type = str)
 @option('--batch-size', '-b', type = int, default = 10_000)
 def merge_patches(master_index_path: str, slave_index_path: str, master_threads_path: str, slave_threads_path: str, batch_size: int):
-    master_index = read_csv(master_index_path, sep = '\t')
-    slave_index = read_csv(slave_index_path, sep = '\t')
+    master_index = read_index(master_index_path)
+    slave_index = read_index(slave_index_path)
 
-    master_entries = []
-    master_indexed_threads = {}
+    master_entries = IndexEntries.from_frame(master_index)
+    master_indexed_threads = master_entries.positions()
 
-    master_index_offset = 0
-
-    for _, row in tqdm(tuple(master_index.iterrows()), desc = 'Reading master index'):
-        entry = IndexEntry.from_json(row.to_dict())
-
-        master_entries.append(entry)
-        master_indexed_threads[entry.thread_id] = master_index_offset
-
-        master_index_offset += 1
+    master_index_offset = len(master_entries)
 
     n_updated = 0
     n_inserted = 0
     commands = []
 
-    for _, row in tuple(slave_index.iterrows()):
-        entry = IndexEntry.from_json(row.to_dict())
-
+    for entry in IndexEntries.from_frame(slave_index):
         if (master_entry_index := master_indexed_threads.get(entry.thread_id)) is None:
             offset = master_index_offset // batch_size * batch_size
             batch_max_count = offset + batch_size
 
-            thread_path = None if isnan(entry.folder) else os.path.join(slave_threads_path, entry.folder, f'{entry.thread_id}.txt')
+            thread_path = None if isnan(entry.folder) else find_thread_file(os.path.join(slave_threads_path, entry.folder), entry.thread_id)
             entry.folder = BATCH_FOLDER_NAME.format(first = offset + 1, last = batch_max_count)
 
             print(f'Missing thread {entry.thread_id} in master. Adding to folder {entry.folder}')
@@ -283,32 +259,35 @@ def merge_patches(master_index_path: str, slave_index_path: str, master_threads_
             master_index_offset += 1
 
             if thread_path is None:
-                commands.append(f'touch {os.path.join(master_threads_path, entry.folder, f"{entry.thread_id}.txt")}')
+                commands.append(partial(write_thread_file, os.path.join(master_threads_path, entry.folder, f'{entry.thread_id}.txt'), ''))
                 # with open(os.path.join(master_threads_path, entry.folder, f'{entry.thread_id}.txt'), 'w', encoding = 'utf-8'):
                 #     pass
             else:
-                commands.append(f'cp {thread_path} {os.path.join(master_threads_path, entry.folder, f"{entry.thread_id}.txt")}')
+                commands.append(partial(copy_thread_file, thread_path, os.path.join(master_threads_path, entry.folder, f'{entry.thread_id}.txt')))
 
             n_inserted += 1
         else:
             master_entry = master_entries[master_entry_index]
 
             master_thread_path = os.path.join(master_threads_path, master_entry.folder, f'{master_entry.thread_id}.txt')
-            master_st_size = os.stat(master_thread_path).st_size
+            master_st_size = get_thread_file_size(find_thread_file(os.path.dirname(master_thread_path), master_entry.thread_id) or master_thread_path)
 
             if isnan(entry.folder):
                 thread_path = None
                 thread_st_size = 0
             else:
-                thread_path = os.path.join(slave_threads_path, entry.folder, f'{entry.thread_id}.txt')
-                thread_st_size = os.stat(thread_path).st_size
+                thread_path = find_thread_file(slave_folder_path := os.path.join(slave_threads_path, entry.folder), entry.thread_id)
+                thread_st_size = get_thread_file_size(thread_path or os.path.join(slave_folder_path, f'{entry.thread_id}.txt'))
 
             if thread_st_size > master_st_size:
                 print(f'Slave\'s thread {entry.thread_id} is larger than master\'s ({thread_st_size} > {master_st_size})')
                 entry.folder = master_entry.folder
 
-                master_entries[master_entry_index] = entry
-                commands.append(f'cp {thread_path} {master_thread_path}')
+                if entry.board is None:  # the slave index may have no boards
+                    entry.board = master_entry.board
+
+                master_entries[master_entry_index] = entry  # other columns, such as thread statistics, are taken from the slave with its file
+                commands.append(partial(copy_thread_file, thread_path, master_thread_path))
 
                 n_updated += 1
 
@@ -319,13 +298,11 @@ def merge_patches(master_index_path: str, slave_index_path: str, master_threads_
         return
 
     for command in commands:
-        os.system(command)
-
-    records = [entry.as_record() for entry in master_entries]
+        command()
 
-    df = DataFrame(records)
+    df = master_entries.to_frame()
     print(df)
-    df.to_csv(master_index_path, sep = '\t', index = False)
+    write_index(df, master_index_path)
 
 
 @main.command()
@@ -337,20 +314,14 @@ def merge_patches(master_index_path: str, slave_index_path: str, master_threads_
 def create_missing_index_entries(index_path: str, threads_path: str, mtime_path: str, batch_size: int, target_path: str):
     index = read_csv(index_path, sep = '\t')
 
-    indexed_threads = set()
-    entries = []
-
-    for _, row in tqdm(tuple(index.iterrows()), desc = 'Reading index'):
-        entry = IndexEntry.from_json(row.to_dict())
-
-        entries.append(entry)
-        indexed_threads.add(entry.thread_id)
+    entries = IndexEntries.from_frame(index)
+    indexed_threads = set(entries.thread_ids)
 
     n_matched_entries = 0
     n_missing_index_entries = 0
 
     for file in tqdm(os.listdir(threads_path), desc = 'Handling threads'):
-        if not file.endswith('txt'):
+        if not file.endswith('txt') and not file.endswith(COMPRESSED_THREAD_SUFFIX):
             continue
 
         thread_id = int(file.split('.')[0])
@@ -380,7 +351,7 @@ def create_missing_index_entries(index_path: str, threads_path: str, mtime_path:
 
                 timestamp = get_file_modification_datetime(files[-1])
 
-            with open(os.path.join(threads_path, file), 'r') as f:
+            with open_thread_file(os.path.join(threads_path, file), newline = None) as f:
                 title = f.readline().strip()
 
             entries.append(
@@ -402,9 +373,10 @@ def create_missing_index_entries(index_path: str, threads_path: str, mtime_path:
     if response != 'Y':
         print('Cancelling the operation')
 
-    records = []
+    order = entries.argsort()
 
-    for i, entry in enumerate(sorted(entries, key = lambda entry: entry.timestamp)):
+    for i, position in enumerate(order):
+        entry = entries[position]
         offset = i // batch_size * batch_size
 
         folder = BATCH_FOLDER_NAME.format(first = offset + 1, last = offset + batch_size)
@@ -413,12 +385,14 @@ def create_missing_index_entries(index_path: str, threads_path: str, mtime_path:
         if not os.path.isdir(folder_path):
             os.mkdir(folder_path)
 
-        os.system(f'cp {os.path.join(threads_path, str(entry.thread_id) + ".txt")} {folder_path}')
+        if (thread_path := find_thread_file(threads_path, entry.thread_id)) is None:
+            print(f'Can\'t find thread {entry.thread_id} in {threads_path}')
+        else:
+            copy_thread_file(thread_path, os.path.join(folder_path, f'{entry.thread_id}.txt'))
 
-        entry.folder = folder
-        records.append(entry.as_record())
+        entries.folders[position] = folder
 
-    df = DataFrame(records)
+    df = entries.to_frame(order)
     df.to_csv(index_path, sep = '\t', index = False)
 
 
@@ -641,7 +615,7 @@ def cleanup(root: str, username: str, password: str, batch_size: int, cookies: s
 
 @main.command()
 @argument('path', default = 'alternation-list.txt')
-@argument('threads', default = 'threads')
+@argument('threads', default = 'threads')  # root folder with threads or the pack with them
 @argument('alternated', default = 'audible')
 @option('--artist-one', '-a1', help = 'first artist to say the replic', default = 'xenia')
 @option('--artist-two', '-a2', help = 'second artist to say the replic', default = 'baya')
@@ -666,6 +640,7 @@ def alternate(path: str, threads: str, alternated: str, artist_one: str, artist_
     # 2. Check which threads are no longer available, and alternate them
 
     vk_client = VkClient(interactive = interactive)
+    thread_store = open_thread_store(threads)
 
     # hf_client = HuggingFaceClient(hf_cache = 'hf-cache', local = True, device = 0)
     hf_client = HuggingFaceClient(local = True, device = 0)
@@ -685,24 +660,15 @@ def alternate(path: str, threads: str, alternated: str, artist_one: str, artist_
 
             print(f'Handling thread {thread} as {target_txt_path} ({i} / {n_entries})...')
             i += 1
-            found_thread = False
 
             if not os.path.isfile(target_txt_path):
-                for batch_path in os.listdir(threads):
-                    # print(batch_path)
-                    for file in os.listdir(batch_full_path := os.path.join(threads, batch_path)):
-                        # print(file, thread)
-                        if file.startswith(thread):
-                            copyfile(os.path.join(batch_full_path, file), target_txt_path)
-                            found_thread = True
-                            break
-                    if found_thread:
-                        break
-
-                if not found_thread:
+                if (text := thread_store.read(int(thread))) is None:
                     print(f'Can\'t find thread {thread}. Skipping...')
                     continue
 
+                with open(target_txt_path, 'w', encoding = 'utf-8', newline = '') as file:
+                    file.write(text)
+
             with open(target_txt_path, 'r', encoding = 'utf-8') as file:
                 first_post = file.readline()[:-1]
 
@@ -765,18 +731,25 @@ def alternate(path: str, threads: str, alternated: str, artist_one: str, artist_
 
 
 @main.command()
-@option('--threads', '-t', help = 'Path to the root folder with threads', default = 'threads')
-def list_empty_threads(threads: str):
-    batch_paths = os.listdir(threads)
-
+@option('--threads', '-t', help = 'Path to the root folder with threads or to the pack with them', default = 'threads')
+@option('--index', '-i', help = 'Path to the index, sizes of threads are taken from it if they have been recorded for all threads', default = INDEX)
+@option('--scan', '-s', is_flag = True, help = 'Count empty thread files instead of reading sizes from the index')
+def list_empty_threads(threads: str, index: str, scan: bool):
     n_threads = 0
     n_empty_threads = 0
 
-    for batch_path in tqdm(batch_paths):
-        for thread in os.listdir(batch_full_path := os.path.join(threads, batch_path)):
-            file_stat = os.stat(os.path.join(batch_full_path, thread))
+    if not scan and (IndexStore.accepts(index) or os.path.isfile(index)) and is_index_column_complete(index, 'size'):
+        sizes = read_index_columns(index, ('size', ))['size'].dropna()  # rows without sizes have no thread files
+
+        n_threads = sizes.shape[0]
+        n_empty_threads = (sizes < 1).sum()
+
+        print(f'{n_empty_threads} / {n_threads} threads are empty ({100 * n_empty_threads / max(n_threads, 1):.3f}%)')
+        return
 
-            if file_stat.st_size < 1:
+    with open_thread_store(threads) as store:
+        for entry in tqdm(store.entries()):
+            if entry.size < 1:
                 n_empty_threads += 1
 
             n_threads += 1
@@ -784,6 +757,121 @@ def list_empty_threads(threads: str):
     print(f'{n_empty_threads} / {n_threads} threads are empty ({100 * n_empty_threads / n_threads:.3f}%)')
 
 
+@main.command()
+@argument('threads', type = str, default = PATH)
+@argument('pack', type = str, default = PACK_PATH)
+def pack(threads: str, pack: str):
+    """
+    Appends threads from batch folders to the pack, threads which are already packed are replaced.
+    """
+    with PackThreadStore(pack) as store:
+        n_threads = copy_threads(FolderThreadStore(threads), store)
+
+    print(f'Packed {n_threads} threads into {pack}')
+
+
+@main.command()
+@argument('pack', type = str, default = PACK_PATH)
+@argument('threads', type = str, default = PATH)
+def unpack(pack: str, threads: str):
+    """
+    Writes threads from the pack to batch folders, one file per thread.
+    """
+    with PackThreadStore(pack) as store:
+        n_threads = copy_threads(store, FolderThreadStore(threads))
+
+    print(f'Unpacked {n_threads} threads into {threads}')
+
+
+@main.command()
+@argument('threads', type = str, default = PATH)
+@option('--level', '-l', type = int, help = 'zstd compression level', default = COMPRESSION_LEVEL)
+@option('--dictionary-size', '-d', type = int, help = 'max size of the dictionary trained for each folder in bytes', default = DICTIONARY_SIZE)
+@option('--n-samples', '-n', type = int, help = 'number of threads in each folder on which the dictionary is trained', default = N_SAMPLES)
+def compress(threads: str, level: int, dictionary_size: int, n_samples: int):
+    """
+    Compresses thread files in each batch folder with a dictionary trained on the threads of this folder.
+    """
+    n_threads = n_bytes = n_compressed_bytes = 0
+
+    for folder in tqdm(sorted(entry.path for entry in os.scandir(threads) if entry.is_dir()), desc = 'Compressing folders'):
+        n_folder_threads, n_folder_bytes, n_folder_compressed_bytes = compress_folder(folder, level, dictionary_size, n_samples)
+
+        n_threads += n_folder_threads
+        n_bytes += n_folder_bytes
+        n_compressed_bytes += n_folder_compressed_bytes
+
+    print(
+        f'Compressed {n_threads} threads from {n_bytes / 1024 / 1024:.2f} MB to {n_compressed_bytes / 1024 / 1024:.2f} MB' +
+        ('' if n_compressed_bytes < 1 else f' ({n_bytes / n_compressed_bytes:.2f}x)')
+    )
+
+
+@main.command()
+@argument('threads', type = str, default = PATH)
+def decompress(threads: str):
+    """
+    Replaces compressed thread files in each batch folder with plain ones.
+    """
+    n_threads = 0
+
+    for folder in tqdm(sorted(entry.path for entry in os.scandir(threads) if entry.is_dir()), desc = 'Decompressing folders'):
+        n_threads += decompress_folder(folder)
+
+    print(f'Decompressed {n_threads} threads')
+
+
+@main.command(name = 'index-import')
+@argument('source', type = str, default = INDEX)
+@argument('destination', type = str, default = 'index.db')
+def index_import(source: str, destination: str):
+    """
+    Replaces content of the index database with rows from the tsv file.
+    """
+    with IndexStore(destination) as store:
+        n_rows = store.import_tsv(source)
+
+    print(f'Imported {n_rows} rows into {destination}')
+
+
+@main.command(name = 'index-export')
+@argument('source', type = str, default = 'index.db')
+@argument('destination', type = str, default = INDEX)
+def index_export(source: str, destination: str):
+    """
+    Writes rows of the index database to the tsv file, which has the same columns as the imported one.
+    """
+    with IndexStore(source) as store:
+        store.export_tsv(destination)
+
+
+@main.command(name = 'index-compact')
+@argument('index', type = str, default = INDEX)
+def index_compact(index: str):
+    """
+    Folds the journal with rows appended by filter into the tsv index.
+    """
+    n_rows = IndexJournal(index).compact()
+
+    print(f'Index {index} contains {n_rows} rows')
+
+
+@main.command(name = 'export-corpus')
+@argument('output', type = str, default = CORPUS_PATH)
+@option('--index', '-i', type = str, default = INDEX)
+@option('--threads', '-t', type = str, help = 'path to the root folder with threads or to the pack with them', default = PATH)
+@option('--format', '-f', 'format_', type = Choice(tuple(format.value for format in CorpusFormat), case_sensitive = True), default = CorpusFormat.JSONL.value)
+@option('--shard-size', '-s', type = int, help = 'max size of thread texts in a shard in megabytes', default = SHARD_SIZE // 1024 // 1024)
+@option('--n-workers', '-n', type = int, help = 'number of processes writing shards', default = 4)
+def export_corpus_(output: str, index: str, threads: str, format_: str, shard_size: int, n_workers: int):
+    """
+    Exports threads with their index entries to shards, threads which have not changed since the previous export are skipped.
+    """
+    paths, n_threads = export_corpus(read_index(index), threads, output, CorpusFormat(format_), shard_size * 1024 * 1024, n_workers)
+
+    print(f'Exported {n_threads} threads to {len(paths)} shards in {output}')
+
+
 @main.command()
 @option('--source', '-s', default = 'index.tsv')
 @option('--destination', '-d', default = 'index-with-folder.tsv')
@@ -793,7 +881,7 @@ def list_empty_threads(threads: str):
 def update_folder_column(source: str, destination: str, batch_size: int, threads: str, pretend: bool):
     df = read_csv(source, sep = '\t')
 
-    df['folder'] = df.index.to_series().apply(lambda i: make_grabbed_folder_path(i, batch_size, threads).split('/')[-1])
+    df['folder'] = make_grabbed_folder_paths(df.index.to_series(), batch_size)
     df.sort_values(by = ['thread'], inplace = True)
 
     if not pretend:
@@ -807,41 +895,48 @@ def update_folder_column(source: str, destination: str, batch_size: int, threads
 @option('--threads', '-t', help = 'Path to the root folder with threads', default = 'threads')
 @option('--pretend', '-p', is_flag = True)
 def sort(source: str, destination: str, batch_size: int, threads: str, pretend: bool):
-    df = read_csv(source, sep = '\t')
+    df = read_index(source)
 
     if 'folder' not in df.columns:
-        df['folder'] = df.index.to_series().apply(lambda i: make_grabbed_folder_path(i, batch_size, threads))
+        df['folder'] = make_grabbed_folder_paths(df.index.to_series(), batch_size, threads)
     else:
         thread_id_to_folder = {}
 
         for root, dirs, files in os.walk(threads):
             for name in files:
-                thread_id_to_folder[int(name.split('.')[0])] = root
+                if (thread := parse_thread_file_name(name)) is not None:  # folders with compressed threads also hold dictionaries
+                    thread_id_to_folder[thread] = root
 
         # df['folder'] = df.apply(lambda cell: detect_folder(threads, cell['thread']) if isinstance(cell.get('folder'), float) else os.path.join(threads, cell['folder']))
-        df['folder'] = df.apply(lambda cell: os.path.join(threads, cell['folder']) if isinstance(cell['folder'], str) else thread_id_to_folder[cell['thread']], axis = 1)
+        folders = df['folder'].map({folder: os.path.join(threads, folder) for folder in df['folder'].dropna().unique()})
+        df['folder'] = folders.where(folders.notna(), df['thread'].map(thread_id_to_folder))
 
     df.sort_values(by = ['thread'], inplace = True)
 
-    for i, row in df.iterrows():
-        folder_after_sorting = make_grabbed_folder_path(i, batch_size, threads)
-        folder_before_sorting = row['folder']
-        thread = row['thread']
+    folders_after_sorting = make_grabbed_folder_paths(df.index.to_series(), batch_size, threads)  # folders are assigned by positions of rows before sorting
+    moved = df['folder'] != folders_after_sorting
 
-        thread_path_before_sorting = os.path.join(folder_before_sorting, f'{thread:08d}.txt')
-        thread_path_after_sorting = os.path.join(folder_after_sorting, f'{thread:08d}.txt')
+    for thread, folder_before_sorting, folder_after_sorting in zip(df.loc[moved, 'thread'], df.loc[moved, 'folder'], folders_after_sorting[moved]):
+        if (thread_path_before_sorting := find_thread_file(folder_before_sorting, thread)) is None:
+            print(f'Can\'t find thread {thread} in {folder_before_sorting}')
+            continue
+
+        thread_path_after_sorting = os.path.join(folder_after_sorting, os.path.basename(thread_path_before_sorting).removesuffix(COMPRESSED_SUFFIX))
 
         # if os.path.isfile(thread_path_before_sorting):
         #     print(thread_path_before_sorting)
 
-        if folder_after_sorting != folder_before_sorting:  # and os.path.isfile(thread_path_before_sorting):
-            print(thread_path_before_sorting, '->', thread_path_after_sorting)
-            if not pretend:
+        print(thread_path_before_sorting, '->', thread_path_after_sorting)
+        if not pretend:
+            if thread_path_before_sorting.endswith(COMPRESSED_SUFFIX):  # folders have different dictionaries, so the thread is decompressed
+                copy_thread_file(thread_path_before_sorting, thread_path_after_sorting)
+                os.remove(thread_path_before_sorting)
+            else:
                 move(thread_path_before_sorting, thread_path_after_sorting)
 
     if not pretend:
-        df['folder'] = df.index.to_series().apply(lambda i: make_grabbed_folder_path(i, batch_size))
-        df.to_csv(destination, sep = '\t', index = False)
+        df['folder'] = make_grabbed_folder_paths(df.index.to_series(), batch_size)
+        write_index(df, destination)
 
 
 @main.command()
@@ -854,74 +949,72 @@ def sort(source: str, destination: str, batch_size: int, threads: str, pretend:
 @option('--step', '-t', type = int, default = 25)
 @option('--protocol', '-r', type = Choice(('http', 'https'), case_sensitive = True), default = 'http')
 @option('--batch-size', '-b', default = 10_000)
-def filter(url: str, start: int, debug: bool, n_top: int, index: str, step: int, protocol: str, batch_size: int):
-    records = []
-
-    if index is None:
-        content = None
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--n-attempts', '-m', type = int, help = 'max number of attempts to fetch a page, 0 means no limit', default = N_ATTEMPTS)
+@option('--deadline', '-x', type = float, help = 'max number of seconds spent on fetching a page', default = None)
+@option('--dead-letter-path', '-e', type = str, help = 'file with pages which could not be fetched', default = DEAD_LETTER_PATH)
+@option('--compact-index', '-c', is_flag = True, help = 'fold the journal with new records into the index file when finished')
+def filter(
+    url: str, start: int, debug: bool, n_top: int, index: str, step: int, protocol: str, batch_size: int, parser: str, n_attempts: int, deadline: float,
+    dead_letter_path: str, compact_index: bool
+):
+    parser = ParserBackend.make(parser)
+    retry_policy = _make_retry_policy(n_attempts, deadline)
+    dead_letters = DeadLetterList(dead_letter_path)
+
+    store = None if index is None or not IndexStore.accepts(index) else IndexStore(index)
+    fresh = index is None  # the index is written from scratch
+
+    if fresh:
         seen_keys = set()
         index_offset = 0
+
+        index = INDEX
+        journal = IndexJournal(index + FRESH_INDEX_SUFFIX)  # readers of the old index don't see the journal of the new one
+        journal.clear()
+    elif store is not None:
+        seen_keys = store.threads()
+        index_offset = len(store)
     else:
-        content = read_csv(index, sep = '\t')
+        content = read_index(index)
         seen_keys = set(content.thread)
         index_offset = content.shape[0]
 
         if len(seen_keys) != content.shape[0]:
             raise ValueError(f'Input index contains duplicates ({len(seen_keys)} != {content.shape[0]})')
 
-    if index is None:
-        index = 'index.tsv'
+        journal = IndexJournal(index)
 
     def handle_page(page: str, pbar: tqdm):
         nonlocal index_offset
 
-        bs = BeautifulSoup(page, 'html.parser')
-
-        for thread in bs.find_all('tr')[1:][::-1]:
-            _text = thread.find('div', {'class': 'thread_text'})
-            key = int(_text.find('a')['href'].split('/')[2])
-
-            if key in seen_keys:
-                # print(f'skipping thread {key} which has already been handled')
-                continue
-
-            seen_keys.add(key)
-
-            text = normalize(_text.get_text(separator = SPACE))
-            n_stars = int(thread.find('span', {'class': 'thread_posts_count'}).text)
+        records = []
 
-            date = _decode_date(thread.find('td', {'class': 'thread_date'}).text)
+        for card in parse_thread_cards(parser.parse(page), seen_keys):
+            seen_keys.add(key := card['thread'])
 
-            board = _get_board_name_from_thread_card(thread)
+            date = card['date']
             folder = make_grabbed_folder_path(index_offset, batch_size)
             repo = 'branch' if index_offset < MAX_N_THREADS_IN_BRANCH else 'branch2'
 
             pbar.set_description(f'{folder}/{key} @ {repo} {date}')
 
             records.append({
-                'thread': key,
-                'title': text,
-                'date': date,
-                'board': board,
-                'stars': n_stars,
+                **card,
                 'folder': folder,
                 'repo': repo
             })
             index_offset += 1
 
-    def save():
-        df = DataFrame.from_records(records)
-        if content is None:
-            df.to_csv(index, sep = '\t', index = False)
+        if store is None:  # records of each page are saved as soon as the page is handled
+            journal.append(records)
         else:
-            concat([content, df]).to_csv(index, sep = '\t', index = False)
+            store.upsert(records)
 
     if os.path.isfile(ARHIVACH_CACHE_PATH) and debug:
         with open(ARHIVACH_CACHE_PATH, encoding = 'utf-8', mode = 'r') as file:
             page = file.read()
         handle_page(page)
-
-        save()
     else:
         i = 0
         offset = start
@@ -929,29 +1022,13 @@ def filter(url: str, start: int, debug: bool, n_top: int, index: str, step: int,
         pbar = tqdm(total = ceil(start / step) if n_top is None else n_top)
 
         while (n_top is None or i < n_top) and (offset >= 0):
-            response = None
-
-            while response is None or response.status_code != 200 or (len(response.text) < 1):
-                # try:
-
-                # print(response)
-
-                try:
-                    response = get(url.format(protocol = protocol, offset = offset), timeout = TIMEOUT)
-                except (ConnectionError, ChunkedEncodingError) as e:
-                    print(f'Encountered error when fetching page wit offset {offset}: {e}. Waiting for {SSL_ERROR_DELAY} before retrying...')
-                    sleep(SSL_ERROR_DELAY)
-                    print('Retrying...')
-                    response = None
-                # code = response.status_code
+            page_url = url.format(protocol = protocol, offset = offset)
 
-                # if (code := response.status_code) != 200:
-                #     raise ValueError(f'Inacceptable status code: {code}')
-
-            handle_page(response.text, pbar)
-
-            if i % 100 == 0:
-                save()
+            try:
+                handle_page(retry_policy.run(partial(_get_page, page_url), page_url), pbar)
+            except RetriesExhaustedError as e:
+                print(f'⚫ {e}')
+                dead_letters.append(offset, e.error)
 
             i += 1
             offset -= step
@@ -961,7 +1038,13 @@ def filter(url: str, start: int, debug: bool, n_top: int, index: str, step: int,
             #     with open(ARHIVACH_CACHE_PATH, encoding = 'utf-8', mode = 'w') as file:
             #         file.write(page)
 
-        save()
+    if store is not None:
+        store.close()
+    elif compact_index or fresh:
+        journal.compact(replace_base = fresh)
+
+        if fresh:
+            os.replace(journal.index_path, index)
 
 
 @main.command()
@@ -1001,8 +1084,36 @@ def drop_image(thread: str, root: str):
 @option('--batch-size', '-b', help = 'how many threads to put in a folder', default = 10000)
 @option('--top-n', '-n', type = int, help = 'handle only first n entries', default = None)
 @option('--poster-root', '-r', type = str, default = POSTERS_DEFAULT_ROOT)
-def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_root: str):
-    last_records_list = read_csv(index, sep = '\t').to_dict(orient = 'records') if os.path.isfile(index) else None
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--html', '-l', is_flag = True, help = 'scrape thread pages instead of pulling threads in json format')
+@option('--n-attempts', '-m', type = int, help = 'max number of attempts to fetch a thread, 0 means no limit', default = N_ATTEMPTS)
+@option('--deadline', '-x', type = float, help = 'max number of seconds spent on fetching a thread', default = None)
+@option('--dead-letter-path', '-e', type = str, help = 'file with threads which could not be fetched', default = DEAD_LETTER_PATH)
+@option('--cache', '-c', type = str, help = 'path to the folder with cached pages, if not set the pages are not cached', default = None)
+@option('--cache-size', '-z', type = int, help = 'max size of cached pages in megabytes', default = None)
+@option('--posts-root', '-s', type = str, help = 'path to the folder with posts of open threads, if set only new posts are pulled', default = None)
+@option('--force', '-f', is_flag = True, help = 'pull threads even if their catalog entries have not changed')
+@option('--n-workers', '-w', type = int, help = 'number of processes which parse parts of large thread pages, if not set pages are parsed in one process', default = None)
+@option('--sync', '-y', is_flag = True, help = 'flush thread files to disk before they replace existing files')
+@option('--group-size', '-g', type = int, help = 'number of thread files which are flushed to disk at once, requires --sync', default = 1)
+def load(
+    url: str, path: str, index: str, batch_size: int, top_n: int, poster_root: str, parser: str, html: bool, n_attempts: int, deadline: float, dead_letter_path: str,
+    cache: str, cache_size: int, posts_root: str, force: bool, n_workers: int, sync: bool, group_size: int
+):
+    _require_thread_folders(path)
+
+    parser = ParserBackend.make(parser)
+    dead_letters = DeadLetterList(dead_letter_path)
+    root = url.rsplit('/', maxsplit = 1)[0]
+    thread_url = THREAD_URL if html else THREAD_JSON_URL.format(root = root)
+
+    if posts_root is not None and html:
+        raise ValueError('Only new posts can be pulled in json format')
+
+    post_store = None if posts_root is None else PostStore(posts_root)
+    thread_after_url = THREAD_AFTER_URL.format(host = (host_and_board := root.rsplit('/', maxsplit = 1))[0], board = host_and_board[1])
+    store = IndexStore(index) if IndexStore.accepts(index) else None
+    last_records_list = read_index(index).to_dict(orient = 'records') if store is None and (os.path.isfile(index) or IndexJournal(index).exists()) else None
     last_records = None if last_records_list is None else {
         item['thread']: item
         for item in last_records_list
@@ -1023,6 +1134,10 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
     records_list = []
     records = {}
 
+    if store is not None:  # only rows of threads from the catalog and of open threads are read
+        last_records_list = [*store.get_rows(thread['num'] for thread in json['threads']), *store.rows(is_open = True)]
+        last_records = {item['thread']: item for item in last_records_list}
+
     offset = 0
     batch_max_count = offset + batch_size
 
@@ -1039,7 +1154,7 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
             batch_folder_size = None
 
             if os.path.isdir(batch_folder_path):
-                batch_folder_size = len(os.listdir(batch_folder_path))
+                batch_folder_size = len({thread for name in os.listdir(batch_folder_path) if (thread := parse_thread_file_name(name)) is not None})
 
                 if batch_folder_size < batch_size:  # Found an existing folder which is not full
                     break
@@ -1052,11 +1167,28 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
 
     refresh_batch_folder_path()
 
-    fetcher = Fetcher()
-    exporter = Exporter()
+    fetcher = Fetcher(parser, retry_policy = _make_retry_policy(n_attempts, deadline), cache = _make_cache(cache, cache_size), n_workers = n_workers)
+    exporter = Exporter(sync, group_size)
+
+    def pull_new_posts(thread_id: int):
+        posts = post_store.read(thread_id)
+        new_posts = None
+
+        if posts:
+            new_posts = fetcher.pull_posts_after(thread_after_url.format(thread = thread_id, num = posts[-1]['num'] + 1))
+
+        if new_posts is None:  # either the thread is new or its posts can't be listed starting from the last stored one
+            posts = []
+
+            if (new_posts := fetcher.pull_posts(thread_url.format(thread = thread_id))) is None:
+                print(f'🔵 Thread {thread_id} does not exist. Skipping...')
+                return []
+
+        return fetcher.group([PostRecord.from_json(post) for post in post_store.extend(thread_id, posts, new_posts)], thread_url.format(thread = thread_id))
 
     n_indexed = 0
     n_exported = 0
+    n_skipped = 0
 
     for thread in tqdm(json['threads'] if top_n is None else json['threads'][:top_n]):
         day, month, year = thread['date'].split(' ')[0].split('/')
@@ -1075,19 +1207,38 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
                 pass
             last_batch_folder_name = last_record['folder']
 
+        if (
+            not force and last_thread_path is not None and (os.path.isfile(last_thread_path) or os.path.isfile(last_thread_path + COMPRESSED_SUFFIX)) and
+            all(last_record.get(key) == thread.get(key) for key in CATALOG_STATE_KEYS)
+        ):  # If thread has not changed since the last run
+            records_list.append(last_record)
+            records[thread_id] = last_record
+            n_indexed += 1
+            n_skipped += 1
+            continue
+
         if last_thread_path is None and batch_folder_size >= batch_size:  # If thread has not been associated with a folder, and number of files in current folder reached maximum, then create new
             refresh_batch_folder_path()
 
-        topics = fetcher.fetch(THREAD_URL.format(thread = thread_id))
+        try:
+            if post_store is None:
+                topics = fetcher.fetch(thread_url.format(thread = thread_id))
+            else:
+                topics = pull_new_posts(thread_id)
+        except RetriesExhaustedError as e:
+            print(f'⚫ {e}')
+            dead_letters.append(thread_id, e.error)
+            topics = None
         # is_empty = len(topics) < 1
 
         records_list.append(
             record := {
                 'thread': thread_id,
                 'date': f'{day}-{month}-20{year}',
-                'title': Post.from_body(BeautifulSoup(thread['comment'], 'html.parser'))[1].text,
+                'title': Post.from_record(PostRecord.from_json(thread))[1].text,
                 'folder': batch_folder_name if last_batch_folder_name is None else last_batch_folder_name,
-                'open': True
+                'open': True,
+                **{key: None if topics is None else thread.get(key) for key in CATALOG_STATE_KEYS}  # failed threads are pulled again on the next run
             }
         )
         n_indexed += 1
@@ -1096,12 +1247,16 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
         #     print(f'Empty thread {thread_id}')
         #     continue
 
-        exporter.export(
-            topics,
-            format = Format.TXT,
-            path = (os.path.join(batch_folder_path, f'{thread_id}.txt') if last_thread_path is None else last_thread_path)
-        )
-        n_exported += 1
+        if topics is not None:
+            stats = exporter.export(
+                topics,
+                format = Format.TXT,
+                path = (os.path.join(batch_folder_path, f'{thread_id}.txt') if last_thread_path is None else last_thread_path)
+            )
+            n_exported += 1
+
+            if stats is not None:
+                record.update(stats.as_record())
 
         records[thread_id] = record
 
@@ -1112,38 +1267,64 @@ def load(url: str, path: str, index: str, batch_size: int, top_n: int, poster_ro
     n_closed = 0
     n_existing = 0
 
+    updated_records = []
+
     if last_records is None:
         df = DataFrame.from_records(records_list)
     else:
         for thread, item in last_records.items():
             if thread not in records and item['open'] is True:
                 item['open'] = False
+                updated_records.append(item)
                 n_closed += 1
 
+                if post_store is not None:
+                    post_store.drop(thread)
+
         for thread, item in records.items():
             if thread not in last_records:
                 last_records_list.append(item)
+                updated_records.append(item)
                 n_new += 1
             else:
+                for key in (*CATALOG_STATE_KEYS, *(column for column in STATS_COLUMNS if column in item)):
+                    last_records[thread][key] = item[key]
+
+                updated_records.append(last_records[thread])
                 n_existing += 1
 
-        df = DataFrame(last_records_list)
+        df = None if store is not None else DataFrame(last_records_list)
+
+    fetcher.close()
+    exporter.commit()  # thread files are written before the index which refers to them
 
-    print(f'Indexed = {n_indexed}, Exported = {n_exported}, New = {n_new}, Existing = {n_existing}, Closed = {n_closed}')
+    print(f'Indexed = {n_indexed}, Exported = {n_exported}, Skipped = {n_skipped}, New = {n_new}, Existing = {n_existing}, Closed = {n_closed}')
 
-    df.to_csv(index, sep = '\t', index = False)
+    if store is None:
+        write_index(df, index)
+    else:
+        store.upsert(updated_records)  # rows of threads which are neither in the catalog nor open are not touched
+        store.close()
 
 
 @main.command()
 @argument('url', type = str)
 @argument('path', type = str)
-def pull(url: str, path: str):
-    topics = Fetcher().fetch(url)
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--cache', '-c', type = str, help = 'path to the folder with cached pages, if not set the pages are not cached', default = None)
+@option('--cache-size', '-z', type = int, help = 'max size of cached pages in megabytes', default = None)
+@option('--stream', '-s', is_flag = True, help = 'parse the page while it is being pulled, without keeping it in memory')
+@option('--memory-budget', '-b', type = int, help = 'max size of post texts kept in memory in the streaming mode in megabytes', default = 64)
+@option('--n-workers', '-w', type = int, help = 'number of processes which parse parts of the page, if not set the page is parsed in one process', default = None)
+@option('--compact', '-k', is_flag = True, help = 'write json without indentation')
+def pull(url: str, path: str, parser: str, cache: str, cache_size: int, stream: bool, memory_budget: int, n_workers: int, compact: bool):
+    with Fetcher(ParserBackend.make(parser), cache = _make_cache(cache, cache_size), n_workers = n_workers) as fetcher:
+        topics = fetcher.stream(url, memory_budget * MEGABYTE) if stream else fetcher.fetch(url)
 
     exporter = Exporter()
 
     if path.endswith(Format.JSON.value):
-        exporter.export(topics, Format.JSON, path)
+        exporter.export(topics, Format.JSON, path, compact = compact)
     elif path.endswith(Format.TXT.value):
         exporter.export(topics, Format.TXT, path)
     else:
@@ -1156,6 +1337,128 @@ def pull(url: str, path: str):
     #     print()
 
 
+@main.command()
+@argument('urls', type = str, nargs = -1)
+@option('--input', '-i', 'input_path', type = str, help = 'file with urls to pull, one url per line', default = None)
+@option('--path', '-p', type = str, help = 'path to the directory which will contain pulled files', default = PATH)
+@option('--format', '-f', 'format_', type = Choice(tuple(format_.value for format_ in Format)), default = Format.TXT.value)
+@option('--n-requests', '-n', type = int, help = 'max number of requests in flight', default = N_REQUESTS)
+@option('--n-requests-per-host', '-h', type = int, help = 'max number of requests in flight to the same host', default = N_REQUESTS_PER_HOST)
+@option('--n-workers', '-w', type = int, help = 'number of processes which parse pulled pages', default = None)
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--n-attempts', '-m', type = int, help = 'max number of attempts to fetch a thread, 0 means no limit', default = N_ATTEMPTS)
+@option('--deadline', '-x', type = float, help = 'max number of seconds spent on fetching a thread', default = None)
+@option('--dead-letter-path', '-e', type = str, help = 'file with threads which could not be fetched', default = DEAD_LETTER_PATH)
+@option('--cache', '-c', type = str, help = 'path to the folder with cached pages, if not set the pages are not cached', default = None)
+@option('--cache-size', '-z', type = int, help = 'max size of cached pages in megabytes', default = None)
+@option('--compact', '-k', is_flag = True, help = 'write json without indentation')
+def pull_many(
+    urls: list[str], input_path: str, path: str, format_: str, n_requests: int, n_requests_per_host: int, n_workers: int, parser: str, n_attempts: int, deadline: float,
+    dead_letter_path: str, cache: str, cache_size: int, compact: bool
+):
+    if input_path is not None:
+        with open(input_path, 'r', encoding = 'utf-8') as file:
+            urls = [*urls, *(line.strip() for line in file if len(line.strip()) > 0)]
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    fetcher = Fetcher(ParserBackend.make(parser), retry_policy = _make_retry_policy(n_attempts, deadline), cache = _make_cache(cache, cache_size))
+    exporter = Exporter()
+    format_ = Format(format_)
+    dead_letters = DeadLetterList(dead_letter_path)
+
+    async def pull_all():
+        loop = get_running_loop()
+
+        with tqdm(total = len(urls)) as pbar:
+            async for url, topics in fetcher.fetch_many(
+                urls, n_requests = n_requests, n_requests_per_host = n_requests_per_host, n_workers = n_workers, dead_letters = dead_letters
+            ):
+                # files are written in a thread, so that the event loop keeps serving downloads meanwhile
+                await loop.run_in_executor(
+                    None, partial(exporter.export, topics, format_, path = os.path.join(path, f'{Path(url).stem}.{format_.value}'), compact = compact)
+                )
+                pbar.update()
+
+    run(pull_all())
+
+
+@main.command(name = 'compare-parsers')
+@argument('paths', type = str, nargs = -1)
+@option('--n-repeats', '-n', type = int, default = 3)
+def compare_parsers_(paths: list[str], n_repeats: int):
+    reports = compare_parsers(paths, n_repeats = n_repeats)
+
+    for report in reports:
+        print(report)
+
+        for page in report.mismatches:
+            print(f'  output differs from {ParserBackend.HTML_PARSER.value} on {page}')
+
+    if any(len(report.mismatches) > 0 for report in reports):
+        raise ValueError('Parser backends produce different topics')
+
+
+@main.command(name = 'benchmark')
+@argument('paths', type = str, nargs = -1)
+@option('--index-pages', '-i', type = str, multiple = True, help = 'saved index pages of the arhivach website or folders with them')
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--n-repeats', '-n', type = int, default = 3)
+@option('--baseline', '-b', type = str, help = 'file with results of a previous run', default = BASELINE_PATH)
+@option('--save', '-s', is_flag = True, help = 'save results as the new baseline')
+@option('--portable', '-p', is_flag = True, help = 'save the baseline without the machine, so that only peak memory is compared with it')
+@option('--threshold', '-t', type = float, help = 'relative slowdown or growth of peak memory which is reported as a regression', default = REGRESSION_THRESHOLD)
+def benchmark(paths: list[str], index_pages: list[str], parser: str, n_repeats: int, baseline: str, save: bool, portable: bool, threshold: float):
+    reports = run_suite(paths, index_pages, ParserBackend.make(parser), n_repeats = n_repeats)
+
+    for report in reports:
+        print(report)
+
+    if save:
+        save_baseline(reports, baseline, portable)
+        print(f'Saved baseline to {baseline}')
+    elif os.path.isfile(baseline):
+        if len(match_baseline(reports, baseline_reports := read_baseline(baseline))) < 1:
+            print(f'{baseline} has been measured with another parser or other library versions, save a new baseline with -s to compare runs')
+            return
+
+        if regressions := find_regressions(reports, baseline_reports, threshold):
+            for regression in regressions:
+                print(f'  regression in {regression}')
+
+            raise ValueError(f'Found {len(regressions)} regressions compared to {baseline}')
+
+        print(f'No regressions compared to {baseline}')
+
+
+@main.command(name = 'benchmark-record')
+@argument('urls', type = str, nargs = -1)
+@option('--path', '-p', type = str, help = 'folder with saved pages', default = 'assets/pages')
+def benchmark_record(urls: list[str], path: str):
+    for page in record_pages(urls, path):
+        print(f'Saved {page}')
+
+
+@main.command(name = 'benchmark-memory')
+@option('--size', '-s', type = int, help = 'size of the synthetic page in megabytes', default = 50)
+@option('--memory-budget', '-b', type = int, help = 'max size of post texts kept in memory in the streaming mode in megabytes', default = 16)
+@option('--no-tree', '-t', is_flag = True, help = 'measure the streaming mode only')
+@option('--seed', '-r', type = int, default = 17)
+def benchmark_memory_(size: int, memory_budget: int, no_tree: bool, seed: int):
+    for report in benchmark_memory(size * MEGABYTE, memory_budget * MEGABYTE, tree = not no_tree, seed = seed):
+        print(report)
+
+
+@main.command(name = 'benchmark-grouping')
+@option('--n-posts', '-n', type = int, multiple = True, help = 'number of posts in synthetic threads', default = (10_000, 100_000))
+@option('--n-repeats', '-r', type = int, default = 3)
+@option('--seed', '-s', type = int, default = 17)
+def benchmark_grouping_(n_posts: tuple[int], n_repeats: int, seed: int):
+    for report in benchmark_grouping(n_posts, n_repeats = n_repeats, seed = seed):
+        print(report)
+
+
 ROOT = 'https://2ch.hk'
 PAGE_TEMPLATE = f'{ROOT}/{{board}}/arch/{{id}}.html'
 
@@ -1175,9 +1478,14 @@ def expand_title(title: str, topics: [Topic]):
     return title
 
 
-def grab_one(i: int, row: dict, batch_size: int, path: str, skip_empty: bool, protocol: str, empty_list_path: str, empty_threads: list[int], update_boards: bool):
-    fetcher = Fetcher()
-    exporter = Exporter()
+def grab_one(
+    i: int, row: dict, batch_size: int, path: str, skip_empty: bool, protocol: str, empty_list_path: str, empty_threads: list[int], update_boards: bool, parser: ParserBackend,
+    retry_policy: RetryPolicy, dead_letter_path: str, cache: PageCache, exporter: Exporter = None
+):
+    fetcher = Fetcher(parser, retry_policy = retry_policy, cache = cache)
+
+    if exporter is None:
+        exporter = Exporter()
 
     thread = row['thread']
     batch_folder_name = row['folder']
@@ -1212,28 +1520,21 @@ def grab_one(i: int, row: dict, batch_size: int, path: str, skip_empty: bool, pr
     thread_description = f'{batch_folder_name}/{thread} {row["date"]}'
 
     if update_boards and isnan(board):
-        response = None
         board = None
-        n_attempts = 10
 
-        while n_attempts > 0 and (response is None or response.status_code != 200 or (len(response.text) < 1)):
-            try:
-                print(f'{thread_description} FETCHING.BOARD {url}')
-                n_attempts -= 1
-                response = get(url, timeout = 60)
-            except (ConnectionError, ChunkedEncodingError) as e:
-                print(f'Encountered error when fetching thread {thread} page for updating board: {e}. Waiting for {SSL_ERROR_DELAY} before retrying...')
-                sleep(SSL_ERROR_DELAY)
-                print('Retrying...')
-                response = None
-
-        if response.status_code == 200:
-            board = _get_board_name_from_thread_body(BeautifulSoup(response.text, 'html.parser'))
-
-            if board is not None:
-                updated = True
-
-    if os.path.isfile(thread_path) and (skip_empty or thread in empty_threads or os.stat(thread_path).st_size > 0):
+        print(f'{thread_description} FETCHING.BOARD {url}')
+
+        try:
+            board = _get_board_name_from_thread_body(parser.parse(retry_policy.run(partial(_get_page, url, timeout = 60), url)))
+        except RetriesExhaustedError as e:
+            print(f'Can\'t fetch thread {thread} page for updating board: {e}')
+
+        if board is not None:
+            updated = True
+
+    if (existing_thread_path := find_thread_file(batch_folder_path, thread)) is not None and (
+        skip_empty or thread in empty_threads or (row.get('size') or 0) > 0 or get_thread_file_size(existing_thread_path) > 0
+    ):  # the recorded size of the thread saves reading the file
         # print(f'File {thread_path} exists. Not pulling')
         # pbar.update()
         # print(f'{thread_description} SKIPPING')
@@ -1242,24 +1543,29 @@ def grab_one(i: int, row: dict, batch_size: int, path: str, skip_empty: bool, pr
 
     print(f'{thread_description} FETCHING {url}')
 
-    fetched = False
+    try:
+        topics = fetcher.fetch(url = url, verbose = False)
+    except RetriesExhaustedError as e:
+        print(f'{thread_description} ⚫ {e}')
+        DeadLetterList(dead_letter_path, dead_letter_lock).append(thread, e.error)
+        return ThreadUpdate(i = i, board = board, updated = updated)
 
-    while not fetched:
-        try:
-            exporter.export(fetcher.fetch(url = url, verbose = False), Format.TXT, path = thread_path)
+    if (stats := exporter.export(topics, Format.TXT, path = thread_path)) is not None and stats.size == 0:  # the file may not be written yet if files are committed in groups
+        with empty_list_lock:
+            with open(empty_list_path, mode = 'a', encoding = 'utf-8') as file:
+                file.write(f'{thread}\n')
 
-            if os.stat(thread_path).st_size < 1:
-                with empty_list_lock:
-                    with open(empty_list_path, mode = 'a', encoding = 'utf-8') as file:
-                        file.write(f'{thread}\n')
+    return ThreadUpdate(i = i, board = board, updated = updated, stats = stats)
 
-            fetched = True
-        except ConnectionError:
-            continue
+    # pbar.update()
 
-    return ThreadUpdate(i = i, board = board, updated = updated)
 
-    # pbar.update()
+def grab_group(rows: list[tuple[int, dict]], *args, sync: bool = False, group_size: int = 1):
+    """
+    Grabs threads from the rows in one worker, so that the thread files are flushed to disk together.
+    """
+    with Exporter(sync, group_size) as exporter:
+        return [grab_one(i, row, *args, exporter = exporter) for i, row in rows]
 
 
 @main.command()
@@ -1271,11 +1577,33 @@ def grab_one(i: int, row: dict, batch_size: int, path: str, skip_empty: bool, pr
 @option('--protocol', '-r', type = str, default = 'http')
 @option('--empty-list-path', '-y', type = str, default = 'empty-threads.txt')
 @option('--update-boards', '-u', is_flag = True)
-def grab(path: str, index: str, batch_size: int, n_workers: int, skip_empty: bool, protocol: str, empty_list_path: str, update_boards: bool = False):
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+@option('--pool-size', '-o', type = int, help = 'max number of connections kept open by each worker', default = POOL_SIZE)
+@option('--n-attempts', '-m', type = int, help = 'max number of attempts to fetch a thread, 0 means no limit', default = N_ATTEMPTS)
+@option('--deadline', '-x', type = float, help = 'max number of seconds spent on fetching a thread', default = None)
+@option('--dead-letter-path', '-e', type = str, help = 'file with threads which could not be fetched', default = DEAD_LETTER_PATH)
+@option('--cache', '-c', type = str, help = 'path to the folder with cached pages, if not set the pages are not cached', default = None)
+@option('--cache-size', '-z', type = int, help = 'max size of cached pages in megabytes', default = None)
+@option('--sync', '-f', is_flag = True, help = 'flush thread files to disk before they replace existing files')
+@option('--group-size', '-g', type = int, help = 'number of thread files written by a worker which are flushed to disk at once, requires --sync', default = 1)
+def grab(
+    path: str, index: str, batch_size: int, n_workers: int, skip_empty: bool, protocol: str, empty_list_path: str, update_boards: bool = False, parser: str = None,
+    pool_size: int = POOL_SIZE, n_attempts: int = N_ATTEMPTS, deadline: float = None, dead_letter_path: str = DEAD_LETTER_PATH, cache: str = None, cache_size: int = None,
+    sync: bool = False, group_size: int = 1
+):
+    _require_thread_folders(path)
+
+    if group_size > 1 and not sync:  # without sync every file replaces its target as soon as it is written
+        raise ValueError('--group-size takes effect only with --sync')
+
+    parser = ParserBackend.make(parser)
+    retry_policy = _make_retry_policy(n_attempts, deadline)
+    cache = _make_cache(cache, cache_size)
+
     if not os.path.isdir(path):
         os.makedirs(path)
 
-    df = read_csv(index, sep = '\t')
+    df = read_index(index)
 
     if os.path.isfile(empty_list_path):
         with open(empty_list_path, 'r', encoding = 'utf-8') as file:
@@ -1299,9 +1627,19 @@ def grab(path: str, index: str, batch_size: int, n_workers: int, skip_empty: boo
     # for i, row in df.iterrows():
     #     grab_one((i, row, batch_size, path))
 
-    with Pool(processes = n_workers) as pool:
+    with Pool(processes = n_workers, initializer = init_session, initargs = (pool_size, )) as pool:
         # Use pool.starmap to parallelize the loop
-        updates = pool.starmap(grab_one, [(i, row, batch_size, path, skip_empty, protocol, empty_list_path, empty_threads, update_boards) for i, row in df.iterrows()])
+        rows = list(df.iterrows())
+        args = (batch_size, path, skip_empty, protocol, empty_list_path, empty_threads, update_boards, parser, retry_policy, dead_letter_path, cache)
+
+        updates = [
+            update
+            for group_updates in pool.starmap(
+                partial(grab_group, sync = sync, group_size = group_size),
+                [(rows[i:i + group_size], *args) for i in range(0, len(rows), group_size)]
+            )
+            for update in group_updates
+        ]
 
     if update_boards:
         inferred_boards = [update.board for update in updates if update.updated]
@@ -1313,7 +1651,67 @@ def grab(path: str, index: str, batch_size: int, n_workers: int, skip_empty: boo
                 for update in sorted(updates, key = lambda update: update.i)
             ]
 
-        df.to_csv(index, sep = '\t', index = False)
+    stats = {update.i: update.stats for update in updates if update.stats is not None}
+
+    if update_boards or len(stats) > 0:  # only rows with inferred boards or exported threads are written to a database
+        _write_thread_stats(df, index, stats, [update.i for update in updates if update.updated])
+
+
+def reparse_one(url: str, thread_path: str, cache: PageCache, parser: ParserBackend):
+    if (page := cache.get(url)) is None:
+        print(f'Page {url} has been evicted from cache. Skipping...')
+        return None
+
+    folder = os.path.dirname(thread_path)
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    return Exporter().export(Fetcher(parser, cache = cache).parse(url, page), Format.TXT, path = thread_path)
+
+
+@main.command()
+@option('--cache', '-c', type = str, help = 'path to the folder with cached pages', default = CACHE_PATH)
+@option('--path', '-p', type = str, help = 'path to the directory which will contain reparsed files', default = PATH)
+@option('--index', '-i', type = str, help = 'path to the file with pulled files index', default = INDEX)
+@option('--n-workers', '-n', type = int, default = 8)
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+def reparse(cache: str, path: str, index: str, n_workers: int, parser: str):
+    _require_thread_folders(path)
+
+    parser = ParserBackend.make(parser)
+    cache = PageCache(cache)
+
+    df = read_index(index)
+    thread_to_folder = dict(zip(df['thread'], df['folder']))
+    thread_to_label = dict(zip(df['thread'], df.index))
+
+    jobs = []
+    labels = []
+
+    for url in cache.urls():
+        try:
+            thread = int(Path(url).stem)
+        except ValueError:
+            continue
+
+        if (folder := thread_to_folder.get(thread)) is None or isnan(folder):
+            print(f'Thread {thread} is missing in the index. Skipping...')
+            continue
+
+        if (thread_path := find_thread_file(folder_path := os.path.join(path, folder), thread)) is None:
+            thread_path = os.path.join(folder_path, f'{thread:08d}.txt')
+
+        jobs.append((url, thread_path.removesuffix(COMPRESSED_SUFFIX), cache, parser))  # load names files without padding, grab pads thread ids
+        labels.append(thread_to_label[thread])
+
+    with Pool(processes = n_workers) as pool:
+        stats = {label: thread_stats for label, thread_stats in zip(labels, pool.starmap(reparse_one, jobs)) if thread_stats is not None}
+
+    if len(stats) > 0:  # sizes are read from the index by top and list-empty-threads, so they must follow the files
+        _write_thread_stats(df, index, stats)
+
+    print(f'Reparsed {len(stats)} / {len(jobs)} threads')
 
 
 @main.command()
@@ -1322,7 +1720,10 @@ def grab(path: str, index: str, batch_size: int, n_workers: int, skip_empty: boo
 @option('--index', '-i', type = str, help = 'path to the file with pulled files index', default = INDEX)
 @option('--skip-fetched', '-s', is_flag = True, help = 'skip posts, for which corresponding files already exist')
 @option('--board', '-b', type = str, help = 'board id from which to pull archived entries', default = 'b')
-def fetch(page: int, path: str, index: str, skip_fetched: bool, board: str):
+@option('--parser', '-a', type = PARSER_CHOICE, default = None)
+def fetch(page: int, path: str, index: str, skip_fetched: bool, board: str, parser: str):
+    parser = ParserBackend.make(parser)
+
     if not os.path.isdir(path):
         os.makedirs(path)
 
@@ -1333,13 +1734,13 @@ def fetch(page: int, path: str, index: str, skip_fetched: bool, board: str):
     if (code := response.status_code) != 200:
         raise ValueError(f'Inacceptable response status: {code}')
 
-    bs = BeautifulSoup(response.text, 'html.parser')
+    bs = parser.parse(response.content, get_encoding(response.headers.get('content-type')))
 
     i = 0
 
     records = []
 
-    fetcher = Fetcher()
+    fetcher = Fetcher(parser)
     exporter = Exporter()
 
     for thread in tqdm(bs.find_all('span', {'class': 'arch-threadnum'})):
@@ -1379,28 +1780,40 @@ def fetch(page: int, path: str, index: str, skip_fetched: bool, board: str):
 @main.command()
 @argument('n', type = int, default = 10)
 @option('--root', '-r', type = str, help = 'root folder with threads', default = None)
-@option('--path', '-p', type = str, help = 'path to the directory which will contain pulled files', default = PATH)
+@option('--path', '-p', type = str, help = 'path to the directory with pulled files or to the pack with them', default = PATH)
 @option('--index', '-i', type = str, help = 'path to the file with pulled files index', default = INDEX)
 @option('--skip-missing', '-s', is_flag = True)
-def top(n: int, path: str, index: str, root: str, skip_missing: bool):
-    index = read_csv(index, sep = '\t')
-
-    if root is not None:
-        index['path'] = index['folder'].apply(lambda x: os.path.join(root, x))
-
-    for folder, file in sorted(
-        [
-            (folder, os.path.join(folder, file))
-            for folder, _, files in os.walk(path)
-            for file in files
-        ],
-        key = lambda folder_and_file: os.stat(folder_and_file[1]).st_size,
-        reverse = True
-    )[:n]:
-        thread_id = int(Path(file).stem)
+@option('--scan', '-c', is_flag = True, help = 'rank thread files by their sizes on disk instead of the sizes recorded in the index')
+def top(n: int, path: str, index: str, root: str, skip_missing: bool, scan: bool):
+    if not scan and is_index_column_complete(index, 'size'):  # sizes are recorded when threads are exported, otherwise the files are ranked
+        for row in find_largest_index_rows(index, 'size', n):
+            print(
+                f'{row["size"] / 1024:.2f} KB',
+                row['thread'],
+                row['title']
+            )
+
+        return
+
+    index_store = IndexStore(index) if IndexStore.accepts(index) else None
+    snapshot = IndexSnapshot.open(index) if index_store is None else None
+
+    def find_row(thread_id: int, folder: str):
+        for row in [index_store.get_row(thread_id)] if snapshot is None else [snapshot.row(i) for i in snapshot.find(thread_id)]:
+            if row is not None and (row.get('path') if root is None else os.path.join(root, row['folder'])) == folder:
+                return row
+
+        raise IndexError(f'Thread {thread_id} is not in index')
+
+    with open_thread_store(path) as store:
+        entries = sorted(store.entries(), key = lambda entry: entry.size, reverse = True)[:n]
+
+    for entry in entries:
+        thread_id = entry.thread
+        folder = os.path.join(path, entry.folder)
 
         try:
-            row = index.loc[(index.thread == thread_id) & (index.path == folder)].iloc[0]
+            row = find_row(thread_id, folder)
         except IndexError:
             print(f"-- Can't find thread {thread_id} at {folder} in index")
             if skip_missing:
@@ -1409,11 +1822,14 @@ def top(n: int, path: str, index: str, root: str, skip_missing: bool):
                 raise
 
         print(
-            f'{os.stat(file).st_size / 1024:.2f} KB',
+            f'{entry.size / 1024:.2f} KB',
             thread_id,
             row['title']
         )
 
+    if index_store is not None:
+        index_store.close()
+
 
 @main.command()
 @argument('thread-id', type = int)
@@ -1425,16 +1841,20 @@ def star(thread_id: int, name: str, index: str, root: str, destination_path: str
     if not os.path.isdir(destination_path):
         os.mkdir(destination_path)
 
-    index = read_csv(index, sep = '\t')
+    if len(rows := find_index_rows(index, thread_id)) < 1:
+        raise ValueError(f'Can\'t find thread {thread_id} in index')
 
-    row = index.loc[index.thread == thread_id].iloc[0]
+    row = rows[0]
 
     if root is None:
         thread_path = row['path']
     else:
         thread_path = os.path.join(root, row['folder'])
 
-    copyfile(os.path.join(thread_path, f'{thread_id}.txt'), os.path.join(destination_path, f'{name}.txt'))
+    if (source_path := find_thread_file(thread_path, thread_id)) is None:
+        raise FileNotFoundError(f'Can\'t find thread {thread_id} in {thread_path}')
+
+    copy_thread_file(source_path, os.path.join(destination_path, f'{name}.txt'))
 
 
 @main.command()
@@ -1442,17 +1862,15 @@ def star(thread_id: int, name: str, index: str, root: str, destination_path: str
 @option('--index', '-i', type = str, default = INDEX)
 @option('--board', '-b', type = str, default = 'b')
 def link(thread_id: int, index: str, board: str):
-    index = read_csv(index, sep = '\t')
+    items = find_index_rows(index, thread_id)
 
-    items = index[index.thread == thread_id]
-
-    if (size := items.shape[0]) < 1:
+    if (size := len(items)) < 1:
         raise ValueError(f'Too few matching items: {size}')
 
-    if (size := items.shape[0]) > 1:
+    if (size := len(items)) > 1:
         raise ValueError(f'Too many matching items: {size}')
 
-    record = items.iloc[0].to_dict()
+    record = items[0]
 
     print(f'https://2ch.hk/{board}/arch/{"-".join(record["date"].split("-")[::-1])}/res/{record["thread"]}.html')
 
@@ -1462,38 +1880,48 @@ def link(thread_id: int, index: str, board: str):
 @option('--path', '-p', type = str, default = PATH)
 @option('--target', '-t', type = str, default = 'orphan')
 def sync(index: str, path: str, target: str):
-    index = read_csv(index, sep = '\t')
+    index = read_index(index)
 
     if not os.path.isdir(target):
         os.makedirs(target)
 
     print('indexing...')
 
-    pairs = set()
-    for _, row in index.iterrows():
-        pair = (row['thread'], row['folder'])
-
-        if pair in pairs:
-            raise ValueError(f'There are multiple threads with id {row["thread"]} in folder {row["folder"]}')
+    if (duplicates := index[index.duplicated(['thread', 'folder'])]).shape[0] > 0:
+        raise ValueError(f'There are multiple threads with id {duplicates["thread"].iloc[0]} in folder {duplicates["folder"].iloc[0]}')
 
-        pairs.add(pair)
+    pairs = set(zip(index['thread'], index['folder']))
 
     print('indexed')
 
-    for path, _, files in os.walk(path):
-        for file in files:
-            folder = Path(path).stem
-            thread_id = int(Path(file).stem)
+    with open_thread_store(path) as store:
+        for entry in list(store.entries()):
+            if (entry.thread, entry.folder) not in pairs:
+                print(f'Missing index entry for thread {entry.thread} which is {entry.size / 1024:.2f} Kb large. Moving it to {target}...')
+
+                if isinstance(store, PackThreadStore):  # modification time is kept, since create-missing-index-entries dates threads by it
+                    write_thread_file(
+                        os.path.join(target, THREAD_FILE_NAME.format(thread = entry.thread)), store.read(entry.thread, entry.folder),
+                        store.get_modification_time(entry.thread)
+                    )
+                    store.remove(entry.thread, entry.folder)
+                    continue
 
-            # row = index.loc[(index.thread == thread_id) & (index.folder == folder)]
-            # size = row.shape[0]
+                moved = False
 
-            # if size > 1:
-            #     raise ValueError(f'There are multiple threads with id {thread_id} in folder {folder}')
+                while (thread_path := find_thread_file(os.path.join(path, entry.folder), entry.thread)) is not None:  # plain files go first
+                    if not thread_path.endswith(COMPRESSED_SUFFIX):
+                        move(thread_path, os.path.join(target, os.path.basename(thread_path)))
+                    elif moved:  # the plain file of the thread overrides the compressed one
+                        os.remove(thread_path)
+                    else:  # the file can't be read without the dictionary of its folder, so it is decompressed
+                        write_thread_file(
+                            os.path.join(target, os.path.basename(thread_path).removesuffix(COMPRESSED_SUFFIX)), read_thread_file(thread_path),
+                            os.stat(thread_path).st_mtime_ns
+                        )
+                        os.remove(thread_path)
 
-            if (thread_id, folder) not in pairs:
-                print(f'Missing index entry for thread {thread_id} which is {os.stat(file_path := os.path.join(path, file)).st_size / 1024:.2f} Kb large. Moving it to {target}...')
-                move(file_path, os.path.join(target, file))
+                    moved = True
 
 
 @main.command()
@@ -1544,7 +1972,7 @@ def start_proxy(host: str, port: int, timeout: int, protocol: str):
 @option('--output-path', '-o', type = str, default = 'stories.txt')
 @option('--trace', '-r', is_flag = True)
 def collect_creepy_stories(index: str, threads: str, keywords: str, min_length: int, max_length: int, output_path: str, trace: bool):
-    content = read_csv(index, sep = '\t').dropna()
+    content = read_index_columns(index, ('thread', 'folder', 'title'), dropna = True)
 
     with open(keywords, 'r', encoding = 'utf-8') as file:
         keywords = file.read().split('\n')
@@ -1560,9 +1988,9 @@ def collect_creepy_stories(index: str, threads: str, keywords: str, min_length:
         thread = row['thread']
         folder = row['folder']
 
-        path = os.path.join(threads, folder, f'{thread:08d}.txt')
+        path = find_thread_file(os.path.join(threads, folder), thread) or os.path.join(threads, folder, f'{thread:08d}.txt')
 
-        with open(path, 'r', encoding = 'utf-8') as file:
+        with open_thread_file(path, newline = None) as file:
             lines = file.readlines()
 
         for line in lines:
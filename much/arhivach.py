@@ -0,0 +1,95 @@
+import re
+from datetime import datetime, timedelta
+
+from bs4 import BeautifulSoup
+
+from .util import normalize, SPACE
+
+
+BOARD_NAME_TEMPLATE = re.compile('/[a-zA-Z0-9]+/')
+TIME_TEMPLATE = re.compile('[0-9]+:[0-9]+')
+
+
+def get_board_name_from_thread_card(thread: BeautifulSoup):
+    for link in (tags := thread.find('div', {'class': 'thread_tags'})).find_all('a'):
+        boards = BOARD_NAME_TEMPLATE.findall(link['title'])
+
+        if len(boards) > 0:
+            return boards[0]
+
+    print("Can't infer board: ", tags)
+
+    return None
+
+
+def decode_date(date: str):
+    normalized = normalize(date).lower()
+
+    if normalized.startswith('сегодн'):
+        return datetime.today().strftime('%d-%m-%Y')
+    elif normalized.startswith('вчера'):
+        return (datetime.today() - timedelta(days = 1)).strftime('%d-%m-%Y')
+
+    try:
+        day, month, year = normalized.split(SPACE)
+    except ValueError:
+        print(f'Can\'t decode date: {date}')
+        return date
+
+    match month:
+        case 'января':
+            decoded_month = 1
+        case 'февраля':
+            decoded_month = 2
+        case 'марта':
+            decoded_month = 3
+        case 'апреля':
+            decoded_month = 4
+        case 'мая':
+            decoded_month = 5
+        case 'июня':
+            decoded_month = 6
+        case 'июля':
+            decoded_month = 7
+        case 'августа':
+            decoded_month = 8
+        case 'сентября':
+            decoded_month = 9
+        case 'октября':
+            decoded_month = 10
+        case 'ноября':
+            decoded_month = 11
+        case 'декабря':
+            decoded_month = 12
+        case _:
+            raise ValueError(f"Can't infer month from date: {date}")
+
+    try:
+        return f'{int(day):02d}-{decoded_month:02d}-{int(year):04d}'
+    except ValueError:
+        if TIME_TEMPLATE.fullmatch(year):
+            return f'{int(day):02d}-{decoded_month:02d}-{datetime.now().year:04d}'
+
+        print(f'Can\'t decode date: {date}')
+        return date
+
+
+def parse_thread_cards(page: BeautifulSoup, seen_keys: set[int] = None):
+    """
+    Yields threads listed on an index page of the arhivach website from the oldest to the newest. Threads with keys from seen_keys are
+    skipped before the rest of their cards is parsed, and the set is checked lazily, so keys added by the caller between iterations count too.
+    """
+    for thread in page.find_all('tr')[1:][::-1]:
+        _text = thread.find('div', {'class': 'thread_text'})
+        key = int(_text.find('a')['href'].split('/')[2])
+
+        if seen_keys is not None and key in seen_keys:
+            continue
+
+        yield {
+            'thread': key,
+            'title': normalize(_text.get_text(separator = SPACE)),
+            'date': decode_date(thread.find('td', {'class': 'thread_date'}).text),
+            'board': get_board_name_from_thread_card(thread),
+            'stars': int(thread.find('span', {'class': 'thread_posts_count'}).text)
+        }
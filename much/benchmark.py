@@ -0,0 +1,488 @@
+from __future__ import annotations
+
+import gc
+import os
+import platform
+import tracemalloc
+from json import dump, load
+from time import perf_counter
+from random import Random
+from dataclasses import dataclass, asdict
+from tempfile import TemporaryDirectory
+from urllib.parse import urlparse
+from importlib.metadata import version, PackageNotFoundError
+
+from .Fetcher import Fetcher
+from .Exporter import Exporter, Format
+from .ParserBackend import ParserBackend
+from .Post import Post, PostRecord
+from .arhivach import parse_thread_cards
+from .session import get
+from .util import post_process_summary
+
+
+REFERENCE_PARSER = ParserBackend.HTML_PARSER
+MEGABYTE = 1024 * 1024
+BASELINE_PATH = 'assets/benchmark-baseline.json'
+REGRESSION_THRESHOLD = 0.1  # relative drop of throughput or growth of peak memory which is reported as a regression
+N_SUMMARIES = 100
+SUMMARY_LENGTH = 256  # post_process_summary is cubic in the text length, so it is measured on texts as short as the summaries it handles
+LIBRARIES = ('beautifulsoup4', 'lxml', 'numpy')  # libraries which the measured code depends on, their versions are recorded with the results
+WORDS = ('тред', 'анон', 'пост', 'ответ', 'вопрос', 'история', 'крипипаста', 'ночь', 'лес', 'дом')
+
+
+@dataclass
+class ParserReport:
+    backend: ParserBackend
+    n_posts: int
+    elapsed: float
+    mismatches: tuple[str]
+
+    @property
+    def posts_per_second(self):
+        return 0 if self.elapsed <= 0 else self.n_posts / self.elapsed
+
+    def __repr__(self):
+        return f'{self.backend.value:>12}: {self.posts_per_second:10.1f} posts/s, {len(self.mismatches)} mismatching pages'
+
+
+def find_posts(soup):
+    return soup.find_all('div', {'class': ('post', 'reply')})
+
+
+def count_posts(path: str):
+    with open(path, 'r', encoding = 'utf-8') as file:
+        soup = REFERENCE_PARSER.parse(file.read())
+
+    return len(find_posts(soup))
+
+
+def list_pages(paths: list[str]):
+    pages = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in sorted(files):
+                    if file.endswith('.html'):
+                        pages.append(os.path.join(root, file))
+        else:
+            pages.append(path)
+
+    return pages
+
+
+def compare_parsers(paths: list[str], backends: tuple[ParserBackend] = None, n_repeats: int = 1):
+    """
+    Parses saved pages with every backend, checks that the produced topics are the same as the ones produced by the reference parser,
+    and measures how many posts per second each backend handles.
+    """
+    pages = list_pages(paths)
+    backends = ParserBackend.available() if backends is None else backends
+
+    n_posts = sum(count_posts(page) for page in pages) * n_repeats
+    reference = {page: Fetcher(REFERENCE_PARSER).fetch(page) for page in pages}
+
+    reports = []
+
+    for backend in backends:
+        fetcher = Fetcher(backend)
+        mismatches = []
+
+        start = perf_counter()
+
+        for _ in range(n_repeats):
+            for page in pages:
+                if fetcher.fetch(page) != reference[page] and page not in mismatches:
+                    mismatches.append(page)
+
+        reports.append(ParserReport(backend, n_posts, perf_counter() - start, tuple(mismatches)))
+
+    return reports
+
+
+@dataclass
+class GroupingReport:
+    n_posts: int
+    n_topics: int
+    elapsed: float
+
+    @property
+    def posts_per_second(self):
+        return 0 if self.elapsed <= 0 else self.n_posts / self.elapsed
+
+    def __repr__(self):
+        return f'{self.n_posts:>8} posts: {self.posts_per_second:10.1f} posts/s, {self.n_topics} topics'
+
+
+def make_synthetic_thread(n_posts: int, seed: int = 17, chain_probability: float = 0.5, max_mentions: int = 3):
+    """
+    Generates post records of a thread in which every post mentions up to max_mentions earlier posts. With the given probability the previous
+    post is mentioned, so the thread contains long reply chains.
+    """
+    random = Random(seed)
+    records = []
+
+    for i in range(n_posts):
+        if i > 0 and random.random() < chain_probability:
+            mentions = [i - 1]
+        else:
+            mentions = [random.randrange(i) for _ in range(random.randint(0, max_mentions))] if i > 0 else []
+
+        records.append(
+            PostRecord(
+                key = i,
+                body = None,
+                text = ' '.join(random.choice(WORDS) for _ in range(random.randint(1, 50))),
+                mentions = mentions,
+                is_oppost = i == 0
+            )
+        )
+
+    return records
+
+
+def benchmark_grouping(n_posts: tuple[int] = (10_000, 100_000), n_repeats: int = 3, seed: int = 17):
+    """
+    Measures how many posts per second are grouped into topics on synthetic threads.
+    """
+    fetcher = Fetcher()
+    reports = []
+
+    for n in n_posts:
+        records = make_synthetic_thread(n, seed = seed)
+
+        start = perf_counter()
+
+        for _ in range(n_repeats):
+            topics = fetcher.group(records)
+
+        reports.append(GroupingReport(n * n_repeats, len(topics), perf_counter() - start))
+
+    return reports
+
+
+@dataclass
+class MemoryReport:
+    mode: str
+    n_bytes: int
+    n_topics: int
+    peak: int
+    elapsed: float
+
+    def __repr__(self):
+        return f'{self.mode:>12}: {self.n_bytes / MEGABYTE:.1f} MB page, peak memory {self.peak / MEGABYTE:.1f} MB, {self.elapsed:.1f} s, {self.n_topics} topics'
+
+
+def make_synthetic_page(path: str, n_bytes: int, seed: int = 17, chain_probability: float = 0.5, max_mentions: int = 3):
+    """
+    Writes a page in the 2ch format with posts from a synthetic thread until the page size reaches n_bytes.
+    """
+    random = Random(seed)
+    i = 0
+
+    with open(path, 'w', encoding = 'utf-8') as file:
+        file.write('<html><head><title>thread</title></head><body><div class="thread">\n')
+
+        while file.tell() < n_bytes:
+            if i > 0 and random.random() < chain_probability:
+                mentions = [i - 1]
+            else:
+                mentions = [random.randrange(i) for _ in range(random.randint(0, max_mentions))] if i > 0 else []
+
+            links = ''.join(f'<a href="#{mention}" class="post-reply-link" data-num="{mention}">&gt;&gt;{mention}</a><br>' for mention in mentions)
+            text = ' '.join(random.choice(WORDS) for _ in range(random.randint(1, 50)))
+
+            classes = 'post oppost' if i == 0 else 'post reply'
+
+            file.write(
+                f'<div class="thread__post"><div class="{classes}" id="post-{i}" data-num="{i}">'
+                f'<blockquote id="m{i}" class="post-message">{links}{text}</blockquote></div></div>\n'
+            )
+            i += 1
+
+        file.write('</div></body></html>')
+
+
+MONTHS = ('января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря')
+BOARDS = ('b', 'po', 'sn', 'mov', 'pr')
+
+
+def make_synthetic_index_page(path: str, n_threads: int, seed: int = 17, first_thread: int = 100_000):
+    """
+    Writes an index page in the arhivach format which lists n_threads thread cards from the newest to the oldest.
+    """
+    random = Random(seed)
+
+    with open(path, 'w', encoding = 'utf-8') as file:
+        file.write('<html><head><title>index</title></head><body><table>\n<tr><th>thread</th><th>date</th></tr>\n')
+
+        for thread in range(first_thread + n_threads - 1, first_thread - 1, -1):
+            text = ' '.join(random.choice(WORDS) for _ in range(random.randint(3, 30)))
+            board = random.choice(BOARDS)
+
+            file.write(
+                f'<tr><td class="thread_date">{random.randint(1, 28)} {random.choice(MONTHS)} {random.randint(2012, 2024)}</td>'
+                f'<td><span class="thread_posts_count">{random.randint(0, 500)}</span>'
+                f'<div class="thread_text"><a href="/thread/{thread}/">{text}</a></div>'
+                f'<div class="thread_tags"><a title="Доска /{board}/" href="/index/?tags={board}">{board}</a></div></td></tr>\n'
+            )
+
+        file.write('</table></body></html>')
+
+
+def benchmark_memory(n_bytes: int = 50 * MEGABYTE, memory_budget: int = 16 * MEGABYTE, tree: bool = True, seed: int = 17):
+    """
+    Measures peak memory allocated while topics are made from a synthetic page in the streaming mode, and, if tree is set, when the whole
+    document tree is built. In the streaming mode topics are consumed one by one, as they would be written to a file.
+    """
+    fetcher = Fetcher(REFERENCE_PARSER)
+    reports = []
+
+    with TemporaryDirectory() as folder:
+        make_synthetic_page(path := os.path.join(folder, 'thread.html'), n_bytes, seed = seed)
+
+        def measure(mode: str, make_topics):
+            tracemalloc.start()
+            start = perf_counter()
+
+            try:
+                n_topics = sum(1 for _ in make_topics())
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            reports.append(MemoryReport(mode, os.path.getsize(path), n_topics, peak, perf_counter() - start))
+
+        measure('streaming', lambda: fetcher.stream(path, memory_budget))
+
+        if tree:
+            measure(REFERENCE_PARSER.value, lambda: fetcher.fetch(path))
+
+    return reports
+
+
+@dataclass
+class SuiteReport:
+    name: str
+    n_posts: int  # number of posts, topics or threads handled in one run
+    n_bytes: int  # size of the input handled in one run
+    elapsed: float  # duration of the fastest run in seconds
+    peak: int  # peak memory allocated during one run in bytes
+    parser: str = None  # backend which parsed the pages
+    versions: dict = None  # versions of python and the libraries
+    machine: str = None  # host on which the run was made
+
+    def matches(self, baseline: SuiteReport):
+        """
+        Tells whether the baseline was measured with the same parser backend and versions of python and the libraries.
+        """
+        return self.name == baseline.name and self.parser == baseline.parser and self.versions == baseline.versions
+
+    @property
+    def posts_per_second(self):
+        return 0 if self.elapsed <= 0 else self.n_posts / self.elapsed
+
+    @property
+    def megabytes_per_second(self):
+        return 0 if self.elapsed <= 0 else self.n_bytes / MEGABYTE / self.elapsed
+
+    def regressions(self, baseline: SuiteReport, threshold: float = REGRESSION_THRESHOLD):
+        """
+        Compares the run with the baseline, which must match it. Throughput depends on the hardware, so it is compared only with
+        the baseline which has been measured on the same machine.
+        """
+        regressions = []
+
+        if self.machine is not None and self.machine == baseline.machine:
+            if self.posts_per_second < baseline.posts_per_second * (1 - threshold):
+                regressions.append(f'{self.name}: {self.posts_per_second:.1f} posts/s, baseline is {baseline.posts_per_second:.1f} posts/s')
+
+            if self.megabytes_per_second < baseline.megabytes_per_second * (1 - threshold):
+                regressions.append(f'{self.name}: {self.megabytes_per_second:.2f} MB/s, baseline is {baseline.megabytes_per_second:.2f} MB/s')
+
+        if self.peak > baseline.peak * (1 + threshold):
+            regressions.append(f'{self.name}: peak memory {self.peak / MEGABYTE:.1f} MB, baseline is {baseline.peak / MEGABYTE:.1f} MB')
+
+        return regressions
+
+    def __repr__(self):
+        return (
+            f'{self.name:>20}: {self.posts_per_second:10.1f} posts/s, {self.megabytes_per_second:8.2f} MB/s, '
+            f'peak memory {self.peak / MEGABYTE:.1f} MB'
+        )
+
+
+def record_pages(urls: list[str], root: str):
+    """
+    Saves pages which are used as fixtures by the benchmark suite, each page is named after the host and the last part of the url.
+    """
+    if not os.path.isdir(root):
+        os.makedirs(root, exist_ok = True)
+
+    paths = []
+
+    for url in urls:
+        parsed = urlparse(url)
+        name = f"{parsed.hostname.split('.')[0]}-{os.path.splitext(parsed.path.rstrip('/').rsplit('/', maxsplit = 1)[-1])[0]}.html"
+
+        response = get(url, timeout = 60)
+
+        if response.status_code != 200:
+            raise ValueError(f'Inacceptable status code {response.status_code} for {url}')
+
+        with open(path := os.path.join(root, name), 'wb') as file:
+            file.write(response.content)
+
+        paths.append(path)
+
+    return paths
+
+
+def get_versions():
+    versions = {'python': platform.python_version()}
+
+    for library in LIBRARIES:
+        try:
+            versions[library] = version(library)
+        except PackageNotFoundError:
+            versions[library] = None
+
+    return versions
+
+
+def _measure(name: str, run, n_posts: int, n_bytes: int, n_repeats: int, parser: ParserBackend):
+    """
+    Times n_repeats runs without tracing allocations, since tracing slows them down, and then measures peak memory in one more run.
+    The fastest run is taken, since slower ones are slowed down by other processes rather than by the measured code.
+    """
+    durations = []
+
+    for _ in range(n_repeats):
+        start = perf_counter()
+        run()
+        durations.append(perf_counter() - start)
+
+    elapsed = min(durations)
+
+    gc.collect()  # trees of parsed pages hold reference cycles, so without collecting them the peak depends on garbage left by the timed runs
+    tracemalloc.start()
+
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return SuiteReport(name, n_posts, n_bytes, elapsed, peak, parser.value, get_versions(), platform.node())
+
+
+def run_suite(paths: list[str], index_paths: list[str] = (), parser: ParserBackend = None, n_repeats: int = 3):
+    """
+    Measures throughput and peak memory of the parsing pipeline on saved thread pages and, if they are given, on saved index pages
+    of the arhivach website which are handled by the filter command.
+    """
+    parser = ParserBackend.make() if parser is None else parser
+    fetcher = Fetcher(parser)
+    exporter = Exporter()
+
+    pages = list_pages(paths)
+    sizes = {page: os.path.getsize(page) for page in pages}
+    n_bytes = sum(sizes.values())
+
+    contents = {}
+
+    for page in pages:
+        with open(page, 'r', encoding = 'utf-8') as file:
+            contents[page] = file.read()
+
+    reports = []
+
+    posts = [post for page in pages for post in find_posts(parser.parse(contents[page]))]
+
+    reports.append(_measure('Post.from_html', lambda: [Post.from_html(post) for post in posts], len(posts), n_bytes, n_repeats, parser))
+    reports.append(_measure('Fetcher.fetch', lambda: [fetcher.fetch(page) for page in pages], len(posts), n_bytes, n_repeats, parser))
+
+    topics = {page: fetcher.fetch(page) for page in pages}
+    texts = [text for page_topics in topics.values() for topic in page_topics for text in (topic.title, *topic.comments)]
+
+    with TemporaryDirectory() as folder:
+        def export():
+            size = 0
+
+            for i, page_topics in enumerate(topics.values()):
+                for format_ in (Format.JSON, Format.TXT):
+                    exporter.export(page_topics, format_, path := os.path.join(folder, f'{i}.{format_.value}'), force_overwrite = True)
+                    size += os.path.getsize(path)
+
+            return size
+
+        n_exported_bytes = export()
+
+        reports.append(_measure('Exporter.export', export, len(texts) * 2, n_exported_bytes, n_repeats, parser))
+
+    summaries = [text[:SUMMARY_LENGTH] for text in texts[:N_SUMMARIES]]
+
+    reports.append(
+        _measure(
+            'post_process_summary', lambda: [post_process_summary(summary) for summary in summaries], len(summaries),
+            sum(len(summary.encode('utf-8')) for summary in summaries), n_repeats, parser
+        )
+    )
+
+    if index_pages := list_pages(index_paths):
+        index_contents = []
+
+        for page in index_pages:
+            with open(page, 'r', encoding = 'utf-8') as file:
+                index_contents.append(file.read())
+
+        def handle_pages():
+            seen_keys = set()
+
+            for content in index_contents:
+                for card in parse_thread_cards(parser.parse(content), seen_keys):
+                    seen_keys.add(card['thread'])
+
+            return len(seen_keys)
+
+        reports.append(
+            _measure('filter.handle_page', handle_pages, handle_pages(), sum(os.path.getsize(page) for page in index_pages), n_repeats, parser)
+        )
+
+    return reports
+
+
+def save_baseline(reports: list[SuiteReport], path: str = BASELINE_PATH, portable: bool = False):
+    """
+    If portable is set, the machine is not saved, so that only peak memory is compared with the baseline, which can be shared then.
+    """
+    if (folder := os.path.dirname(path)) and not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    with open(path, 'w', encoding = 'utf-8') as file:
+        dump([{**asdict(report), 'machine': None} if portable else asdict(report) for report in reports], file, indent = 2)
+
+
+def read_baseline(path: str = BASELINE_PATH):
+    with open(path, 'r', encoding = 'utf-8') as file:
+        return {report['name']: SuiteReport(**report) for report in load(file)}
+
+
+def match_baseline(reports: list[SuiteReport], baseline: dict[str, SuiteReport]):
+    """
+    Returns pairs of reports and baseline reports which have been measured with the same parser backend and library versions.
+    """
+    return [
+        (report, baseline_report)
+        for report in reports
+        if (baseline_report := baseline.get(report.name)) is not None and report.matches(baseline_report)
+    ]
+
+
+def find_regressions(reports: list[SuiteReport], baseline: dict[str, SuiteReport], threshold: float = REGRESSION_THRESHOLD):
+    return [
+        regression
+        for report, baseline_report in match_baseline(reports, baseline)
+        for regression in report.regressions(baseline_report, threshold)
+    ]
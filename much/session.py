@@ -0,0 +1,83 @@
+import os
+import re
+from codecs import lookup
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+
+POOL_SIZE = 16
+POOL_SIZE_ENV_VARIABLE = 'MUCH_POOL_SIZE'
+
+ACCEPT_ENCODING = make_headers(accept_encoding = True)['accept-encoding']  # includes br if brotli is installed
+
+DEFAULT_ENCODING = 'utf-8'  # all supported sites serve utf-8, so the body is never sniffed for the charset
+CHARSET_TEMPLATE = re.compile(r'charset\s*=\s*["\']?([^"\';\s]+)', re.IGNORECASE)
+
+_sessions = {}
+
+
+def make_session(pool_size: int = None):
+    if pool_size is None:
+        pool_size = int(os.environ.get(POOL_SIZE_ENV_VARIABLE, POOL_SIZE))
+
+    session = Session()
+
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    session.headers['Connection'] = 'keep-alive'
+
+    return session
+
+
+def init_session(pool_size: int = None):
+    """
+    Creates session for the current process, can be used as a process pool initializer.
+    """
+    session = _sessions[os.getpid()] = make_session(pool_size)
+
+    return session
+
+
+def get_session():
+    """
+    Returns session shared by all callers within the current process. Sessions are not shared across processes, since pooled connections
+    can't be safely inherited by forked workers.
+    """
+    if (session := _sessions.get(os.getpid())) is None:
+        session = init_session()
+
+    return session
+
+
+def get(url: str, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def get_encoding(content_type: str = None):
+    """
+    Returns the charset declared in the Content-Type header or the default encoding if it is missing or unknown.
+    """
+    if content_type is None or (match := CHARSET_TEMPLATE.search(content_type)) is None:
+        return DEFAULT_ENCODING
+
+    try:
+        return lookup(match.group(1)).name
+    except LookupError:
+        return DEFAULT_ENCODING
+
+
+def decode(response):
+    """
+    Decodes the response body once with the declared charset, unlike response.text which runs charset detection when it is not declared.
+    """
+    return response.content.decode(get_encoding(response.headers.get('content-type')), errors = 'replace')
@@ -4,7 +4,10 @@ from math import floor
 from pathlib import Path
 from datetime import datetime
 
-from requests import get, post as requests_post
+from numpy import unique
+from pandas import Series
+
+from .session import get, post as requests_post
 
 TIMEOUT = 3600
 
@@ -298,3 +301,20 @@ def offset_batch_name(name: str, offset: int = 1):
     first, last = first_and_last
 
     return BATCH_FOLDER_NAME.format(first = int(first) + offset, last = int(last) + offset)
+
+
+def make_grabbed_folder_paths(indices, batch_size: int, path: str = None):
+    """
+    Same as make_grabbed_folder_path applied to each index, but each folder name is made once, since there are much fewer folders than threads.
+    """
+    offsets, inverse = unique(Series(indices).to_numpy() // batch_size, return_inverse = True)
+    paths = Series([make_grabbed_folder_path(offset * batch_size, batch_size, path) for offset in offsets.tolist()]).to_numpy()
+
+    return Series(paths[inverse], index = indices.index if isinstance(indices, Series) else None)
+
+
+def offset_batch_names(names: Series, offset: int = 1):
+    """
+    Same as offset_batch_name applied to each name, each distinct name is handled once.
+    """
+    return names.map({name: offset_batch_name(name, offset) for name in names.unique()})
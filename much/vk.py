@@ -1,4 +1,4 @@
-from requests import post
+from .session import post
 
 
 TIMEOUT = 3600
@@ -21,5 +21,12 @@ setup(
         "License :: OSI Approved :: Apache Software License",
         "Programming Language :: Python :: 3.11"
     ],
-    install_requires = ['click', 'beautifulsoup4', 'pandas', 'requests', 'tqdm', 'requests']
+    install_requires = ['click', 'beautifulsoup4', 'pandas', 'requests', 'tqdm', 'requests'],
+    extras_require = {
+        'fast': ['lxml'],
+        'async': ['aiohttp'],
+        'zstd': ['zstandard'],
+        'parquet': ['pyarrow'],
+        'test': ['pytest']
+    }
 )
@@ -0,0 +1,21 @@
+from dataclasses import replace
+
+from much.benchmark import SuiteReport, match_baseline, find_regressions
+
+
+BASELINE = SuiteReport('Fetcher.fetch', 100, 1000, 1.0, 1000, 'lxml', {'python': '3.11.7', 'lxml': '6.1.3'}, 'host')
+
+
+def test_other_parser_is_not_compared():
+    report = replace(BASELINE, elapsed = 10.0, peak = 10_000, parser = 'html.parser')
+
+    assert match_baseline([report], {BASELINE.name: BASELINE}) == []
+    assert find_regressions([report], {BASELINE.name: BASELINE}) == []
+
+
+def test_throughput_is_compared_on_the_same_machine():
+    report = replace(BASELINE, elapsed = 2.0)
+
+    assert len(find_regressions([report], {BASELINE.name: BASELINE})) == 2
+    assert find_regressions([report], {BASELINE.name: replace(BASELINE, machine = None)}) == []
+    assert len(find_regressions([replace(report, peak = 2000)], {BASELINE.name: replace(BASELINE, machine = None)})) == 1
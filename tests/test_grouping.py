@@ -0,0 +1,60 @@
+import os
+from json import load
+
+import pytest
+
+from much.Fetcher import Fetcher
+from much.Post import PostRecord
+from much.ParserBackend import ParserBackend
+from much.benchmark import make_synthetic_thread
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PAGES = os.path.join(os.path.dirname(__file__), '..', 'assets', 'pages')
+SYNTHETIC_THREAD = 'synthetic-thread-1000'
+OP_REPLY_THREAD = os.path.join(FIXTURES, 'thread-op-reply.json')  # the thread author replies in it, which sets op in the reply
+
+# topics which the recursive grouping made before the reply graph was introduced
+with open(os.path.join(FIXTURES, 'topics.json'), 'r', encoding = 'utf-8') as file:
+    GOLDEN = load(file)
+
+
+def as_json(topics):
+    return [{'title': topic.title, 'comments': list(topic.comments)} for topic in topics]
+
+
+@pytest.mark.parametrize('backend', ParserBackend.available())
+@pytest.mark.parametrize('name', [name for name in GOLDEN if name.endswith('.html')])
+def test_page_topics(name: str, backend: ParserBackend):
+    path = os.path.join(FIXTURES if os.path.isfile(os.path.join(FIXTURES, name)) else PAGES, name)
+
+    assert as_json(Fetcher(backend).fetch(path)) == GOLDEN[name]
+
+
+def test_synthetic_thread_topics():
+    assert as_json(Fetcher().group(make_synthetic_thread(1000, seed = 17, chain_probability = 0.5))) == GOLDEN[SYNTHETIC_THREAD]
+
+
+def test_long_reply_chain():
+    records = make_synthetic_thread(50_000, chain_probability = 1)  # every post replies to the previous one, which exceeded the recursion limit
+
+    assert len(Fetcher().group(records)) == 1
+
+
+def test_min_post_length():
+    topics = Fetcher().group(make_synthetic_thread(1000, seed = 17, chain_probability = 0.5))
+    lengths = [len(comment) for topic in topics for comment in topic.comments]
+
+    assert topics.min_post_length is not None and min(lengths) >= topics.min_post_length
+    assert Fetcher().group([]).min_post_length is None
+
+
+def test_json_op_reply():
+    with open(OP_REPLY_THREAD, 'r', encoding = 'utf-8') as file:
+        posts = load(file)['threads'][0]['posts']
+
+    assert [PostRecord.from_json(post).is_oppost for post in posts] == [True, False, False, False]
+
+    topics = Fetcher().fetch(OP_REPLY_THREAD)
+
+    assert len(topics) == 1 and len(topics[0].comments) == 3
@@ -0,0 +1,25 @@
+from numpy import nan
+from pandas import DataFrame
+
+from much.IndexEntry import IndexEntries
+
+
+def test_other_columns_are_kept():
+    entries = IndexEntries.from_frame(DataFrame({
+        'thread': [1, 2], 'date': ['02-01-2020', '01-01-2020'], 'title': ['a', 'b'], 'folder': ['f', 'f'], 'open': [True, False],
+        'board': ['b', 'vg'], 'size': [10, 20]
+    }))
+    patch = list(IndexEntries.from_frame(DataFrame({
+        'thread': [2, 3], 'date': ['01-01-2020', '03-01-2020'], 'title': ['c', 'd'], 'folder': ['g', 'g'], 'size': [30, nan], 'n_topics': [1, 2]
+    })))
+
+    entries[1] = patch[0]
+    entries.append(patch[1])
+
+    df = entries.to_frame(entries.argsort())
+
+    assert list(df.columns) == ['thread', 'date', 'title', 'folder', 'open', 'board', 'size', 'n_topics']
+    assert df['thread'].tolist() == [2, 1, 3]
+    assert df['board'].fillna('').tolist() == ['', 'b', '']
+    assert df['size'].fillna(-1).tolist() == [30, 10, -1]
+    assert df['n_topics'].fillna(-1).tolist() == [1, -1, 2]
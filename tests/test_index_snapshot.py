@@ -0,0 +1,30 @@
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+
+from much.IndexJournal import IndexJournal
+from much.IndexSnapshot import IndexSnapshot
+from much.IndexStore import read_index
+
+
+def as_objects(df: DataFrame):
+    return df.astype(object).where(df.notna(), None)  # missing values are None in the snapshot and nan in the index
+
+
+def test_snapshot_keeps_values(tmp_path):
+    DataFrame({
+        'thread': [1, 2, 3, 4],
+        'date': ['01-02-2020', '1-2-2020', None, '03-02-2020'],  # a date which is written differently keeps the column as strings
+        'title': ['a', 'b', 'c', 'd'],
+        'folder': ['0000', '0000', '0000', None],
+        'open': [True, None, False, True]
+    }).to_csv(path := str(tmp_path / 'index.tsv'), sep = '\t', index = False)
+
+    IndexJournal(path).append([{'thread': 5, 'date': '04-02-2020', 'title': 'e', 'folder': '0001', 'open': False, 'stars': 3}])
+
+    snapshot = IndexSnapshot.open(path)
+    index = read_index(path)
+
+    assert_frame_equal(as_objects(snapshot.frame()), as_objects(index))
+    assert [snapshot.value('open', i) for i in range(5)] == [True, None, False, True, False]
+    assert snapshot.value('date', 1) == '1-2-2020'
+    assert (tmp_path / 'index.tsv.columns' / '.gitignore').is_file()
@@ -0,0 +1,66 @@
+import os
+from json import load
+
+import pytest
+
+from much.Post import Post, MissingPostIdException, parse_mention, parse_body_id
+from much.ParserBackend import ParserBackend
+from much.benchmark import find_posts
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+PAGES = os.path.join(os.path.dirname(__file__), '..', 'assets', 'pages')
+
+# mention ids which were parsed from the text of each link before data-num attributes were used
+with open(os.path.join(FIXTURES, 'mentions.json'), 'r', encoding = 'utf-8') as file:
+    GOLDEN = load(file)
+
+
+def read_page(name: str, backend: ParserBackend):
+    with open(os.path.join(FIXTURES if os.path.isfile(os.path.join(FIXTURES, name)) else PAGES, name), 'r', encoding = 'utf-8') as file:
+        return backend.parse(file.read())
+
+
+@pytest.mark.parametrize('backend', ParserBackend.available())
+@pytest.mark.parametrize('name', list(GOLDEN))
+def test_post_mentions(name: str, backend: ParserBackend):
+    items = []
+
+    for html in find_posts(read_page(name, backend)):
+        mentions, post = Post.from_html(html)
+        items.append({'post': None if post is None else post.id, 'mentions': None if mentions is None else sorted(mentions)})
+
+    assert items == GOLDEN[name]
+
+
+@pytest.mark.parametrize('backend', ParserBackend.available())
+@pytest.mark.parametrize(
+    'link, mention', [
+        ('<a class="post-reply-link" data-num="1000">&gt;&gt;1000</a>', 1000),
+        ('<a class="post-reply-link" data-num="1000">&gt;&gt;1000 (OP)</a>', 1000),
+        ('<a class="post-reply-link" data-num="5">&gt;&gt;5 →</a>', None),
+        ('<a href="#1001">&gt;&gt;1001</a>', 1001),
+        ('<a class="post-reply-link" data-num="1002">&gt;&gt;1003</a>', 1003),
+        ('<a class="post-reply-link" data-num="1001"><span>&gt;&gt;</span>1001</a>', 1001),
+        ('<a class="post-reply-link" data-num="١٠٠١">&gt;&gt;١٠٠١</a>', None),
+        ('<a href="https://example.com">https://example.com</a>', None)
+    ]
+)
+def test_parse_mention(link: str, mention: int, backend: ParserBackend):
+    assert parse_mention(backend.parse(f'<html><body>{link}</body></html>').find('a')) == mention
+
+
+@pytest.mark.parametrize(
+    'body, post', [
+        ({'id': 'm1000', 'class': 'post__message'}, 1000),
+        ({'id': 'post-m1001', 'class': 'post__message'}, 1001),
+        ({'class': 'post__message'}, None)
+    ]
+)
+def test_body_attributes_id(body: dict, post: int):
+    assert parse_body_id(body) == post
+
+
+def test_body_attributes_without_id():
+    with pytest.raises(MissingPostIdException):
+        parse_body_id({'id': 'message', 'class': 'm1002'})  # attributes other than id are not searched
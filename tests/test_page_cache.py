@@ -0,0 +1,35 @@
+import os
+from multiprocessing import Pool
+
+from much.PageCache import PageCache
+
+
+def _page(i: int):
+    return os.urandom(4096).hex() + str(i)  # random pages are not compressed well, so each of them takes about the same space
+
+
+def _put(cache: PageCache, i: int):
+    cache.put(f'https://example.com/{i}.html', _page(i))
+
+
+def test_refs_are_evicted_with_pages(tmp_path):
+    cache = PageCache(str(tmp_path), max_size = 5 * 8192)
+
+    for i in range(20):
+        _put(cache, i)
+
+    urls = set(cache.urls())
+
+    assert 0 < len(urls) < 20
+    assert all(cache.get(url) is not None for url in urls)
+    assert cache.size == sum(stat.st_size for _, stat in cache._objects()) <= cache.max_size
+
+
+def test_size_is_shared_by_workers(tmp_path):
+    cache = PageCache(str(tmp_path), max_size = 5 * 8192)
+
+    with Pool(processes = 4) as pool:
+        pool.starmap(_put, [(cache, i) for i in range(40)])
+
+    assert cache.size == sum(stat.st_size for _, stat in cache._objects()) <= cache.max_size
+    assert len(set(cache.urls())) == len(list(cache._objects()))
@@ -0,0 +1,25 @@
+import pytest
+
+from much.ThreadStore import FolderThreadStore, PackThreadStore, copy_threads
+
+
+def test_pack_refuses_threads_from_several_folders(tmp_path):
+    threads = FolderThreadStore(str(tmp_path / 'threads'))
+    threads.write(1, '0000', 'first\n')
+    threads.write(1, '0001', 'second\n')
+
+    with PackThreadStore(str(tmp_path / 'pack')) as pack:
+        with pytest.raises(ValueError):
+            copy_threads(threads, pack)
+
+        assert len(pack) == 0  # nothing is copied
+
+    threads.remove(1, '0001')
+
+    with PackThreadStore(str(tmp_path / 'pack')) as pack:
+        assert copy_threads(threads, pack) == 1
+
+        with pytest.raises(ValueError):
+            pack.write(1, '0001', 'second\n')
+
+        assert pack.read(1) == 'first\n'